@@ -0,0 +1,619 @@
+"""
+Programmatic client API: sessions that return results instead of printing them.
+
+    with Session("127.0.0.1", 2121) as s:
+        for entry in s.ls("*.csv", sort="size"):
+            print(entry.name, entry.size)
+        s.get("report.csv", "report.csv")          # path or writable binary file object
+        s.put("upload.bin", io.BytesIO(payload))    # path or readable binary file object
+
+Failures the server answers (550, 501 ...) raise FTPError and leave the session usable; a
+session whose control connection died or fell out of step is marked `broken`.
+
+SessionPool keeps warm control sessions to one server for threads that run many small
+operations, so each call skips the TCP handshake and the 220 banner. AsyncSession and
+AsyncSessionPool do the same on an asyncio loop (raw sockets with sock_recv_into, as in
+server/async_server.py), to fan out thousands of operations from one process:
+
+    async with AsyncSessionPool("127.0.0.1", 2121, size=64) as pool:
+        await asyncio.gather(*(pool.get(name, f"out/{name}") for name in names))
+
+Local file reads and writes stay synchronous in the async variant (they go to the page cache);
+every network wait in it is bounded by TIMEOUT, like the socket timeouts of Session.
+"""
+
+import asyncio
+import collections
+import contextlib
+import lzma
+import os
+import socket
+import sys
+import threading
+import time
+import zlib
+
+try:
+    from client.config import HOST, CONTROL_PORT, BUFFER_SIZE, SOCKET_RCVBUF, SOCKET_SNDBUF, TIMEOUT
+    from client.connection_handler import ControlConn
+    from client.ftp_client import open_transfer
+    from shared import buffers, compression, integrity, protocol
+    from shared.line_reader import MAX_LINE
+except ModuleNotFoundError:
+    from config import HOST, CONTROL_PORT, BUFFER_SIZE, SOCKET_RCVBUF, SOCKET_SNDBUF, TIMEOUT
+    from connection_handler import ControlConn
+    from ftp_client import open_transfer
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from shared import buffers, compression, integrity, protocol
+    from shared.line_reader import MAX_LINE
+
+Entry = collections.namedtuple("Entry", "name size mtime")  # one LS row
+Transfer = collections.namedtuple("Transfer", "name size seconds digest")  # digest: from the 226 line, or None
+
+class FTPError(Exception):
+    """The server refused or failed a command; reply is its response line."""
+
+    def __init__(self, reply):
+        super().__init__(reply)
+        self.reply = reply
+        self.code = int(reply[:3]) if reply[:3].isdigit() else None
+
+class IntegrityError(FTPError):
+    """The digest on the 226 line doesn't match the bytes sent or received."""
+
+def ls_command(pattern=None, sort=None, desc=False, limit=None, page=None):
+    words = ["LS"]
+    if pattern:
+        words.append(pattern)
+    if sort:
+        words += ["SORT", sort] + (["DESC"] if desc else [])
+    if limit:
+        words += ["LIMIT", str(limit)] + (["PAGE", str(page)] if page else [])
+    return " ".join(words)
+
+def parse_listing(payload):
+    # 한 줄이 "<이름> <크기> <mtime>"이라 이름에 공백이 있어도 뒤에서 두 번 자릅니다.
+    rows = (line.rsplit(" ", 2) for line in payload.decode("utf-8", errors="replace").splitlines() if line)
+    return [Entry(name, int(size), int(mtime)) for name, size, mtime in rows]
+
+def reply_port(reply):
+    parts = reply.split()
+    return int(parts[parts.index("PORT") + 1]) if "PORT" in parts else None
+
+def reply_size(reply):
+    parts = reply.split()
+    return int(parts[parts.index("SIZE") + 1])
+
+def reply_codec(reply):
+    parts = reply.split()
+    return parts[parts.index("COMPRESS") + 1] if "COMPRESS" in parts else None
+
+def check_done(last, hasher):
+    """Digest reported on a 226 line after checking it against hasher; raises FTPError/IntegrityError."""
+    if not last.startswith(protocol.DONE):
+        raise FTPError(last)
+    reported = integrity.reply_digest(last)
+    if reported is None:
+        return None
+    if hasher is not None and reported[1] != hasher.hexdigest():
+        raise IntegrityError(last)
+    return reported[1]
+
+def open_source(src, size):
+    """(file object, bytes to send, whether we opened it) for a path or readable file object."""
+    if not hasattr(src, "read"):
+        f = open(src, "rb")
+        return f, os.fstat(f.fileno()).st_size if size is None else size, True
+    if size is None:
+        try:
+            size = os.fstat(src.fileno()).st_size - src.tell()
+        except (AttributeError, OSError, ValueError):
+            if not src.seekable():
+                raise ValueError("size is required for a file object that can't seek")
+            here = src.tell()
+            size = src.seek(0, os.SEEK_END) - here
+            src.seek(here)
+    return src, size, False
+
+def open_dest(dest):
+    if hasattr(dest, "write"):
+        return dest, False
+    return open(dest, "wb"), True
+
+def read_into(f, view):
+    if hasattr(f, "readinto"):
+        return f.readinto(view) or 0
+    data = f.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+def timed(aw):
+    """aw bounded by TIMEOUT, like the socket timeouts of the blocking Session (raises asyncio.TimeoutError)."""
+    return asyncio.wait_for(aw, TIMEOUT)
+
+class Session:
+    """One control session; use it from one thread at a time."""
+
+    def __init__(self, host=HOST, port=CONTROL_PORT, digest=None):
+        self.host = host
+        self.ctrl = ControlConn(host, port).__enter__()
+        self.broken = False
+        self.last_used = time.monotonic()
+        if digest:
+            reply = self.ctrl.enable_digest(digest)
+            if not reply.startswith(protocol.OK):
+                self.close()
+                raise FTPError(reply)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if not self.broken:
+            with contextlib.suppress(OSError):
+                self.ctrl.send_line("EXIT")
+        self.broken = True
+        self.ctrl.__exit__(None, None, None)
+
+    def noop(self):
+        with self._exchange():
+            return self._command("NOOP")
+
+    def ls(self, pattern=None, sort=None, desc=False, limit=None, page=None):
+        """Directory listing as a list of Entry(name, size, mtime)."""
+        with self._exchange():
+            first = self._command(ls_command(pattern, sort, desc, limit, page))
+            payload = bytearray()
+            with self._data(first) as ds:
+                while (chunk := ds.recv(BUFFER_SIZE)):
+                    payload += chunk
+            check_done(self._reply(), None)
+        return parse_listing(payload)
+
+    def get(self, name, dest):
+        """Download name into dest (a path or a writable binary file object); returns a Transfer."""
+        t0 = time.perf_counter()
+        with self._exchange():
+            first = self._command(f"GET {name}")
+            size, codec = reply_size(first), reply_codec(first)
+            # Only now that the server has the file: a 550 must not truncate an existing dest.
+            out, owned = open_dest(dest)
+            try:
+                hasher = integrity.new(self.ctrl.digest) if self.ctrl.digest else None
+                got = 0
+                with self._data(first) as ds:
+                    if codec:
+                        for piece in compression.iter_decompressed(ds, codec, size):
+                            out.write(piece)
+                            if hasher:
+                                hasher.update(piece)
+                            got += len(piece)
+                    else:
+                        view = memoryview(bytearray(max(1, min(BUFFER_SIZE, size))))
+                        chunk = buffers.AdaptiveChunk(len(view))
+                        while got < size and (k := ds.recv_into(view[:min(chunk.size, size - got)])):
+                            out.write(view[:k])
+                            if hasher:
+                                hasher.update(view[:k])
+                            got += k
+                            chunk.record(k)
+                digest = check_done(self._reply(), hasher)
+                if got != size:
+                    raise FTPError(f"{protocol.ABORTED} Received {got} of {size} bytes")
+            finally:
+                if owned:
+                    out.close()
+        return Transfer(name, got, time.perf_counter() - t0, digest)
+
+    def put(self, name, src, size=None):
+        """
+        Upload src (a path or a readable binary file object, read from its current position)
+        as name; size is needed only for file objects that can't fstat or seek. Returns a Transfer.
+        """
+        t0 = time.perf_counter()
+        f, size, owned = open_source(src, size)
+        try:
+            with self._exchange():
+                first = self._command(f"PUT {name} SIZE {size}")
+                hasher = integrity.new(self.ctrl.digest) if self.ctrl.digest else None
+                sent = 0
+                with self._data(first) as ds:
+                    view = memoryview(bytearray(max(1, min(BUFFER_SIZE, size))))
+                    chunk = buffers.AdaptiveChunk(len(view))
+                    while sent < size and (k := read_into(f, view[:min(chunk.size, size - sent)])):
+                        if hasher:
+                            hasher.update(view[:k])
+                        ds.sendall(view[:k])
+                        sent += k
+                        chunk.record(k)
+                digest = check_done(self._reply(), hasher)
+        finally:
+            if owned:
+                f.close()
+        return Transfer(name, sent, time.perf_counter() - t0, digest)
+
+    @contextlib.contextmanager
+    def _exchange(self):
+        # 서버 응답을 다 읽은 뒤의 FTPError는 세션이 그대로 쓸 만합니다. 그 밖의 예외는 중간에 끊긴 것이라 버립니다.
+        try:
+            yield
+        except FTPError:
+            raise
+        except BaseException:
+            self.broken = True
+            raise
+        finally:
+            self.last_used = time.monotonic()
+
+    def _command(self, line):
+        self.ctrl.send_line(line)
+        reply = self._reply()
+        if not reply.startswith(protocol.OK):
+            raise FTPError(reply)
+        return reply
+
+    def _reply(self):
+        reply = self.ctrl.recv_line()
+        if not reply:
+            raise ConnectionError("control connection closed")
+        return reply
+
+    @contextlib.contextmanager
+    def _data(self, first):
+        try:
+            ds = open_transfer(self.ctrl, self.host, first)
+            try:
+                yield ds
+            finally:
+                ds.close()
+        except (OSError, zlib.error, lzma.LZMAError) as e:
+            # 데이터 연결이 끊겨도 서버는 426/550 한 줄을 보내 줍니다. 그걸 읽어야 다음 명령과 짝이 맞습니다.
+            self.ctrl.close_data()
+            raise FTPError(self._reply()) from e
+
+class SessionPool:
+    """
+    Up to `size` warm sessions to one server, shared by threads. session() checks one out
+    (opening a new one only when none is idle) and takes it back afterwards unless it broke.
+    An idle session is checked with NOOP before reuse once it sat for `check_after` seconds.
+    """
+
+    def __init__(self, host=HOST, port=CONTROL_PORT, size=8, digest=None, check_after=30.0):
+        self.host = host
+        self.port = port
+        self.digest = digest
+        self.check_after = check_after
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []  # most recently used last, so the warmest session goes out first
+        self._closed = False
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def warm(self, n):
+        """Open sessions until n are idle, ahead of a burst."""
+        while True:
+            with self._lock:
+                if len(self._idle) >= n:
+                    return
+            s = self._open()
+            with self._lock:
+                self._idle.append(s)
+
+    @contextlib.contextmanager
+    def session(self):
+        with self._slots:
+            s = self._checkout()
+            try:
+                yield s
+            finally:
+                self._checkin(s)
+
+    def ls(self, *args, **kwargs):
+        with self.session() as s:
+            return s.ls(*args, **kwargs)
+
+    def get(self, name, dest):
+        with self.session() as s:
+            return s.get(name, dest)
+
+    def put(self, name, src, size=None):
+        with self.session() as s:
+            return s.put(name, src, size)
+
+    def stats(self):
+        with self._lock:
+            return {"idle": len(self._idle), "created": self.created, "reused": self.reused,
+                    "discarded": self.discarded}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for s in idle:
+            s.close()
+
+    def _open(self):
+        s = Session(self.host, self.port, self.digest)
+        with self._lock:
+            self.created += 1
+        return s
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("session pool is closed")
+                s = self._idle.pop() if self._idle else None
+            if s is None:
+                return self._open()
+            if time.monotonic() - s.last_used > self.check_after:
+                try:
+                    s.noop()
+                except (FTPError, OSError):
+                    self._discard(s)
+                    continue
+            with self._lock:
+                self.reused += 1
+            return s
+
+    def _checkin(self, s):
+        with self._lock:
+            keep = not s.broken and not self._closed
+            if keep:
+                self._idle.append(s)
+        if not keep:
+            self._discard(s)
+
+    def _discard(self, s):
+        s.close()
+        with self._lock:
+            self.discarded += 1
+
+class AsyncSession:
+    """Session on an asyncio loop (MODE S only); use it from one task at a time."""
+
+    def __init__(self, host=HOST, port=CONTROL_PORT, digest=None):
+        self.host = host
+        self.port = port
+        self.digest = None
+        self._want_digest = digest
+        self.reader = self.writer = None
+        self.broken = False
+        self.last_used = time.monotonic()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def connect(self):
+        self.reader, self.writer = await timed(asyncio.open_connection(self.host, self.port, limit=MAX_LINE))
+        banner = await self._reply()
+        if banner.startswith("421"):
+            self.broken = True
+            self.writer.close()
+            raise ConnectionRefusedError(banner)
+        if self._want_digest:
+            try:
+                await self._command(f"DIGEST {self._want_digest}")
+            except BaseException:
+                await self.close()
+                raise
+            self.digest = self._want_digest.lower()
+        return self
+
+    async def close(self):
+        if self.writer is None:
+            return
+        if not self.broken:
+            with contextlib.suppress(OSError):
+                self.writer.write(b"EXIT\n")
+                await self.writer.drain()
+        self.broken = True
+        self.writer.close()
+        with contextlib.suppress(OSError):
+            await self.writer.wait_closed()
+
+    async def noop(self):
+        with self._exchange():
+            return await self._command("NOOP")
+
+    async def ls(self, pattern=None, sort=None, desc=False, limit=None, page=None):
+        with self._exchange():
+            first = await self._command(ls_command(pattern, sort, desc, limit, page))
+            loop = asyncio.get_running_loop()
+            payload = bytearray()
+            async with self._data(first) as ds:
+                while (chunk := await timed(loop.sock_recv(ds, BUFFER_SIZE))):
+                    payload += chunk
+            check_done(await self._reply(), None)
+        return parse_listing(payload)
+
+    async def get(self, name, dest):
+        t0 = time.perf_counter()
+        with self._exchange():
+            first = await self._command(f"GET {name}")
+            if reply_codec(first):
+                raise FTPError(f"{first} (MODE Z is not supported by AsyncSession)")
+            size = reply_size(first)
+            out, owned = open_dest(dest)
+            try:
+                hasher = integrity.new(self.digest) if self.digest else None
+                loop = asyncio.get_running_loop()
+                got = 0
+                async with self._data(first) as ds:
+                    view = memoryview(bytearray(max(1, min(BUFFER_SIZE, size))))
+                    chunk = buffers.AdaptiveChunk(len(view))
+                    while got < size and (k := await timed(loop.sock_recv_into(ds, view[:min(chunk.size, size - got)]))):
+                        out.write(view[:k])
+                        if hasher:
+                            hasher.update(view[:k])
+                        got += k
+                        chunk.record(k)
+                digest = check_done(await self._reply(), hasher)
+                if got != size:
+                    raise FTPError(f"{protocol.ABORTED} Received {got} of {size} bytes")
+            finally:
+                if owned:
+                    out.close()
+        return Transfer(name, got, time.perf_counter() - t0, digest)
+
+    async def put(self, name, src, size=None):
+        t0 = time.perf_counter()
+        f, size, owned = open_source(src, size)
+        try:
+            with self._exchange():
+                first = await self._command(f"PUT {name} SIZE {size}")
+                hasher = integrity.new(self.digest) if self.digest else None
+                loop = asyncio.get_running_loop()
+                sent = 0
+                async with self._data(first) as ds:
+                    view = memoryview(bytearray(max(1, min(BUFFER_SIZE, size))))
+                    chunk = buffers.AdaptiveChunk(len(view))
+                    while sent < size and (k := read_into(f, view[:min(chunk.size, size - sent)])):
+                        if hasher:
+                            hasher.update(view[:k])
+                        await timed(loop.sock_sendall(ds, view[:k]))
+                        sent += k
+                        chunk.record(k)
+                digest = check_done(await self._reply(), hasher)
+        finally:
+            if owned:
+                f.close()
+        return Transfer(name, sent, time.perf_counter() - t0, digest)
+
+    @contextlib.contextmanager
+    def _exchange(self):
+        try:
+            yield
+        except FTPError:
+            raise
+        except BaseException:
+            self.broken = True
+            raise
+        finally:
+            self.last_used = time.monotonic()
+
+    async def _command(self, line):
+        self.writer.write(line.encode("utf-8") + b"\n")
+        await timed(self.writer.drain())
+        reply = await self._reply()
+        if not reply.startswith(protocol.OK):
+            raise FTPError(reply)
+        return reply
+
+    async def _reply(self):
+        line = await timed(self.reader.readline())
+        if not line:
+            raise ConnectionError("control connection closed")
+        return line.decode("utf-8").strip()
+
+    @contextlib.asynccontextmanager
+    async def _data(self, first):
+        port = reply_port(first)
+        if port is None:
+            raise FTPError(f"{first} (MODE B is not supported by AsyncSession)")
+        loop = asyncio.get_running_loop()
+        ds = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        ds.setblocking(False)
+        buffers.set_socket_buffers(ds, SOCKET_SNDBUF, SOCKET_RCVBUF)
+        try:
+            try:
+                await timed(loop.sock_connect(ds, (self.host, port)))
+                yield ds
+            finally:
+                ds.close()
+        except (OSError, asyncio.TimeoutError) as e:
+            raise FTPError(await self._reply()) from e
+
+class AsyncSessionPool:
+    """SessionPool for asyncio: at most `size` sessions, reused across tasks."""
+
+    def __init__(self, host=HOST, port=CONTROL_PORT, size=64, digest=None, check_after=30.0):
+        self.host = host
+        self.port = port
+        self.digest = digest
+        self.check_after = check_after
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []
+        self._closed = False
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        async with self._slots:
+            s = await self._checkout()
+            try:
+                yield s
+            finally:
+                await self._checkin(s)
+
+    async def ls(self, *args, **kwargs):
+        async with self.session() as s:
+            return await s.ls(*args, **kwargs)
+
+    async def get(self, name, dest):
+        async with self.session() as s:
+            return await s.get(name, dest)
+
+    async def put(self, name, src, size=None):
+        async with self.session() as s:
+            return await s.put(name, src, size)
+
+    def stats(self):
+        return {"idle": len(self._idle), "created": self.created, "reused": self.reused,
+                "discarded": self.discarded}
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for s in idle:
+            await s.close()
+
+    async def _checkout(self):
+        while True:
+            if self._closed:
+                raise RuntimeError("session pool is closed")
+            if not self._idle:
+                s = await AsyncSession(self.host, self.port, self.digest).connect()
+                self.created += 1
+                return s
+            s = self._idle.pop()
+            if time.monotonic() - s.last_used > self.check_after:
+                try:
+                    await s.noop()
+                except (FTPError, OSError):
+                    await self._discard(s)
+                    continue
+            self.reused += 1
+            return s
+
+    async def _checkin(self, s):
+        if s.broken or self._closed:
+            await self._discard(s)
+        else:
+            self._idle.append(s)
+
+    async def _discard(self, s):
+        await s.close()
+        self.discarded += 1
@@ -1,3 +1,4 @@
+import glob
 import os
 
 def parse_command(line):
@@ -8,20 +9,76 @@ def parse_command(line):
     cmd = parts[0].upper()
 
     if cmd == "LS":
-        return "LS", {}, None
+        # Options (glob, SORT, DESC, LIMIT, PAGE) are passed through for the server to validate.
+        return "LS", {"options": " ".join(parts[1:])}, None
 
     if cmd == "GET":
         if len(parts) < 2:
-            return None, None, "Usage: GET <filename>"
-        return "GET", {"filename": parts[1]}, None
+            return None, None, "Usage: GET <filename> [STREAMS <n>]"
+        streams = 1
+        if len(parts) >= 4 and parts[2].upper() == "STREAMS":
+            if not parts[3].isdigit() or int(parts[3]) < 1:
+                return None, None, "Usage: GET <filename> [STREAMS <n>]"
+            streams = int(parts[3])
+        return "GET", {"filename": parts[1], "streams": streams}, None
 
     if cmd == "PUT":
         if len(parts) < 2:
-            return None, None, "Usage: PUT <filename>"
+            return None, None, "Usage: PUT <filename> [STREAMS <n>]"
         fn = parts[1]
         if not os.path.isfile(fn):
             return None, None, f"File not found: {fn}"
-        return "PUT", {"filename": fn}, None
+        streams = 1
+        if len(parts) >= 4 and parts[2].upper() == "STREAMS":
+            if not parts[3].isdigit() or int(parts[3]) < 1:
+                return None, None, "Usage: PUT <filename> [STREAMS <n>]"
+            streams = int(parts[3])
+        return "PUT", {"filename": fn, "streams": streams}, None
+
+    if cmd == "SYNC":
+        if len(parts) < 2:
+            return None, None, "Usage: SYNC <filename>"
+        fn = parts[1]
+        if not os.path.isfile(fn):
+            return None, None, f"File not found: {fn}"
+        return "SYNC", {"filename": fn}, None
+
+    if cmd == "MGET":
+        if len(parts) < 2:
+            return None, None, "Usage: MGET <name|glob> ..."
+        # Globs are expanded by the server against its own file list.
+        return "MGET", {"patterns": parts[1:]}, None
+
+    if cmd == "MPUT":
+        if len(parts) < 2:
+            return None, None, "Usage: MPUT <file|glob> ..."
+        files = []
+        for pat in parts[1:]:
+            matches = sorted(glob.glob(pat)) if glob.has_magic(pat) else [pat]
+            files.extend(m for m in matches if os.path.isfile(m) and m not in files)
+        if not files:
+            return None, None, f"No files matched: {' '.join(parts[1:])}"
+        return "MPUT", {"filenames": files}, None
+
+    if cmd == "MODE":
+        if len(parts) < 2 or parts[1].upper() not in ("S", "B", "Z"):
+            return None, None, "Usage: MODE S|B | MODE Z [zlib|lzma|NONE] [level]"
+        if parts[1].upper() == "Z":
+            algo = parts[2].lower() if len(parts) >= 3 else "zlib"
+            level = parts[3] if len(parts) >= 4 else "6"
+            if algo not in ("zlib", "lzma", "none") or not level.isdigit() or int(level) > 9:
+                return None, None, "Usage: MODE Z [zlib|lzma|NONE] [level 0-9]"
+            return "MODE", {"mode": "Z", "algo": algo, "level": int(level)}, None
+        return "MODE", {"mode": parts[1].upper()}, None
+
+    if cmd == "DIGEST":
+        algos = ("sha256", "md5", "crc32", "adler32", "none")
+        if len(parts) < 2 or parts[1].lower() not in algos:
+            return None, None, "Usage: DIGEST sha256|md5|crc32|adler32|NONE"
+        return "DIGEST", {"algo": parts[1].lower()}, None
+
+    if cmd == "STAT":
+        return "STAT", {}, None
 
     if cmd == "EXIT":
         return "EXIT", {}, None
@@ -1,4 +1,10 @@
+import os
+
 HOST = "localhost"     # 서버 호스트
 CONTROL_PORT = 2121    # 로컬 테스트용 권장 포트(21은 관리자 권한 필요)
-BUFFER_SIZE = 4096
+BUFFER_SIZE = int(os.environ.get("FTP_BUFFER_SIZE", 256 * 1024))  # GET/PUT 복사 루프 버퍼 최대 크기 (한 번에 옮기는 양은 AdaptiveChunk가 4 KiB부터 키움)
+CONTROL_BUFFER = 4096  # 제어 연결 응답 한 번에 읽는 크기
+SOCKET_SNDBUF = int(os.environ.get("FTP_SNDBUF", 0))  # 데이터 소켓 SO_SNDBUF, 0이면 커널 자동 조정
+SOCKET_RCVBUF = int(os.environ.get("FTP_RCVBUF", 0))  # 데이터 소켓 SO_RCVBUF, 0이면 커널 자동 조정
 TIMEOUT = 5.0
+RESUME_ATTEMPTS = 3   # GET/PUT 실패 시 REST로 이어받기 재시도 횟수
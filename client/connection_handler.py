@@ -1,26 +1,132 @@
+import os
 import socket
+import sys
 
 try:
-    from client.config import BUFFER_SIZE, TIMEOUT
+    from client.config import CONTROL_BUFFER, SOCKET_RCVBUF, SOCKET_SNDBUF, TIMEOUT
+    from shared.block_channel import BlockChannel
+    from shared.buffers import set_socket_buffers
+    from shared.line_reader import LineReader
 except ModuleNotFoundError:
-    from config import BUFFER_SIZE, TIMEOUT
+    from config import CONTROL_BUFFER, SOCKET_RCVBUF, SOCKET_SNDBUF, TIMEOUT
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from shared.block_channel import BlockChannel
+    from shared.buffers import set_socket_buffers
+    from shared.line_reader import LineReader
 
 class ControlConn:
     def __init__(self, host, port):
         self.addr = (host, port)
+        self.data = None  # MODE B에서 세션 내내 유지하는 데이터 소켓
+        self.compress = None  # MODE Z로 합의한 (알고리즘, 레벨), 꺼져 있으면 None
+        self.cas = None  # 서버가 CHECK/LINK(FTP_STORAGE=cas)를 지원하는지, 아직 모르면 None
+        self.digest = None  # DIGEST로 켠 무결성 검사 알고리즘, 꺼져 있으면 None
+        self._new_socket()
+
+    def _new_socket(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.settimeout(TIMEOUT)
+        # 응답 두 줄이 한 번에 올 수 있으니 (예: MODE B의 200과 226) 남는 바이트는 리더가 다음 호출용으로 보관합니다.
+        self.lines = LineReader(self.sock, recv_size=CONTROL_BUFFER)
 
     def __enter__(self):
         self.sock.connect(self.addr)
         # Read and discard the welcome banner (220 Welcome message)
         # This synchronizes the protocol - server sends welcome immediately on connect
         welcome_banner = self.recv_line()
+        if welcome_banner.startswith("421"):
+            # Server is at its session limit and has already closed the connection.
+            self.sock.close()
+            raise ConnectionRefusedError(welcome_banner)
         # Optional: uncomment to display welcome message
         # print(f"[SERVER] {welcome_banner}")
         return self
 
+    def reconnect(self):
+        """Drop the current control socket and open a fresh session to the same server."""
+        self.close_data()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self._new_socket()
+        self.__enter__()
+        # 새 세션은 MODE Z/DIGEST를 모르니 다시 알려 줍니다 (MODE B는 필요할 때 다시 켭니다).
+        if self.compress:
+            self.enable_compression(*self.compress)
+        if self.digest:
+            self.enable_digest(self.digest)
+        return self
+
+    def enable_block_mode(self, host):
+        """
+        MODE B: open one data connection that every later LS/GET/PUT/MGET/MPUT reuses.
+        Returns True if the server accepted.
+        """
+        if self.data is not None:
+            return True
+        self.send_line("MODE B")
+        reply = self.recv_line()
+        parts = reply.split()
+        if not reply.startswith("200") or "PORT" not in parts:
+            return False
+        self.data = open_data_conn(host, int(parts[parts.index("PORT") + 1]))
+        self.data.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return True
+
+    def enable_compression(self, algo="zlib", level=6):
+        """
+        MODE Z: compress GET/PUT data with algo ("zlib"/"lzma") at level, or turn it off with algo "none".
+        The server still sends files that don't compress well raw. Returns the server's reply.
+        """
+        self.send_line(f"MODE Z {algo} {level}")
+        reply = self.recv_line()
+        if reply.startswith("200"):
+            self.compress = None if algo.lower() == "none" else (algo.lower(), level)
+        return reply
+
+    def enable_digest(self, algo="sha256"):
+        """
+        DIGEST: have the server report a whole-file digest (sha256/md5/crc32/adler32) on every
+        GET/PUT 226 line, which the client checks against its own; algo "none" turns it off.
+        Returns the server's reply.
+        """
+        self.send_line(f"DIGEST {algo}")
+        reply = self.recv_line()
+        if reply.startswith("200"):
+            self.digest = None if algo.lower() == "none" else algo.lower()
+        return reply
+
+    def disable_block_mode(self):
+        """MODE S: close the persistent data connection; each transfer opens its own again."""
+        self.send_line("MODE S")
+        reply = self.recv_line()
+        self.close_data()
+        return reply
+
+    def block_channel(self, reply):
+        """
+        Data channel for the transfer announced by a 200 reply when it runs in MODE B, else None.
+        A reply that carries PORT means the server is in MODE S (it drops a MODE B channel after a
+        failed transfer), so the stale persistent socket is closed here too.
+        """
+        if "PORT" in reply.split():
+            self.close_data()
+            return None
+        if self.data is None:
+            return None
+        return BlockChannel(self.data)
+
+    def close_data(self):
+        if self.data is not None:
+            try:
+                self.data.close()
+            except OSError:
+                pass
+            self.data = None
+
     def __exit__(self, a, b, c):
+        self.close_data()
         try:
             self.sock.close()
         except:
@@ -31,19 +137,22 @@ class ControlConn:
             text += "\n"
         self.sock.sendall(text.encode("utf-8"))
 
+    def send_lines(self, lines):
+        """
+        Pipeline several commands in one write; read their replies with recv_line() in order.
+        Only for commands that don't open a data connection (REST, SIZE, MODE, DIGEST, NOOP ...).
+        """
+        self.sock.sendall("".join(line + "\n" for line in lines).encode("utf-8"))
+
     def recv_line(self):
-        data = b""
-        # 서버가 줄바꿈으로 한 줄씩 주는 걸 가정합니다.
-        while not data.endswith(b"\n"):
-            chunk = self.sock.recv(BUFFER_SIZE)
-            if not chunk:
-                break
-            data += chunk
-        return data.decode("utf-8").strip()
+        # 서버가 줄바꿈으로 한 줄씩 주는 걸 가정합니다. 연결이 끊기면 빈 문자열을 돌려줍니다.
+        line = self.lines.readline()
+        return "" if line is None else line.decode("utf-8").strip()
 
 def open_data_conn(host, port):
     # 파일 주고받는 데이터 소켓 여는 함수
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.settimeout(TIMEOUT)
+    set_socket_buffers(s, SOCKET_SNDBUF, SOCKET_RCVBUF)  # connect 전에 정해야 TCP 윈도 스케일에 반영됩니다
     s.connect((host, port))
     return s
\ No newline at end of file
@@ -1,60 +1,226 @@
+import lzma
+import mmap
 import os
 import sys
+import threading
+import zlib
 
 try:
-    from client.config import HOST, CONTROL_PORT, BUFFER_SIZE
+    from client.config import HOST, CONTROL_PORT, BUFFER_SIZE, RESUME_ATTEMPTS
     from client.command_parser import parse_command
     from client.connection_handler import ControlConn, open_data_conn
-    from shared import protocol
+    from shared import buffers, compression, delta, integrity, protocol
 except ModuleNotFoundError:
-    from config import HOST, CONTROL_PORT, BUFFER_SIZE
+    from config import HOST, CONTROL_PORT, BUFFER_SIZE, RESUME_ATTEMPTS
     from command_parser import parse_command
     from connection_handler import ControlConn, open_data_conn
     import sys
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from shared import protocol
+    from shared import buffers, compression, delta, integrity, protocol
 
-def do_ls(ctrl, server_host):
+COMPRESS_CHUNK = 256 * 1024  # MODE Z에서 압축기에 한 번에 넣는 원본 바이트
+
+def open_transfer(ctrl, server_host, reply):
+    # MODE B면 유지 중인 데이터 채널을, 아니면 응답의 PORT로 새 데이터 연결을 씁니다.
+    ch = ctrl.block_channel(reply)
+    if ch is not None:
+        return ch
+    parts = reply.split()
+    if "PORT" not in parts:
+        raise ConnectionError("server expects MODE B but no data channel is open")
+    return open_data_conn(server_host, int(parts[parts.index("PORT") + 1]))
+
+def do_ls(ctrl, server_host, options=""):
     # 기대 응답: "200 OK PORT <p>" → 데이터 소켓으로 목록 → "226 ..."
-    ctrl.send_line("LS")
+    ctrl.send_line(f"LS {options}".strip())
     first = ctrl.recv_line()
     if not first.startswith(protocol.OK):
         print("[ERR]", first)
         return
 
-    # 포트 꺼내기 (형식: 200 OK PORT 20001)
-    try:
-        parts = first.split()
-        p = int(parts[parts.index("PORT") + 1])
-    except Exception:
-        print("[ERR] Bad LS response:", first)
-        return
-
     try:
-        ds = open_data_conn(server_host, p)
-        buf = b""
+        # 데이터 연결 열기 (형식: 200 OK PORT 20001, MODE B면 PORT 없이 200 OK)
+        ds = open_transfer(ctrl, server_host, first)
+        # Print complete rows as they arrive; only a partial last row is carried over,
+        # so memory stays constant no matter how long the listing is.
+        pending = b""
+        rows = 0
         while True:
             chunk = ds.recv(BUFFER_SIZE)
             if not chunk:
                 break
-            buf += chunk
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            if lines:
+                sys.stdout.write(b"\n".join(lines).decode("utf-8", errors="replace") + "\n")
+                rows += len(lines)
         ds.close()
-        text = buf.decode("utf-8", errors="replace").strip()
-        if text:
-            print(text)
-        else:
+        if pending.strip():
+            print(pending.decode("utf-8", errors="replace"))
+            rows += 1
+        if not rows:
             print("(empty)")
     except Exception as e:
         print("[ERR] LS data error:", e)
+        ctrl.close_data()
         return
 
     last = ctrl.recv_line()
     if not last.startswith(protocol.DONE):
         print("[WARN] expected 226, got:", last)
 
+def fetch_stats(ctrl, server_host):
+    # 기대 흐름: "STAT" → "200 OK PORT <p>" → 데이터 소켓으로 지표 텍스트 (Prometheus 형식) → "226 Stats complete"
+    # 반환: 지표 텍스트, 실패하면 None
+    ctrl.send_line("STAT")
+    first = ctrl.recv_line()
+    if not first.startswith(protocol.OK):
+        print("[ERR]", first)
+        return None
+    buf = bytearray()
+    try:
+        ds = open_transfer(ctrl, server_host, first)
+        while (chunk := ds.recv(BUFFER_SIZE)):
+            buf += chunk
+        ds.close()
+    except OSError as e:
+        print("[ERR] STAT data error:", e)
+        ctrl.close_data()
+        return None
+    last = ctrl.recv_line()
+    if not last.startswith(protocol.DONE):
+        print("[WARN] expected 226, got:", last)
+    return buf.decode("utf-8", errors="replace")
+
+def do_stat(ctrl, server_host):
+    text = fetch_stats(ctrl, server_host)
+    if text is not None:
+        # 히스토그램 버킷은 줄이 많으니 합계/개수와 나머지 값만 보여 줍니다.
+        sys.stdout.write("".join(line + "\n" for line in text.splitlines()
+                                 if not line.startswith(("#", "ftp_command_duration_seconds_bucket"))))
+
+def request_rest(ctrl, offset):
+    # REST <offset> 보내기. 서버가 350으로 받아주면 offset, 아니면 0부터 다시.
+    if not offset:
+        return 0
+    ctrl.send_line(f"REST {offset}")
+    return offset if ctrl.recv_line().startswith(protocol.PENDING) else 0
+
+def recover_control(ctrl, last):
+    # A failed attempt either left the control session usable (a reply line came back)
+    # or killed it; in the second case open a new session before retrying.
+    if last:
+        return True
+    try:
+        ctrl.reconnect()
+        return True
+    except Exception as e:
+        print("[ERR] Reconnect failed:", e)
+        return False
+
+def get_once(ctrl, filename, server_host, out_name, offset):
+    """
+    One GET attempt that continues out_name from byte offset.
+    Returns (valid bytes in out_name, total size or None if refused, final reply line).
+    """
+    offset = request_rest(ctrl, offset)
+    ctrl.send_line(f"GET {filename}")
+    first = ctrl.recv_line()
+    if not first.startswith(protocol.OK):
+        return offset, None, first
+
+    parts = first.split()
+    n = int(parts[parts.index("SIZE") + 1])
+    # MODE Z로 압축해서 보내면 응답 끝에 "COMPRESS <알고리즘>"이 붙습니다.
+    codec = parts[parts.index("COMPRESS") + 1] if "COMPRESS" in parts else None
+
+    got = offset
+    hasher = integrity.new(ctrl.digest) if ctrl.digest else None
+    try:
+        ds = open_transfer(ctrl, server_host, first)
+        with open(out_name, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            if hasher and offset:
+                integrity.update_from_file(hasher, f.fileno(), 0, offset)
+            if codec:
+                for piece in compression.iter_decompressed(ds, codec, n - got):
+                    f.write(piece)
+                    if hasher:
+                        hasher.update(piece)
+                    got += len(piece)
+            if not codec and got < n:
+                # 버퍼 하나를 미리 잡아 두고 recv_into로 채운 뒤 그대로 씁니다 (조각마다 bytes를 만들지 않음).
+                view = memoryview(bytearray(min(BUFFER_SIZE, n - got)))
+                chunk = buffers.AdaptiveChunk(len(view))
+                while got < n:
+                    k = ds.recv_into(view[:min(chunk.size, n - got)])
+                    if not k:
+                        break
+                    f.write(view[:k])
+                    if hasher:
+                        hasher.update(view[:k])
+                    got += k
+                    chunk.record(k)
+        ds.close()
+    except (OSError, zlib.error, lzma.LZMAError) as e:
+        print("[WARN] GET data error:", e)
+        ctrl.close_data()
+    last = ctrl.recv_line()
+    if hasher and last.startswith(protocol.DONE) and not digest_matches(hasher, last):
+        # 받은 내용이 서버 파일과 다릅니다: 이어받기 말고 처음부터 다시 받도록 0을 돌려줍니다.
+        return 0, n, f"Digest mismatch ({ctrl.digest}): {last}"
+    return got, n, last
+
+def digest_matches(hasher, reply):
+    # 226 응답의 "DIGEST <알고리즘> <hex>"와 직접 계산한 값 비교 (서버가 안 보냈으면 통과)
+    reported = integrity.reply_digest(reply)
+    return reported is None or reported[1] == hasher.hexdigest()
+
 def do_get(ctrl, filename, server_host):
     # 기대 응답: "200 OK PORT <p> SIZE <n>" → 데이터 소켓으로 n바이트 수신 → "226 ..."
-    ctrl.send_line(f"GET {filename}")
+    # 전송이 끊기면 받은 바이트까지 REST로 이어받습니다 (최대 RESUME_ATTEMPTS번).
+    out_name = os.path.basename(filename)
+    got, last = 0, ""
+    for attempt in range(RESUME_ATTEMPTS + 1):
+        if attempt:
+            if not recover_control(ctrl, last):
+                return
+            print(f"[INFO] Resuming '{filename}' at byte {got} (retry {attempt}/{RESUME_ATTEMPTS})")
+        try:
+            got, n, last = get_once(ctrl, filename, server_host, out_name, got)
+        except (OSError, ValueError) as e:
+            last = ""
+            print("[WARN] GET control error:", e)
+            continue
+        if n is None:
+            print("[ERR]", last)
+            return
+        if got == n and last.startswith(protocol.DONE):
+            print(f"[OK] Downloaded '{filename}' ({got} bytes" + (f", {ctrl.digest} verified)" if ctrl.digest else ")"))
+            return
+    print(f"[ERR] GET '{filename}' failed after {RESUME_ATTEMPTS} retries ({got} bytes kept):", last)
+
+def fetch_range(server_host, port, fd, off, length):
+    # 한 스트림: 자기 구간만 받아서 파일의 제자리(off)에 os.pwrite로 씁니다.
+    buf = bytearray(min(max(length, 1), 1 << 20))
+    view = memoryview(buf)
+    got = 0
+    ds = open_data_conn(server_host, port)
+    try:
+        while got < length:
+            k = ds.recv_into(view[:min(len(buf), length - got)])
+            if not k:
+                break
+            os.pwrite(fd, view[:k], off + got)
+            got += k
+    finally:
+        ds.close()
+    return got == length
+
+def do_get_parallel(ctrl, filename, server_host, streams):
+    # 기대 응답: "200 OK SIZE <n> RANGES <port>:<off>:<len>,..." → 구간마다 데이터 소켓 하나씩 동시에 수신 → "226 ..."
+    ctrl.send_line(f"GET {filename} STREAMS {streams}")
     first = ctrl.recv_line()
     if not first.startswith(protocol.OK):
         print("[ERR]", first)
@@ -62,76 +228,344 @@ def do_get(ctrl, filename, server_host):
 
     try:
         parts = first.split()
-        p = int(parts[parts.index("PORT") + 1])
         n = int(parts[parts.index("SIZE") + 1])
+        ranges = protocol.parse_ranges(parts[parts.index("RANGES") + 1])
     except Exception:
         print("[ERR] Bad GET response:", first)
         return
 
-    got = 0
+    out_name = os.path.basename(filename)
+    fd = os.open(out_name, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    results = []
     try:
-        ds = open_data_conn(server_host, p)
-        out_name = os.path.basename(filename)
-        with open(out_name, "wb") as f:
-            while got < n:
-                chunk = ds.recv(min(BUFFER_SIZE, n - got))
-                if not chunk:
-                    break
-                f.write(chunk)
-                got += len(chunk)
+        # Preallocate so every stream writes into place without extending the file.
+        if n and hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, n)
+        else:
+            os.ftruncate(fd, n)
+
+        def worker(port, off, length):
+            try:
+                results.append(fetch_range(server_host, port, fd, off, length))
+            except OSError as e:
+                print("[WARN] GET stream error:", e)
+                results.append(False)
+
+        threads = [threading.Thread(target=worker, args=r) for r in ranges]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        os.close(fd)
+
+    last = ctrl.recv_line()
+    if all(results) and last.startswith(protocol.DONE):
+        print(f"[OK] Downloaded '{filename}' ({n} bytes over {len(ranges)} streams)")
+    else:
+        # Ranges finish out of order, so there is no single offset to REST from.
+        print("[WARN] Parallel GET failed, retrying with one stream:", last)
+        do_get(ctrl, filename, server_host)
+
+def put_once(ctrl, filename, server_host, offset):
+    """
+    One PUT attempt that sends filename from byte offset.
+    Returns (bytes the server should now hold or None if refused, final reply line).
+    """
+    size = os.path.getsize(filename)
+    codec = None
+    if ctrl.compress:
+        # 서버와 같은 샘플링 규칙: 잘 안 줄어드는 파일은 압축하지 않고 그대로 보냅니다.
+        with open(filename, "rb") as f:
+            if compression.worth_compressing(f.fileno(), size, offset):
+                codec = ctrl.compress
+    offset = request_rest(ctrl, offset)
+    ctrl.send_line(f"PUT {filename} SIZE {size}" + (f" COMPRESS {codec[0]}" if codec else ""))
+    first = ctrl.recv_line()
+    if not first.startswith(protocol.OK):
+        return None, first
+
+    sent = offset
+    hasher = integrity.new(ctrl.digest) if ctrl.digest else None
+    try:
+        ds = open_transfer(ctrl, server_host, first)
+        comp = compression.compressor(*codec) if codec else None
+        with open(filename, "rb") as f:
+            if hasher and offset:
+                integrity.update_from_file(hasher, f.fileno(), 0, offset)
+            f.seek(offset)
+            if comp:
+                while (chunk := f.read(COMPRESS_CHUNK)):
+                    if hasher:
+                        hasher.update(chunk)
+                    out = comp.compress(chunk)
+                    if out:
+                        ds.sendall(out)
+                    sent += len(chunk)
+            else:
+                view = memoryview(bytearray(max(1, min(BUFFER_SIZE, os.fstat(f.fileno()).st_size - offset))))
+                chunk = buffers.AdaptiveChunk(len(view))
+                while (k := f.readinto(view[:chunk.size])):
+                    if hasher:
+                        hasher.update(view[:k])
+                    ds.sendall(view[:k])
+                    sent += k
+                    chunk.record(k)
+        if comp:
+            ds.sendall(comp.flush())
         ds.close()
-    except Exception as e:
-        print("[ERR] GET data error:", e)
+    except OSError as e:
+        print("[WARN] PUT data error:", e)
+        ctrl.close_data()
+    last = ctrl.recv_line()
+    if hasher and last.startswith(protocol.DONE) and not digest_matches(hasher, last):
+        # 서버에 저장된 내용이 보낸 파일과 다릅니다: 다시 시도하면 새 업로드로 덮어씁니다.
+        return sent, f"Digest mismatch ({ctrl.digest}): {last}"
+    return sent, last
+
+def send_range(server_host, port, filename, off, length):
+    # 한 스트림: 파일의 [off, off+length) 구간만 보냅니다 (가능하면 sendfile).
+    ds = open_data_conn(server_host, port)
+    try:
+        with open(filename, "rb") as f:
+            sent = ds.sendfile(f, off, length) if length else 0
+    finally:
+        ds.close()
+    return sent == length
+
+def do_put_parallel(ctrl, filename, server_host, streams):
+    # 기대 흐름: "PUT <f> SIZE <n> STREAMS <k>" → "200 OK RANGES <port>:<off>:<len>,..." → 구간별 동시 전송 → "226 ..."
+    size = os.path.getsize(filename)
+    if try_link(ctrl, filename):
+        print(f"[OK] Server already has the content of '{filename}'; linked without upload")
+        return
+    ctrl.send_line(f"PUT {filename} SIZE {size} STREAMS {streams}")
+    first = ctrl.recv_line()
+    if not first.startswith(protocol.OK):
+        print("[ERR]", first)
         return
 
+    try:
+        parts = first.split()
+        ranges = protocol.parse_ranges(parts[parts.index("RANGES") + 1])
+    except Exception:
+        print("[ERR] Bad PUT response:", first)
+        return
+
+    results = []
+
+    def worker(port, off, length):
+        try:
+            results.append(send_range(server_host, port, filename, off, length))
+        except OSError as e:
+            print("[WARN] PUT stream error:", e)
+            results.append(False)
+
+    threads = [threading.Thread(target=worker, args=r) for r in ranges]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
     last = ctrl.recv_line()
-    if last.startswith(protocol.DONE):
-        print(f"[OK] Downloaded '{filename}' ({got} bytes)")
+    if all(results) and last.startswith(protocol.DONE):
+        print(f"[OK] Uploaded '{filename}' ({size} bytes over {len(ranges)} streams)")
     else:
-        print("[WARN] expected 226, got:", last)
+        print("[WARN] Parallel PUT failed, retrying with one stream:", last)
+        do_put(ctrl, filename, server_host)
+
+def try_link(ctrl, filename):
+    # 서버가 같은 내용을 이미 갖고 있으면 (CHECK <sha256> → 213) 전송 없이 LINK로 이름만 만듭니다.
+    # 세션의 첫 PUT에서는 먼저 없는 해시(0 x 64)로 CAS 지원 여부만 확인합니다. FTP_STORAGE=cas가
+    # 아닌 서버는 502(구버전은 500)로 답하고, 그런 서버에는 파일을 한 번도 해시하지 않습니다.
+    if ctrl.cas is None:
+        ctrl.send_line("CHECK " + "0" * 64)
+        ctrl.cas = not ctrl.recv_line().startswith(("500", "502"))
+    if not ctrl.cas:
+        return False
+    with open(filename, "rb") as f:
+        digest = integrity.sha256_file(f).hexdigest()
+    ctrl.send_line(f"CHECK {digest}")
+    if not ctrl.recv_line().startswith(protocol.FILE_STATUS):
+        return False
+    ctrl.send_line(f"LINK {filename} {digest}")
+    return ctrl.recv_line().startswith(protocol.DONE)
+
+def partial_size(ctrl, filename):
+    # 서버에 남아 있는 미완성 업로드 크기 (SIZE <name> PARTIAL → "213 <n>")
+    ctrl.send_line(f"SIZE {os.path.basename(filename)} PARTIAL")
+    reply = ctrl.recv_line()
+    return int(reply.split()[1]) if reply.startswith(protocol.FILE_STATUS) else 0
 
 def do_put(ctrl, filename, server_host):
     # 기대 흐름: "PUT <f> SIZE <n>" → 서버 "200 OK PORT <p>" → 데이터 소켓으로 전송 → "226 ..."
+    # 업로드가 끊기면 서버에 남은 partial 크기를 물어보고 REST로 나머지만 보냅니다.
+    size = os.path.getsize(filename)
+    if try_link(ctrl, filename):
+        print(f"[OK] Server already has the content of '{filename}'; linked without upload")
+        return
+    sent, last = 0, ""
+    for attempt in range(RESUME_ATTEMPTS + 1):
+        offset = 0
+        try:
+            if attempt:
+                if not recover_control(ctrl, last):
+                    return
+                offset = min(partial_size(ctrl, filename), size)
+                print(f"[INFO] Resuming upload of '{filename}' at byte {offset} (retry {attempt}/{RESUME_ATTEMPTS})")
+            sent, last = put_once(ctrl, filename, server_host, offset)
+        except (OSError, ValueError) as e:
+            last = ""
+            print("[WARN] PUT control error:", e)
+            continue
+        if sent is None:
+            print("[ERR]", last)
+            return
+        if last.startswith(protocol.DONE):
+            print(f"[OK] Uploaded '{filename}' ({size} bytes" + (f", {ctrl.digest} verified)" if ctrl.digest else ")"))
+            return
+    print(f"[ERR] PUT '{filename}' failed after {RESUME_ATTEMPTS} retries:", last)
+
+def do_sync(ctrl, filename, server_host):
+    # 기대 흐름: "SYNC <f> SIZE <n>" → "200 OK PORT <p> SIZE <m> BLOCK <b> COUNT <k>"
+    #   → 같은 데이터 연결로 서버 블록 서명 수신, 델타(COPY/LITERAL) 전송 → "226 File synced (...)"
+    # 서버에 아직 없는 파일이면 (550 File not found) 일반 PUT으로 올립니다.
     size = os.path.getsize(filename)
-    ctrl.send_line(f"PUT {filename} SIZE {size}")
+    ctrl.send_line(f"SYNC {filename} SIZE {size}")
+    # 서버가 블록 서명을 만드는 동안 전체 파일의 sha256을 계산해 둡니다 (END에 실어 보냄).
+    with open(filename, "rb") as f:
+        digest = integrity.sha256_file(f).digest()
     first = ctrl.recv_line()
+    if first.startswith("550 File not found"):
+        print(f"[INFO] '{filename}' is not on the server yet; uploading it whole")
+        do_put(ctrl, filename, server_host)
+        return
     if not first.startswith(protocol.OK):
         print("[ERR]", first)
         return
 
     try:
         parts = first.split()
-        p = int(parts[parts.index("PORT") + 1])
-    except Exception:
-        print("[ERR] Bad PUT response:", first)
+        field = lambda key: int(parts[parts.index(key) + 1])
+        ds = open_transfer(ctrl, server_host, first)
+        with ds, open(filename, "rb") as f:
+            sigs = delta.recv_exact(ds, field("COUNT") * delta.SIGNATURE.size)
+            index = delta.SignatureIndex(sigs, field("BLOCK"), field("SIZE"))
+            # mmap으로 읽으면 블록 슬라이스와 바이트 단위 롤링 모두 파일 전체를 메모리에 올리지 않습니다.
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            try:
+                pending = bytearray()
+                for op in delta.iter_delta(data, index):
+                    pending += op
+                    if len(pending) >= protocol.BATCH_COALESCE:
+                        ds.sendall(pending)
+                        pending.clear()
+                ds.sendall(pending + delta.end_op(digest))
+            finally:
+                if size:
+                    data.close()
+    except (OSError, ValueError) as e:
+        print("[WARN] SYNC data error:", e)
+        ctrl.close_data()
+
+    try:
+        last = ctrl.recv_line()
+    except OSError as e:
+        # 226이 늦게 오면 다음 명령의 응답으로 읽히니, 세션을 새로 열어 짝을 맞춥니다.
+        print("[ERR] SYNC control error:", e)
+        recover_control(ctrl, "")
         return
+    if last.startswith(protocol.DONE):
+        print(f"[OK] Synced '{filename}' ({size} bytes):", last[4:])
+    else:
+        print("[ERR]", last)
 
-    sent = 0
+def do_mget(ctrl, patterns, server_host):
+    # 기대 흐름: "MGET <이름|glob> ..." → "200 OK PORT <p> COUNT <n>" → 프레임 스트림 하나로 여러 파일 수신 → "226 ..."
+    ctrl.send_line("MGET " + " ".join(patterns))
+    first = ctrl.recv_line()
+    if not first.startswith(protocol.OK):
+        print("[ERR]", first)
+        return
+
+    got = 0
     try:
-        ds = open_data_conn(server_host, p)
-        with open(filename, "rb") as f:
-            while True:
-                chunk = f.read(BUFFER_SIZE)
-                if not chunk:
-                    break
-                ds.sendall(chunk)
-                sent += len(chunk)
-        ds.close()
-    except Exception as e:
-        print("[ERR] PUT data error:", e)
+        ds = open_transfer(ctrl, server_host, first)
+        with ds, ds.makefile("rb") as rfile:
+            while (frame := protocol.read_frame_header(rfile)) is not None:
+                kind, name, size = frame
+                if kind == "E":
+                    print(f"[WARN] {name}: {size}")
+                    continue
+                with open(os.path.basename(name), "wb") as f:
+                    left = size
+                    while left:
+                        chunk = rfile.read(min(left, protocol.BATCH_COALESCE))
+                        if not chunk:
+                            raise ValueError(f"stream ended inside {name}")
+                        f.write(chunk)
+                        left -= len(chunk)
+                got += 1
+    except (OSError, ValueError) as e:
+        print("[WARN] MGET data error:", e)
+        ctrl.close_data()
+
+    last = ctrl.recv_line()
+    if last.startswith(protocol.DONE):
+        print(f"[OK] Downloaded {got} files")
+    else:
+        print(f"[ERR] {last} ({got} files downloaded)")
+
+def do_mput(ctrl, filenames, server_host):
+    # 기대 흐름: "MPUT" → "200 OK PORT <p>" → 프레임 스트림 하나로 여러 파일 전송 → "226 Files stored (...)"
+    ctrl.send_line("MPUT")
+    first = ctrl.recv_line()
+    if not first.startswith(protocol.OK):
+        print("[ERR]", first)
         return
 
+    try:
+        ds = open_transfer(ctrl, server_host, first)
+        with ds:
+            # 작은 파일은 여러 개를 모아서 한 번에 보냅니다.
+            pending = bytearray()
+            for fn in filenames:
+                name = os.path.basename(fn)
+                try:
+                    f = open(fn, "rb")
+                except OSError as e:
+                    pending += protocol.frame_error(name, e.strerror or "unreadable")
+                    continue
+                with f:
+                    data = f.read(protocol.BATCH_COALESCE + 1)
+                    if len(data) <= protocol.BATCH_COALESCE:
+                        pending += protocol.frame_header(name, len(data))
+                        pending += data
+                    else:
+                        size = os.fstat(f.fileno()).st_size
+                        ds.sendall(pending + protocol.frame_header(name, size))
+                        pending.clear()
+                        if ds.sendfile(f, 0, size) != size:
+                            raise OSError(f"{fn} changed size during MPUT")
+                if len(pending) >= protocol.BATCH_COALESCE:
+                    ds.sendall(pending)
+                    pending.clear()
+            ds.sendall(pending + protocol.FRAME_END)
+    except OSError as e:
+        print("[WARN] MPUT data error:", e)
+        ctrl.close_data()
+
     last = ctrl.recv_line()
     if last.startswith(protocol.DONE):
-        print(f"[OK] Uploaded '{filename}' ({sent} bytes)")
+        print(f"[OK] Uploaded {len(filenames)} files")
     else:
-        print("[WARN] expected 226, got:", last)
+        print("[ERR]", last)
 
 def repl(host, port):
     try:
         with ControlConn(host, port) as ctrl:
             print(f"Connected to {host}:{port}")
-            print("Commands: LS | GET <file> | PUT <file> | EXIT")
+            print("Commands: LS [<glob>] [SORT name|size|mtime [DESC]] [LIMIT n [PAGE k]] | GET <file> [STREAMS n] | PUT <file> [STREAMS n] | SYNC <file> | MGET <glob>... | MPUT <glob>... | MODE S|B | MODE Z [zlib|lzma|NONE] [level] | DIGEST sha256|md5|crc32|adler32|NONE | STAT | EXIT")
             while True:
                 try:
                     line = input("> ").strip()
@@ -148,11 +582,36 @@ def repl(host, port):
                     print("Bye.")
                     break
                 elif cmd == "LS":
-                    do_ls(ctrl, host)
+                    do_ls(ctrl, host, args["options"])
+                elif cmd == "GET" and args["streams"] > 1:
+                    do_get_parallel(ctrl, args["filename"], host, args["streams"])
                 elif cmd == "GET":
                     do_get(ctrl, args["filename"], host)
+                elif cmd == "PUT" and args["streams"] > 1:
+                    do_put_parallel(ctrl, args["filename"], host, args["streams"])
                 elif cmd == "PUT":
                     do_put(ctrl, args["filename"], host)
+                elif cmd == "SYNC":
+                    do_sync(ctrl, args["filename"], host)
+                elif cmd == "MGET":
+                    do_mget(ctrl, args["patterns"], host)
+                elif cmd == "MPUT":
+                    do_mput(ctrl, args["filenames"], host)
+                elif cmd == "STAT":
+                    do_stat(ctrl, host)
+                elif cmd == "DIGEST":
+                    reply = ctrl.enable_digest(args["algo"])
+                    print("[OK]" if reply.startswith(protocol.OK) else "[ERR]", reply)
+                elif cmd == "MODE" and args["mode"] == "Z":
+                    reply = ctrl.enable_compression(args["algo"], args["level"])
+                    print("[OK]" if reply.startswith(protocol.OK) else "[ERR]", reply)
+                elif cmd == "MODE" and args["mode"] == "B":
+                    if ctrl.enable_block_mode(host):
+                        print("[OK] MODE B: one data connection is reused for every transfer")
+                    else:
+                        print("[ERR] Server refused MODE B")
+                elif cmd == "MODE":
+                    print("[OK]", ctrl.disable_block_mode())
                 else:
                     print("[ERR] unsupported:", cmd)
     except Exception as e:
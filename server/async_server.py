@@ -0,0 +1,280 @@
+"""
+asyncio engine for the FTP server, selected with FTP_ENGINE=asyncio.
+
+Every control session and every data channel is a coroutine on a single event loop,
+so an idle session costs one suspended coroutine instead of a thread stack. Port
+allocation, the LS payload, the per-file upload locks, commit_upload (storage, fsync
+policy) and the metrics are shared with the threaded engine.
+
+It serves a subset of ftp_server.handle_client: LS, GET, PUT (with REST resume),
+SIZE, REST, CHECK, LINK, NOOP and EXIT. Commands that only answer on the control
+channel run the threaded engine's handlers directly. The transfer variants built on
+blocking sockets (MODE B/Z, DIGEST, STREAMS, MGET/MPUT, SYNC, STAT) get
+"502 ... not supported by the asyncio engine", and check_config() refuses to start
+with settings this engine would silently ignore.
+"""
+
+import asyncio
+import os
+import time
+
+from server import ftp_server as core
+from shared import integrity
+from shared.buffers import AdaptiveChunk
+
+UNSUPPORTED = ("MODE", "DIGEST", "STAT", "MGET", "MPUT", "SYNC")
+
+def check_config():
+    """Raise SystemExit for server settings the asyncio engine does not implement."""
+    unsupported = []
+    if core.GET_MODE != "sendfile":
+        unsupported.append(f"FTP_GET_MODE={core.GET_MODE}")
+    if core.SESSION_RATE or core.GLOBAL_RATE:
+        unsupported.append("FTP_SESSION_RATE/FTP_GLOBAL_RATE")
+    if unsupported:
+        raise SystemExit(f"[SERVER] FTP_ENGINE=asyncio does not support {', '.join(unsupported)}")
+
+class Session:
+    """
+    Control-session state, shaped like ftp_server.Session so the threaded engine's
+    control-only handlers (REST, SIZE, CHECK, LINK) can run on it: reply() queues the
+    line and flush() writes the queued lines out.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.rest = 0
+        self.digest = None  # DIGEST is not supported here
+        self.sent = 0
+        self.received = 0
+        self._lines = []
+
+    def reply(self, s):
+        self._lines.append(s if s.endswith("\n") else s + "\n")
+
+    async def flush(self):
+        lines, self._lines = self._lines, []
+        if lines:
+            self.writer.write("".join(lines).encode("utf-8"))
+            await self.writer.drain()
+
+    async def send_line(self, s):
+        self.reply(s)
+        await self.flush()
+
+def timed(aw):
+    """aw bounded by DATA_TIMEOUT, like the socket timeouts of the threaded engine (raises asyncio.TimeoutError)."""
+    return asyncio.wait_for(aw, core.DATA_TIMEOUT)
+
+async def accept_data(d):
+    """Wait up to DATA_TIMEOUT for the client to connect to passive listener d without blocking the loop."""
+    d.setblocking(False)
+    data_sock, _ = await timed(asyncio.get_running_loop().sock_accept(d))
+    return data_sock
+
+async def send_file(data_sock, f, offset, count):
+    """
+    Send count bytes of f from offset. sock_sendfile uses os.sendfile when it can and falls
+    back to read/send; it goes in BUFFER_SIZE slices so DATA_TIMEOUT bounds each slice (a
+    stalled client) rather than the whole file.
+    """
+    loop = asyncio.get_running_loop()
+    end = offset + count
+    while offset < end:
+        k = await timed(loop.sock_sendfile(data_sock, f, offset, min(core.BUFFER_SIZE, end - offset)))
+        if not k:
+            break
+        offset += k
+    return count - (end - offset)
+
+async def handle_ls(sess, args=()):
+    opts, err = core.parse_ls_options(args)
+    if err:
+        await sess.send_line(f"501 {err}")
+        return
+    try:
+        d, port = core.open_data_listener()
+    except Exception:
+        await sess.send_line("425 Can't open data connection")
+        return
+    await sess.send_line(f"200 OK PORT {port}")
+    data_sock = None
+    try:
+        data_sock = await accept_data(d)
+        loop = asyncio.get_running_loop()
+        for chunk in core.coalesce(core.iter_listing(opts)):
+            await timed(loop.sock_sendall(data_sock, chunk))
+            sess.sent += len(chunk)
+    except (OSError, asyncio.TimeoutError):
+        await sess.send_line("426 Connection closed; transfer aborted")
+        return
+    finally:
+        if data_sock is not None:
+            data_sock.close()
+        core.close_data_listener(d, port)
+    await sess.send_line("226 Listing complete")
+
+async def handle_get(sess, fn, args=()):
+    if args:
+        await sess.send_line("502 GET options are not supported by the asyncio engine")
+        return
+    name = os.path.basename(fn)
+    path = os.path.join(core.BASE_DIR, name)
+    if not core.valid_name(name) or not os.path.isfile(path):
+        await sess.send_line("550 File not found")
+        return
+    size = os.path.getsize(path)
+    offset = sess.rest
+    if offset > size:
+        await sess.send_line("550 Restart offset is past end of file")
+        return
+    try:
+        d, port = core.open_data_listener()
+    except Exception:
+        await sess.send_line("425 Can't open data connection")
+        return
+    await sess.send_line(f"200 OK PORT {port} SIZE {size}" + (f" REST {offset}" if offset else ""))
+    data_sock = None
+    try:
+        data_sock = await accept_data(d)
+        with open(path, "rb") as f:
+            sess.sent += await send_file(data_sock, f, offset, size - offset)
+    except (OSError, asyncio.TimeoutError):
+        await sess.send_line("426 Connection closed; transfer aborted")
+        return
+    finally:
+        if data_sock is not None:
+            data_sock.close()
+        core.close_data_listener(d, port)
+    await sess.send_line("226 Transfer complete")
+
+async def handle_put(sess, fn, nbytes, args=()):
+    name = os.path.basename(fn)
+    n = core.parse_size(nbytes)
+    if n is None:
+        await sess.send_line("501 Usage: PUT <name> SIZE <n> (n: byte count)")
+        return
+    if args:
+        await sess.send_line("502 PUT options are not supported by the asyncio engine")
+        return
+    if not core.valid_name(name):
+        await sess.send_line("550 Invalid file name (names may not start with '.')")
+        return
+    offset = sess.rest
+    lock = core.try_file_lock(name)
+    if lock is None:
+        await sess.send_line("550 File is currently being uploaded")
+        return
+    try:
+        tmp_path = core.partial_upload_path(name)
+        if offset:
+            have = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+            if offset > have or offset > n:
+                await sess.send_line("550 No partial upload to resume at that offset")
+                return
+        try:
+            d, port = core.open_data_listener()
+        except Exception:
+            await sess.send_line("425 Can't open data connection")
+            return
+        await sess.send_line(f"200 OK PORT {port}")
+        loop = asyncio.get_running_loop()
+        got = offset
+        data_sock = None
+        content = core.content_hasher(sess, None)  # CAS mode: the sha256, so commit needn't read the file back
+        try:
+            data_sock = await accept_data(d)
+            with open(tmp_path, "r+b" if offset else "wb") as f:
+                f.truncate(offset)
+                if content and offset:
+                    await asyncio.to_thread(integrity.update_from_file, content, f.fileno(), 0, offset)
+                f.seek(offset)
+                view = memoryview(bytearray(max(1, min(core.BUFFER_SIZE, n - offset))))
+                chunk = AdaptiveChunk(len(view))
+                while got < n:
+                    k = await timed(loop.sock_recv_into(data_sock, view[:min(chunk.size, n - got)]))
+                    if not k:
+                        break
+                    # Disk writes go to a worker thread so a slow disk doesn't stall every session.
+                    await asyncio.to_thread(f.write, view[:k])
+                    if content:
+                        content.update(view[:k])
+                    got += k
+                    chunk.record(k)
+        except (OSError, asyncio.TimeoutError):
+            pass  # short upload; whatever arrived stays in the partial file for REST
+        finally:
+            if data_sock is not None:
+                data_sock.close()
+            core.close_data_listener(d, port)
+        sess.received += got - offset
+        if got == n:
+            # Renaming (and fsyncing) the upload can take a while; keep it off the loop.
+            await asyncio.to_thread(core.commit_upload, tmp_path, name,
+                                    digest=content.hexdigest() if content else None)
+            await sess.send_line("226 File stored")
+        else:
+            await sess.send_line(f"550 Incomplete upload ({got} of {n} bytes kept, resume with REST {got})")
+    finally:
+        lock.release()
+
+async def handle_client(reader, writer):
+    sess = Session(writer)
+    core._metrics.session_started()
+    try:
+        await sess.send_line("220 Welcome to Simple FTP Server")
+        while True:
+            raw = await reader.readline()
+            if not raw:
+                return
+            line = raw.decode("utf-8").strip()
+            if not line:
+                continue
+            parts = line.split()
+            cmd = parts[0].upper()
+            t0 = time.perf_counter()
+            sess.sent = sess.received = 0
+            if cmd == "LS":
+                await handle_ls(sess, parts[1:])
+            elif cmd == "GET" and len(parts) >= 2:
+                await handle_get(sess, parts[1], parts[2:])
+            elif cmd == "PUT" and len(parts) >= 4 and parts[2].upper() == "SIZE":
+                await handle_put(sess, parts[1], parts[3], parts[4:])
+            elif cmd == "REST" and len(parts) >= 2:
+                core.handle_rest(sess, parts[1])
+                await sess.flush()
+                continue
+            elif cmd == "SIZE" and len(parts) >= 2:
+                core.handle_size(sess, parts[1:])
+            elif cmd == "CHECK" and len(parts) >= 2:
+                core.handle_check(sess, parts[1:])
+            elif cmd == "LINK" and len(parts) >= 3:
+                await asyncio.to_thread(core.handle_link, sess, parts[1], parts[2])
+            elif cmd in UNSUPPORTED:
+                sess.reply(f"502 {cmd} is not supported by the asyncio engine")
+            elif cmd == "NOOP":
+                sess.reply("200 NOOP ok")
+            elif cmd == "EXIT":
+                await sess.send_line("221 Goodbye")
+                return
+            else:
+                sess.reply("500 Unknown command")
+            await sess.flush()
+            if cmd in core.METERED_COMMANDS:
+                core._metrics.observe(cmd, time.perf_counter() - t0, sess.sent, sess.received)
+            sess.rest = 0
+    except (ConnectionError, UnicodeDecodeError, ValueError):
+        pass
+    finally:
+        core._metrics.session_ended()
+        writer.close()
+
+async def _serve(s):
+    server = await asyncio.start_server(handle_client, sock=s)
+    async with server:
+        await server.serve_forever()
+
+def serve(s):
+    """Run the event loop, accepting control connections on the listening socket s."""
+    check_config()
+    asyncio.run(_serve(s))
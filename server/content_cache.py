@@ -0,0 +1,79 @@
+"""
+Contents of small files, so repeated GETs of them skip the open() and read loop.
+
+Entries are keyed by name and validated against the file's (size, mtime_ns) from the os.stat
+handle_get already does; a miss reads the file whole, once, and caches what it read under the
+fstat of the open file. commit_upload invalidates the name, so an upload never serves stale
+bytes. The LRU is bounded by total bytes held; files over max_file are never cached.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+class ContentCache:
+    def __init__(self, capacity, max_file):
+        self.capacity = capacity  # bytes of file contents to keep; 0 disables the cache
+        self.max_file = max_file
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # name -> ((size, mtime_ns), bytes)
+        self.held = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, name, path, st):
+        """
+        Contents of path (cached under name, st its os.stat), read and cached on a miss.
+        None if the cache is off, the file is too big or it can't be read.
+        """
+        if st.st_size > min(self.max_file, self.capacity):
+            return None
+        key = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        try:
+            with open(path, "rb") as f:
+                fst = os.fstat(f.fileno())
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) == fst.st_size <= self.max_file:
+            self._put(name, (fst.st_size, fst.st_mtime_ns), data)
+        return data
+
+    def invalidate(self, name):
+        """Forget name's contents (its file was just replaced)."""
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self.held -= len(entry[1])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.held,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def _put(self, name, key, data):
+        with self._lock:
+            old = self._entries.pop(name, None)
+            if old is not None:
+                self.held -= len(old[1])
+            self._entries[name] = (key, data)
+            self.held += len(data)
+            while self.held > self.capacity:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self.held -= len(dropped)
+                self.evictions += 1
@@ -0,0 +1,39 @@
+"""
+Digests of served files, so repeated GETs with DIGEST on don't rehash them.
+
+Entries are keyed by (name, size, mtime_ns, algo): uploads commit a new file with a new
+mtime, so a replaced file simply misses and the stale entry ages out of the LRU.
+PUT stores the digest it computed while receiving, so the first GET after an upload hits.
+"""
+
+import threading
+from collections import OrderedDict
+
+class DigestCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (name, size, mtime_ns, algo) -> hex digest
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, st, algo):
+        """Cached digest of name as described by os.stat result st, or None."""
+        key = (name, st.st_size, st.st_mtime_ns, algo)
+        with self._lock:
+            digest = self._entries.get(key)
+            if digest is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return digest
+
+    def put(self, name, st, algo, digest):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[(name, st.st_size, st.st_mtime_ns, algo)] = digest
+            self._entries.move_to_end((name, st.st_size, st.st_mtime_ns, algo))
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
@@ -0,0 +1,80 @@
+"""
+In-memory index of the regular files in a directory, used to answer LS.
+
+Every listing() call costs one stat() of the directory: if its mtime changed
+since the last scan, entries are rebuilt with a single scandir pass; otherwise
+the pre-encoded LS payload is returned as-is. Uploads committed through
+commit() update their entry in place instead of forcing a rescan.
+
+With several worker processes (shared=True) another process can change the directory
+between the two stat() calls around a commit's os.replace, and the mtime can't tell one
+write from two; there every commit leaves the next listing to rescan.
+
+Like any mtime-validated cache, a change made outside the server within the same
+filesystem timestamp tick as the last scan is only seen after the next change.
+"""
+
+import os
+import threading
+
+class DirIndex:
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared  # other processes write to the directory too
+        self._lock = threading.Lock()
+        self._rows = {}         # name -> (name, size, mtime, encoded "<name> <size> <mtime>\n")
+        self._dir_mtime = None  # st_mtime_ns the rows were last validated against
+        self._listing = None    # cached b"".join of encoded rows, None when stale
+        self._snapshot = None   # cached tuple of row tuples, None when stale
+        self.rescans = 0
+
+    def listing(self):
+        """Encoded LS payload for the directory."""
+        with self._lock:
+            self._revalidate()
+            if self._listing is None:
+                self._listing = b"".join(row[3] for row in self._rows.values())
+            return self._listing
+
+    def snapshot(self):
+        """
+        Immutable tuple of (name, size, mtime, encoded_row) for every file.
+        Built at most once per directory change and shared by concurrent LS requests,
+        so filtering and paging it costs no per-request copy of the index.
+        """
+        with self._lock:
+            self._revalidate()
+            if self._snapshot is None:
+                self._snapshot = tuple(self._rows.values())
+            return self._snapshot
+
+    def commit(self, tmp_path, path):
+        """os.replace() tmp_path onto path (inside the directory) and index the new file."""
+        with self._lock:
+            before = os.stat(self.path).st_mtime_ns
+            os.replace(tmp_path, path)
+            after = os.stat(self.path).st_mtime_ns
+            name = os.path.basename(path)
+            self._rows[name] = _row(name, os.stat(path))
+            self._listing = self._snapshot = None
+            # Only skip the rescan if nothing else touched the directory since we last looked.
+            if before == self._dir_mtime and not self.shared:
+                self._dir_mtime = after
+
+    def _revalidate(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._dir_mtime:
+            return
+        rows = {}
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.is_file():
+                    rows[entry.name] = _row(entry.name, entry.stat())
+        self._rows = rows
+        self._listing = self._snapshot = None
+        self._dir_mtime = mtime
+        self.rescans += 1
+
+def _row(name, st):
+    mtime = int(st.st_mtime)
+    return name, st.st_size, mtime, f"{name} {st.st_size} {mtime}\n".encode("utf-8")
@@ -0,0 +1,58 @@
+"""
+Per-name upload locks that hold across worker processes (FTP_PROCESSES > 1).
+
+Each name has a lock file under <BASE_DIR>/.locks, locked with fcntl.flock. A flock
+belongs to the open file description, so two sessions conflict whether they run in
+different worker processes or in two threads of the same one, and the kernel drops the
+lock when the holder's descriptor closes, even if its process dies mid-upload.
+
+The lock files are separate from the .partial upload files because those are renamed
+into place on commit: a lock taken on one would follow it out of .uploads. Lock files
+are never deleted, since unlinking one can race with a session that just opened it.
+"""
+
+import fcntl
+import os
+import threading
+
+class FileLock:
+    """A held lock; release() unlocks it. Also a context manager."""
+
+    def __init__(self, owner, fd):
+        self._owner = owner
+        self._fd = fd
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # closing the descriptor drops the flock
+            self._fd = None
+            self._owner._released()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class FileLocks:
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.held = 0  # locks held by this process
+
+    def try_acquire(self, name):
+        """Lock name without waiting; a FileLock, or None if another session holds it."""
+        fd = os.open(os.path.join(self.lock_dir, f"{name}.lock"), os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        with self._lock:
+            self.held += 1
+        return FileLock(self, fd)
+
+    def _released(self):
+        with self._lock:
+            self.held -= 1
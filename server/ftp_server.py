@@ -1,21 +1,162 @@
-import os, socket, threading, time
-from collections import defaultdict
+import contextlib, errno, fnmatch, heapq, itertools, lzma, os, select, signal, socket, stat, sys, threading, time, zlib
+
+try:
+    from shared import buffers, compression, delta, integrity, protocol
+    from shared.block_channel import BlockChannel
+    from shared.line_reader import LineReader, LineTooLong
+    from server.digest_cache import DigestCache
+    from server.dir_index import DirIndex
+    from server.file_locks import FileLocks
+    from server.content_cache import ContentCache
+    from server.map_cache import MapCache
+    from server.metrics import Metrics, serve_http
+    from server.object_store import ObjectStore, is_sha256
+    from server.port_pool import PortPool, port_slice
+    from server.session_pool import SessionPool
+    from server.throttle import FairScheduler, ThrottledConn, TokenBucket
+    from server.upload_writer import UploadWriter
+except ModuleNotFoundError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from shared import buffers, compression, delta, integrity, protocol
+    from shared.block_channel import BlockChannel
+    from shared.line_reader import LineReader, LineTooLong
+    from server.digest_cache import DigestCache
+    from server.dir_index import DirIndex
+    from server.file_locks import FileLocks
+    from server.content_cache import ContentCache
+    from server.map_cache import MapCache
+    from server.metrics import Metrics, serve_http
+    from server.object_store import ObjectStore, is_sha256
+    from server.port_pool import PortPool, port_slice
+    from server.session_pool import SessionPool
+    from server.throttle import FairScheduler, ThrottledConn, TokenBucket
+    from server.upload_writer import UploadWriter
 
 # Server binds to all interfaces so external AWS clients can connect.
 # Port 2121 is chosen so the process can run without sudo (ports <1024 require root).
 HOST = os.environ.get("FTP_HOST", "0.0.0.0")
 CONTROL_PORT = int(os.environ.get("FTP_PORT", 2121))
-BUFFER_SIZE = 4096
+# ENGINE selects the session model: "threads" (one thread per client) or "asyncio"
+# (every control and data channel is a coroutine on one event loop, see async_server.py).
+ENGINE = os.environ.get("FTP_ENGINE", "threads")
+# PROCESSES > 1 pre-forks that many workers, each running ENGINE with its own share of the
+# control port (SO_REUSEPORT), its own slice of the data-port range and its own caches.
+PROCESSES = int(os.environ.get("FTP_PROCESSES", 1))
+# Threaded engine admission control: WORKERS sessions run at once, up to MAX_PENDING more
+# wait in a queue, anything beyond that gets "421 Too many connections". So does a queued
+# session still waiting after MAX_QUEUE_WAIT seconds (below the client's 5 s banner timeout).
+WORKERS = int(os.environ.get("FTP_WORKERS", 64))
+MAX_PENDING = int(os.environ.get("FTP_MAX_PENDING", 256))
+MAX_QUEUE_WAIT = float(os.environ.get("FTP_MAX_QUEUE_WAIT", 3))
+LISTEN_BACKLOG = int(os.environ.get("FTP_BACKLOG", 128))
+POOL_STATS_INTERVAL = float(os.environ.get("FTP_POOL_STATS_INTERVAL", 60))
+# Data copy loops (PUT receive, copy-mode GET) reuse one buffer of up to BUFFER_SIZE bytes per
+# transfer; buffers.AdaptiveChunk grows the bytes moved per call with the measured throughput.
+BUFFER_SIZE = int(os.environ.get("FTP_BUFFER_SIZE", 256 * 1024))
+CONTROL_BUFFER = 4096  # recv size for command lines
+MAX_LINE = int(os.environ.get("FTP_MAX_LINE", 64 * 1024))  # longer command lines get 500
+# SO_SNDBUF/SO_RCVBUF of data connections, set on the pooled listeners (0 = kernel autotuning).
+SOCKET_SNDBUF = int(os.environ.get("FTP_SNDBUF", 0))
+SOCKET_RCVBUF = int(os.environ.get("FTP_RCVBUF", 0))
+# Upload durability (upload_writer.py, commit_upload): "none" leaves flushing to the kernel, "commit"
+# fsyncs each upload before it is renamed into place and BASE_DIR after the rename, "periodic" also
+# fdatasyncs every FSYNC_INTERVAL bytes while a PUT is received.
+FSYNC_MODE = os.environ.get("FTP_FSYNC", "none")
+FSYNC_INTERVAL = int(os.environ.get("FTP_FSYNC_INTERVAL_MB", 64)) << 20
+PREALLOCATE = os.environ.get("FTP_PREALLOCATE", "1") != "0"  # posix_fallocate the declared SIZE
+COMPRESS_CHUNK = 256 * 1024  # raw bytes fed to the MODE Z compressor per call
 DATA_PORT_MIN = 20000
 DATA_PORT_MAX = 21000
+DATA_TIMEOUT = 60  # seconds a data socket may sit idle (accept or transfer) before the transfer is aborted
+
+# GET_MODE picks how handle_get pushes file bytes: "sendfile" hands regular files
+# to the kernel (zero-copy), "copy" keeps the read/sendall loop in Python, "mmap" sends
+# slices of a mapping shared by every GET of the file (see map_cache.py). mmap requires that
+# nothing but the server modifies BASE_DIR: truncating a mapped file in place raises SIGBUS.
+GET_MODE = os.environ.get("FTP_GET_MODE", "sendfile")
+# Bytes of hot files GET_MODE=mmap keeps mapped; files larger than this are sent with sendfile.
+MMAP_CACHE_BYTES = int(os.environ.get("FTP_MMAP_CACHE_MB", 1024)) << 20
 
-BASE_DIR = os.path.join(os.path.dirname(__file__), "..", "server_files")
+BASE_DIR = os.environ.get("FTP_BASE_DIR", os.path.join(os.path.dirname(__file__), "..", "server_files"))
 os.makedirs(os.path.abspath(BASE_DIR), exist_ok=True)
+# In-progress uploads live in a hidden subdirectory so they never show up in LS and
+# creating them does not invalidate the LS index of BASE_DIR.
+UPLOAD_DIR = os.path.join(BASE_DIR, ".uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+_dir_index = DirIndex(BASE_DIR, shared=PROCESSES > 1)
+# STORAGE selects how committed uploads are kept: "plain" (one file per name) or "cas"
+# (content-addressed: each distinct content once under .objects, names are hard links).
+STORAGE = os.environ.get("FTP_STORAGE", "plain")
+_store = ObjectStore(os.path.join(BASE_DIR, ".objects"), _dir_index) if STORAGE == "cas" else None
+# Digests reported after DIGEST <algo>, cached per (name, size, mtime) so repeated GETs skip the hashing.
+_digest_cache = DigestCache(int(os.environ.get("FTP_DIGEST_CACHE", 4096)))
+_map_cache = MapCache(MMAP_CACHE_BYTES)
+# Whole contents of small files (<= FTP_CONTENT_CACHE_MAX_KB), so their GETs are one sendall.
+_content_cache = ContentCache(int(os.environ.get("FTP_CONTENT_CACHE_MB", 64)) << 20,
+                              int(os.environ.get("FTP_CONTENT_CACHE_MAX_KB", 64)) << 10)
+
+# Passive data ports come from a pool over the range opened in the AWS SG rules.
+PREBOUND_PORTS = int(os.environ.get("FTP_PREBOUND_PORTS", 8))
+_port_pool = PortPool(DATA_PORT_MIN, DATA_PORT_MAX, PREBOUND_PORTS, SOCKET_SNDBUF, SOCKET_RCVBUF)
+# Upload locks are flock()ed files, so they also serialize uploads across worker processes.
+_file_locks = FileLocks(os.path.join(BASE_DIR, ".locks"))
+
+# Bandwidth limits in bytes/s, applied to sent and received data separately (0 = unlimited).
+# SESSION_RATE caps each session; GLOBAL_RATE caps the whole server (the NIC) and shares it
+# between transfers: with FAIR_SHARE the one that has moved the fewest bytes goes next, so
+# small LS/GET requests aren't stuck behind a large download. See throttle.py.
+SESSION_RATE = int(os.environ.get("FTP_SESSION_RATE", 0))
+GLOBAL_RATE = int(os.environ.get("FTP_GLOBAL_RATE", 0))
+FAIR_SHARE = os.environ.get("FTP_FAIR_SHARE", "1") != "0"
+THROTTLE_CHUNK = int(os.environ.get("FTP_THROTTLE_CHUNK", 64 * 1024))
+
+def throttle_burst(rate):
+    """Bytes a bucket may save up: 50 ms of traffic, at least one chunk."""
+    return max(THROTTLE_CHUNK, rate // 20)
+
+def make_schedulers():
+    """(egress, ingress) global schedulers for GLOBAL_RATE, or (None, None) when unlimited."""
+    if not GLOBAL_RATE:
+        return None, None
+    return tuple(FairScheduler(GLOBAL_RATE, throttle_burst(GLOBAL_RATE), FAIR_SHARE) for _ in range(2))
+
+_egress, _ingress = make_schedulers()
+
+# Command latency histograms, byte counters and component gauges, served by STAT and,
+# when METRICS_PORT is set, over HTTP at /metrics (Prometheus text format).
+METRICS_HOST = os.environ.get("FTP_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("FTP_METRICS_PORT", 0))
+# Commands timed into the latency histograms (a fixed set keeps label cardinality bounded).
+METERED_COMMANDS = ("LS", "GET", "PUT", "MGET", "MPUT", "SYNC", "CHECK", "LINK", "SIZE", "MODE", "DIGEST", "STAT")
+_metrics = Metrics()
+_lock_stats = {"acquired": 0, "contended": 0}  # try_file_lock outcomes
+_upload_stats = {"fsyncs": 0, "dir_fsyncs": 0, "disk_wait_seconds": 0.0}  # UploadWriter and commit_upload totals
+_upload_stats_lock = threading.Lock()
+_lock_stats_lock = threading.Lock()
+
+def throttle_stats():
+    stats = {}
+    for direction, sched in (("egress", _egress), ("ingress", _ingress)):
+        if sched is not None:
+            stats.update({f"{direction}_bytes": sched.granted, f"{direction}_waits": sched.waits,
+                          f"{direction}_wait_seconds": round(sched.wait_seconds, 6)})
+    return stats
 
-# Thread-safe round-robin allocator for passive data ports (range matches AWS SG rules).
-_port_lock = threading.Lock()
-_next_port = DATA_PORT_MIN
-_file_locks = defaultdict(threading.Lock)
+_metrics.register("port_pool", _port_pool.stats)
+_metrics.register("file_locks", lambda: {**_lock_stats, "held": _file_locks.held})
+_metrics.register("digest_cache", lambda: {"hits": _digest_cache.hits, "misses": _digest_cache.misses})
+_metrics.register("throttle", throttle_stats)
+_metrics.register("uploads", lambda: {k: round(v, 6) for k, v in _upload_stats.items()})
+_metrics.register("map_cache", _map_cache.stats)
+_metrics.register("content_cache", _content_cache.stats)
+_metrics.register("storage", lambda: {"dedup_hits": _store.dedup_hits} if _store is not None else {})
+
+def try_file_lock(name):
+    """Take the per-name upload lock without waiting. Returns the lock, or None if another upload holds it."""
+    lock = _file_locks.try_acquire(name)
+    with _lock_stats_lock:
+        _lock_stats["contended" if lock is None else "acquired"] += 1
+    return lock
 
 def send_line(sock, s):
     if not s.endswith("\n"):
@@ -24,166 +165,1224 @@ def send_line(sock, s):
 
 def open_data_listener():
     """
-    Open a passive data socket bound to the next available port in the 20000-21000 range.
-    Uses a lock to ensure multiple client threads do not race for the same port.
+    Lease a passive data socket in the 20000-21000 range from the port pool.
+    Usually a pre-bound listener is ready, so no bind() happens here. Hand it back
+    with close_data_listener() so the port returns to the pool.
     """
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    attempts = DATA_PORT_MAX - DATA_PORT_MIN + 1
-    for _ in range(attempts):
-        with _port_lock:
-            global _next_port
-            port = _next_port
-            _next_port += 1
-            if _next_port > DATA_PORT_MAX:
-                _next_port = DATA_PORT_MIN
-        try:
-            s.bind(("", port))
-            s.listen(1)
-            return s, port
-        except OSError:
+    return _port_pool.acquire()
+
+def close_data_listener(d, port):
+    _port_pool.release(d, port)
+
+def send_file(data_sock, f, offset=0, count=None, hasher=None):
+    """
+    Send `count` bytes (default: up to EOF) of file object f starting at byte offset
+    over data_sock and return the number of bytes sent.
+    Regular files use socket.sendfile (os.sendfile under the hood) so the data never
+    enters Python; pipes, devices and GET_MODE="copy" fall back to the read/sendall loop.
+    With a hasher (DIGEST) every sent byte is also fed to hasher.update().
+    """
+    if count == 0:
+        return 0  # socket.sendfile treats count=0 as "whole file"
+    if GET_MODE != "copy" and stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+        if hasher is None:
+            return data_sock.sendfile(f, offset, count)
+        # Hash each slice right after the kernel sent it, while it is still in the page cache.
+        if count is None:
+            count = os.fstat(f.fileno()).st_size - offset
+        sent = 0
+        while sent < count:
+            k = data_sock.sendfile(f, offset + sent, min(integrity.READ_CHUNK, count - sent))
+            if not k:
+                break
+            integrity.update_from_file(hasher, f.fileno(), offset + sent, offset + sent + k)
+            sent += k
+        return sent
+    if offset:
+        f.seek(offset)
+    view = memoryview(bytearray(BUFFER_SIZE if count is None else max(1, min(BUFFER_SIZE, count))))
+    chunk = buffers.AdaptiveChunk(len(view))
+    sent = 0
+    while count is None or sent < count:
+        k = f.readinto(view[:chunk.size if count is None else min(chunk.size, count - sent)])
+        if not k:
+            break
+        data_sock.sendall(view[:k])
+        if hasher:
+            hasher.update(view[:k])
+        sent += k
+        chunk.record(k)
+    return sent
+
+def digest_field(algo, digest):
+    """Suffix of a 226 line reporting the transfer's digest (DIGEST command), empty when off."""
+    return f" DIGEST {algo} {digest}" if digest else ""
+
+def listing_bytes():
+    """Encoded LS payload: one "<name> <size> <mtime>" row per regular file in BASE_DIR."""
+    return _dir_index.listing()
+
+LS_SORT_KEYS = {"name": 0, "size": 1, "mtime": 2}
+LS_DEFAULTS = {"match": None, "sort": None, "desc": False, "limit": None, "page": 1}
+
+def parse_ls_options(args):
+    """
+    Parse "LS [<glob>] [SORT name|size|mtime [DESC]] [LIMIT <n> [PAGE <k>]]".
+    Returns (options, None) or (None, error message).
+    """
+    opts = dict(LS_DEFAULTS)
+    i = 0
+    try:
+        while i < len(args):
+            word = args[i].upper()
+            if word == "SORT":
+                key = args[i + 1].lower()
+                if key not in LS_SORT_KEYS:
+                    return None, f"Unknown sort key: {key}"
+                opts["sort"] = key
+                i += 2
+            elif word == "DESC":
+                opts["desc"] = True
+                i += 1
+            elif word == "LIMIT":
+                opts["limit"] = int(args[i + 1])
+                i += 2
+            elif word == "PAGE":
+                opts["page"] = int(args[i + 1])
+                i += 2
+            elif opts["match"] is None:
+                opts["match"] = args[i]
+                i += 1
+            else:
+                return None, f"Unexpected LS argument: {args[i]}"
+    except (IndexError, ValueError):
+        return None, "Usage: LS [<glob>] [SORT name|size|mtime [DESC]] [LIMIT <n> [PAGE <k>]]"
+    if (opts["limit"] is not None and opts["limit"] < 1) or opts["page"] < 1:
+        return None, "LIMIT and PAGE must be positive"
+    return opts, None
+
+def iter_listing(opts):
+    """
+    Yield encoded LS payload pieces for the given options.
+    With no options this is the index's pre-encoded buffer; otherwise rows are
+    filtered, ordered and paged lazily over the shared index snapshot, so the
+    per-request cost is one row at a time (plus a bounded heap for SORT + LIMIT).
+    """
+    if opts is None or opts == LS_DEFAULTS:
+        yield listing_bytes()
+        return
+    rows = iter(_dir_index.snapshot())
+    if opts["match"]:
+        pattern = opts["match"]
+        rows = (r for r in rows if fnmatch.fnmatchcase(r[0], pattern))
+    start = (opts["page"] - 1) * opts["limit"] if opts["limit"] else 0
+    stop = start + opts["limit"] if opts["limit"] else None
+    if opts["sort"]:
+        col = LS_SORT_KEYS[opts["sort"]]
+        key = lambda r: r[col]
+        if stop is not None:
+            pick = heapq.nlargest if opts["desc"] else heapq.nsmallest
+            rows = iter(pick(stop, rows, key=key))
+        else:
+            rows = iter(sorted(rows, key=key, reverse=opts["desc"]))
+    for row in itertools.islice(rows, start, stop):
+        yield row[3]
+
+def coalesce(pieces, size=BUFFER_SIZE):
+    """Regroup an iterable of byte strings into writes of at least `size` bytes (except the last)."""
+    pending = bytearray()
+    for piece in pieces:
+        if len(piece) >= size and not pending:
+            yield piece
             continue
-    s.close()
-    raise Exception("No available data ports in range 20000-21000")
+        pending += piece
+        if len(pending) >= size:
+            yield bytes(pending)
+            pending.clear()
+    if pending:
+        yield bytes(pending)
+
+def valid_name(name):
+    """
+    True for a name clients may store or fetch: not empty and not starting with "." (the
+    server's .uploads, .locks and .objects work directories live in BASE_DIR).
+    """
+    return bool(name) and not name.startswith(".")
 
-def handle_ls(ctrl):
+def partial_upload_path(name):
+    """
+    Where an in-progress upload of name is written. The path is stable per name (uploads
+    of one name are serialized by _file_locks), so an interrupted upload survives for REST.
+    """
+    return os.path.join(UPLOAD_DIR, f"{name}.upload.partial")
+
+def fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
     try:
-        d, port = open_data_listener()
-    except Exception:
-        send_line(ctrl, "425 Can't open data connection")
-        return
-    send_line(ctrl, f"200 OK PORT {port}")
-    try:
-        data_sock, _ = d.accept()
-        rows = []
-        for name in os.listdir(BASE_DIR):
-            path = os.path.join(BASE_DIR, name)
-            if os.path.isfile(path):
-                size = os.path.getsize(path)
-                mtime = int(os.path.getmtime(path))
-                rows.append(f"{name} {size} {mtime}")
-        text = ("\n".join(rows) + "\n") if rows else ""
-        data_sock.sendall(text.encode("utf-8"))
+        os.fsync(fd)
     finally:
+        os.close(fd)
+
+def sync_dirs():
+    """Under FSYNC_MODE, fsync BASE_DIR (and the object store) so renames and links into it survive a crash."""
+    if FSYNC_MODE == "none":
+        return
+    fsync_path(BASE_DIR)
+    if _store is not None:
+        fsync_path(_store.path)
+    with _upload_stats_lock:
+        _upload_stats["dir_fsyncs"] += 1
+
+def commit_upload(tmp_path, name, synced=False, digest=None, hash_later=False):
+    """
+    Atomically move a finished upload into BASE_DIR and update the LS index.
+    Unless FSYNC_MODE is "none", the upload is fsynced before the rename (skipped with
+    synced=True, when the caller's UploadWriter already did it) and the directory after it.
+    In CAS mode digest is the sha256 hex taken while the upload was received (None: hash
+    it here); hash_later places it as a plain file for store_later() to hash.
+    """
+    if FSYNC_MODE != "none" and not synced:
+        fsync_path(tmp_path)
+        with _upload_stats_lock:
+            _upload_stats["fsyncs"] += 1
+    if _store is not None and hash_later:
+        _store.place(tmp_path, os.path.join(BASE_DIR, name))
+    elif _store is not None:
+        _store.commit(tmp_path, os.path.join(BASE_DIR, name), digest)
+    else:
+        _dir_index.commit(tmp_path, os.path.join(BASE_DIR, name))
+    sync_dirs()
+    _map_cache.invalidate(name)
+    _content_cache.invalidate(name)
+
+def store_later(name, lock):
+    """
+    Thread body for a parallel upload in CAS mode: hash the name commit_upload placed, then
+    adopt it into the store. It holds the upload lock handed over by the session until done,
+    so no other upload replaces the name in the meantime.
+    """
+    path = os.path.join(BASE_DIR, name)
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            digest = integrity.sha256_file(f).hexdigest()
+        if _store.adopt(path, digest, st, partial_upload_path(name)):
+            sync_dirs()
+            _map_cache.invalidate(name)
+            _content_cache.invalidate(name)
+    except OSError as e:
+        print(f"[SERVER] Could not move {name} into the content store: {e}")
+    finally:
+        lock.release()
+
+def content_hasher(sess, hasher):
+    """The sha256 an upload needs in CAS mode: the session's DIGEST hasher if that is sha256, else a new one (None without CAS)."""
+    if _store is None:
+        return None
+    return hasher if sess.digest == "sha256" else integrity.new("sha256")
+
+class Session:
+    """State a control connection carries between commands."""
+
+    def __init__(self, ctrl, addr):
+        self.ctrl = ctrl
+        self.addr = addr
+        self.rest = 0  # restart offset set by REST; applies to the next command only
+        self.data = None  # persistent data socket in MODE B, None in MODE S
+        self.compress = None  # (algorithm, level) after MODE Z, None when off
+        self.digest = None  # algorithm after DIGEST, None when off
+        # Per-session token buckets for sent/received data, None without FTP_SESSION_RATE.
+        self.sent = 0  # data bytes moved by the current command, for the metrics
+        self.received = 0
+        self.send_bucket = TokenBucket(SESSION_RATE, throttle_burst(SESSION_RATE)) if SESSION_RATE else None
+        self.recv_bucket = TokenBucket(SESSION_RATE, throttle_burst(SESSION_RATE)) if SESSION_RATE else None
+
+    def reply(self, s):
+        send_line(self.ctrl, s)
+
+def accept_data(d):
+    """Wait up to DATA_TIMEOUT for the client to connect to passive listener d."""
+    d.settimeout(DATA_TIMEOUT)
+    data_sock, _ = d.accept()
+    data_sock.settimeout(DATA_TIMEOUT)
+    return data_sock
+
+def lease_data(sess):
+    """
+    Reserve the data path of the next transfer: a passive (listener, port) lease in MODE S,
+    or None in MODE B where the session's persistent channel is reused.
+    Raises when no data port is free.
+    """
+    if sess.data is not None and channel_closed(sess.data):
+        drop_data_channel(sess)  # client went away from MODE B; the PORT in the reply tells it so
+    return None if sess.data is not None else open_data_listener()
+
+def channel_closed(sock):
+    """True if the client closed an idle MODE B channel (it never writes to it between transfers)."""
+    if not select.select([sock], [], [], 0)[0]:
+        return False
+    try:
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except OSError:
+        return True
+
+def throttled(sess, conn):
+    """conn paced by the session's and the global rate limits; conn itself when no limit is set."""
+    if sess.send_bucket is None and _egress is None:
+        return conn
+    return ThrottledConn(conn, (sess.send_bucket, _egress), (sess.recv_bucket, _ingress), THROTTLE_CHUNK)
+
+def port_field(lease):
+    """" PORT <p>" for the 200 reply of a MODE S transfer; MODE B replies carry no port."""
+    return f" PORT {lease[1]}" if lease else ""
+
+@contextlib.contextmanager
+def data_conn(sess, lease):
+    """
+    Data connection of one transfer, entered after the 200 reply went out.
+    MODE S accepts a fresh connection and closes it afterwards (the close marks end of data).
+    MODE B wraps the persistent channel in a BlockChannel that sends or skips to the end marker.
+    A MODE B transfer that fails leaves the channel out of step with the client, so the channel
+    is dropped and the session falls back to MODE S (the next 200 reply carries a PORT again).
+    """
+    if lease is None:
+        ch = BlockChannel(sess.data)
         try:
+            yield throttled(sess, ch)
+            ch.close()
+        except BaseException:
+            drop_data_channel(sess)
+            raise
+        return
+    d, port = lease
+    data_sock = None
+    try:
+        data_sock = accept_data(d)
+        yield throttled(sess, data_sock)
+    finally:
+        if data_sock is not None:
             data_sock.close()
-        except:
+        close_data_listener(d, port)
+
+def drop_data_channel(sess):
+    if sess.data is not None:
+        try:
+            sess.data.close()
+        except OSError:
             pass
-        d.close()
-    send_line(ctrl, "226 Listing complete")
+        sess.data = None
 
-def handle_get(ctrl, fn):
-    name = os.path.basename(fn)
-    path = os.path.join(BASE_DIR, name)
-    if not os.path.isfile(path):
-        send_line(ctrl, "550 File not found")
+def handle_mode(sess, args):
+    mode = args[0].upper() if args else ""
+    if mode == "Z":
+        codec, err = compression.parse_mode_z(args[1:])
+        if err:
+            sess.reply(f"501 {err}")
+            return
+        sess.compress = codec
+        sess.reply("200 Mode Z " + (f"{codec[0]} {codec[1]}" if codec else "off"))
+        return
+    if mode == "S":
+        drop_data_channel(sess)
+        sess.reply("200 Mode S")
+        return
+    if mode != "B":
+        sess.reply("501 Usage: MODE S|B|Z [zlib|lzma|NONE] [level]")
+        return
+    if sess.data is not None:
+        sess.reply("200 Mode B (data channel already open)")
         return
-    size = os.path.getsize(path)
     try:
         d, port = open_data_listener()
     except Exception:
-        send_line(ctrl, "425 Can't open data connection")
+        sess.reply("425 Can't open data connection")
         return
-    send_line(ctrl, f"200 OK PORT {port} SIZE {size}")
+    sess.reply(f"200 OK PORT {port} MODE B")
     try:
-        data_sock, _ = d.accept()
-        with open(path, "rb") as f:
-            while True:
-                chunk = f.read(BUFFER_SIZE)
-                if not chunk:
-                    break
+        sess.data = accept_data(d)
+        # Block headers and end markers are tiny writes; don't let Nagle hold them back.
+        sess.data.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass  # client never connected; stay in MODE S, the next 200 reply will carry a PORT
+    finally:
+        close_data_listener(d, port)
+
+def handle_digest(sess, args):
+    """DIGEST <algo>|NONE: report a whole-file digest of every later GET/PUT on its 226 line."""
+    algo = args[0].lower() if args else ""
+    if algo == "none":
+        sess.digest = None
+        sess.reply("200 Digest off")
+        return
+    if algo not in integrity.ALGORITHMS:
+        sess.reply(f"501 Usage: DIGEST {'|'.join(integrity.ALGORITHMS)}|NONE")
+        return
+    sess.digest = algo
+    sess.reply(f"200 Digest {algo}")
+
+def handle_stat(sess):
+    """STAT: server metrics (Prometheus text format) over a data connection, like LS."""
+    try:
+        lease = lease_data(sess)
+    except Exception:
+        sess.reply("425 Can't open data connection")
+        return
+    sess.reply(f"200 OK{port_field(lease)}")
+    try:
+        with data_conn(sess, lease) as data_sock:
+            data_sock.sendall(_metrics.render().encode())
+    except OSError:
+        sess.reply("426 Connection closed; transfer aborted")
+        return
+    sess.reply("226 Stats complete")
+
+def handle_ls(sess, args=()):
+    opts, err = parse_ls_options(args)
+    if err:
+        sess.reply(f"501 {err}")
+        return
+    try:
+        lease = lease_data(sess)
+    except Exception:
+        sess.reply("425 Can't open data connection")
+        return
+    sess.reply(f"200 OK{port_field(lease)}")
+    try:
+        with data_conn(sess, lease) as data_sock:
+            for chunk in coalesce(iter_listing(opts)):
                 data_sock.sendall(chunk)
+                sess.sent += len(chunk)
+    except OSError:
+        sess.reply("426 Connection closed; transfer aborted")
+        return
+    sess.reply("226 Listing complete")
+
+def handle_get(sess, fn, args=()):
+    name = os.path.basename(fn)
+    path = os.path.join(BASE_DIR, name)
+    try:
+        st = os.stat(path) if valid_name(name) else None
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        sess.reply("550 File not found")
+        return
+    size = st.st_size
+    if len(args) >= 2 and args[0].upper() == "STREAMS":
+        try:
+            streams = int(args[1])
+        except ValueError:
+            streams = 0
+        if streams < 1 or sess.rest:
+            sess.reply("501 Usage: GET <name> STREAMS <n> (not combinable with REST)")
+            return
+        handle_get_ranges(sess, path, size, streams)
+        return
+    offset = sess.rest
+    if offset > size:
+        sess.reply("550 Restart offset is past end of file")
+        return
+    try:
+        lease = lease_data(sess)
+    except Exception:
+        sess.reply("425 Can't open data connection")
+        return
+    data = _content_cache.get(name, path, st) if sess.compress is None else None
+    if data is not None:
+        send_cached(sess, lease, name, st, data, offset)
+        return
+    codec = pick_codec(sess, path, size, offset)
+    # In mmap mode the announced SIZE is the mapping's, so it matches what gets sent.
+    mapping = _map_cache.acquire(name, path) if GET_MODE == "mmap" and not codec else None
+    if mapping is not None:
+        size = mapping.size
+    sess.reply(f"200 OK{port_field(lease)} SIZE {size}" + (f" REST {offset}" if offset else "")
+               + (f" COMPRESS {codec[0]}" if codec else ""))
+    algo = sess.digest
+    digest = None
+    try:
+        with contextlib.ExitStack() as stack:
+            data_sock = stack.enter_context(data_conn(sess, lease))
+            if mapping is not None:
+                f, st = None, mapping.st
+            else:
+                f = stack.enter_context(open(path, "rb"))
+                st = os.fstat(f.fileno())
+            digest = _digest_cache.get(name, st, algo) if algo else None
+            hasher = integrity.new(algo) if algo and digest is None else None
+            if hasher and offset:
+                if mapping is not None:
+                    hasher.update(mapping.view[:offset])
+                else:
+                    integrity.update_from_file(hasher, f.fileno(), 0, offset)
+            if mapping is not None:
+                sent = send_mapped(data_sock, mapping.view, offset, max(0, size - offset), hasher)
+            elif codec:
+                sent = send_compressed(data_sock, f, offset, size - offset, codec, hasher)
+            else:
+                sent = send_file(data_sock, f, offset, size - offset, hasher)
+            sess.sent += sent
+            if hasher:
+                digest = hasher.hexdigest()
+                if sent == size - offset == st.st_size - offset:
+                    _digest_cache.put(name, st, algo, digest)
+    except OSError:
+        # Client dropped or stalled; the session survives so it can REST and retry.
+        sess.reply("426 Connection closed; transfer aborted")
+        return
     finally:
+        if mapping is not None:
+            _map_cache.release(mapping)
+    sess.reply("226 Transfer complete" + digest_field(algo, digest))
+
+def send_cached(sess, lease, name, st, data, offset):
+    """GET of a small file held by the content cache: one sendall, no open() or read loop."""
+    offset = min(offset, len(data))
+    sess.reply(f"200 OK{port_field(lease)} SIZE {len(data)}" + (f" REST {offset}" if offset else ""))
+    algo = sess.digest
+    digest = _digest_cache.get(name, st, algo) if algo else None
+    try:
+        with data_conn(sess, lease) as data_sock:
+            data_sock.sendall(data[offset:])
+            sess.sent += len(data) - offset
+    except OSError:
+        sess.reply("426 Connection closed; transfer aborted")
+        return
+    if algo and digest is None:
+        hasher = integrity.new(algo)
+        hasher.update(data)
+        digest = hasher.hexdigest()
+        if len(data) == st.st_size:
+            _digest_cache.put(name, st, algo, digest)
+    sess.reply("226 Transfer complete" + digest_field(algo, digest))
+
+def send_mapped(data_sock, view, offset, count, hasher=None):
+    """
+    Send `count` bytes of a mapped file (MapCache) from offset as memoryview slices: the
+    bytes go from the shared page-cache mapping to the socket without a Python copy.
+    The file goes out in READ_CHUNK slices so DATA_TIMEOUT bounds each slice (a stalled
+    client) rather than the whole file; with a hasher each slice is hashed after it is sent.
+    """
+    sent = 0
+    while sent < count:
+        n = min(integrity.READ_CHUNK, count - sent)
+        data_sock.sendall(view[offset + sent:offset + sent + n])
+        if hasher is not None:
+            hasher.update(view[offset + sent:offset + sent + n])
+        sent += n
+    return sent
+
+def pick_codec(sess, path, size, offset):
+    """The session's MODE Z (algorithm, level) if sampling says this file compresses, else None."""
+    if sess.compress is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return sess.compress if compression.worth_compressing(f.fileno(), size, offset) else None
+    except OSError:
+        return None
+
+def send_compressed(data_sock, f, offset, count, codec, hasher=None):
+    """
+    Stream `count` bytes of f from offset through the MODE Z compressor; the sendfile path
+    can't apply here. Returns the number of uncompressed bytes sent.
+    """
+    comp = compression.compressor(*codec)
+    f.seek(offset)
+    left = count
+    while left:
+        chunk = f.read(min(COMPRESS_CHUNK, left))
+        if not chunk:
+            break
+        left -= len(chunk)
+        if hasher:
+            hasher.update(chunk)
+        out = comp.compress(chunk)
+        if out:
+            data_sock.sendall(out)
+    data_sock.sendall(comp.flush())
+    return count - left
+
+def open_range_listeners(ranges):
+    """Lease one passive listener per (offset, length); returns [(sock, port, offset, length)] or None."""
+    leased = []
+    try:
+        for off, length in ranges:
+            d, port = open_data_listener()
+            leased.append((d, port, off, length))
+    except Exception:
+        for d, port, _, _ in leased:
+            close_data_listener(d, port)
+        return None
+    return leased
+
+def run_range_streams(sess, leased, worker):
+    """
+    Run worker(data_sock, offset, length) for every leased range on its own thread,
+    accepting each data connection there. Returns True when every stream succeeded.
+    The streams share the session's rate limit.
+    """
+    failed = []
+
+    def stream(d, port, off, length):
+        data_sock = None
         try:
-            data_sock.close()
-        except:
-            pass
-        d.close()
-    send_line(ctrl, "226 Transfer complete")
+            data_sock = accept_data(d)
+            if not worker(throttled(sess, data_sock), off, length):
+                failed.append(off)
+        except OSError:
+            failed.append(off)
+        finally:
+            if data_sock is not None:
+                data_sock.close()
+            close_data_listener(d, port)
 
-def handle_put(ctrl, fn, nbytes):
+    threads = [threading.Thread(target=stream, args=item, daemon=True) for item in leased]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return not failed
+
+def handle_get_ranges(sess, path, size, streams):
+    """GET <name> STREAMS <n>: serve byte ranges of one file on n data connections at once."""
+    leased = open_range_listeners(protocol.split_ranges(size, streams))
+    if leased is None:
+        sess.reply("425 Can't open data connection")
+        return
+    sess.reply(f"200 OK SIZE {size} RANGES {protocol.format_ranges((p, o, n) for _, p, o, n in leased)}")
+
+    mapping = _map_cache.acquire(os.path.basename(path), path) if GET_MODE == "mmap" else None
+
+    def send_range(data_sock, off, length):
+        if mapping is not None and mapping.size == size:
+            return send_mapped(data_sock, mapping.view, off, length) == length
+        with open(path, "rb") as f:
+            return send_file(data_sock, f, off, length) == length
+
+    try:
+        ok = run_range_streams(sess, leased, send_range)
+    finally:
+        if mapping is not None:
+            _map_cache.release(mapping)
+    if ok:
+        sess.reply("226 Transfer complete")
+    else:
+        sess.reply("426 Connection closed; transfer aborted")
+
+def parse_size(nbytes):
+    """The byte count of a PUT/SYNC "SIZE <n>" argument, or None unless it is an integer that fits an off_t."""
+    n = int(nbytes) if nbytes.isascii() and nbytes.isdigit() else -1
+    return n if 0 <= n < 1 << 63 else None
+
+def handle_put(sess, fn, nbytes, args=()):
     name = os.path.basename(fn)
-    path = os.path.join(BASE_DIR, name)
-    n = int(nbytes)
-    lock = _file_locks[name]
-    if not lock.acquire(blocking=False):
-        send_line(ctrl, "550 File is currently being uploaded")
+    n = parse_size(nbytes)
+    if n is None:
+        sess.reply("501 Usage: PUT <name> SIZE <n> (n: byte count)")
+        return
+    if not valid_name(name):
+        sess.reply("550 Invalid file name (names may not start with '.')")
+        return
+    offset = sess.rest
+    streams = 1
+    codec = None
+    if len(args) >= 2 and args[0].upper() == "COMPRESS":
+        codec = args[1].lower()
+        if codec not in compression.ALGORITHMS:
+            sess.reply(f"501 Unknown compression {args[1]}")
+            return
+    elif len(args) >= 2 and args[0].upper() == "STREAMS":
+        try:
+            streams = int(args[1])
+        except ValueError:
+            streams = 0
+        if streams < 1 or offset:
+            sess.reply("501 Usage: PUT <name> SIZE <n> STREAMS <k> (not combinable with REST)")
+            return
+    lock = try_file_lock(name)
+    if lock is None:
+        sess.reply("550 File is currently being uploaded")
         return
     try:
+        tmp_path = partial_upload_path(name)
+        if streams > 1:
+            if handle_put_ranges(sess, name, tmp_path, n, streams, lock):
+                lock = None  # handed to store_later
+            return
+        if offset:
+            have = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+            if offset > have or offset > n:
+                sess.reply("550 No partial upload to resume at that offset")
+                return
         try:
-            d, port = open_data_listener()
+            lease = lease_data(sess)
         except Exception:
-            send_line(ctrl, "425 Can't open data connection")
+            sess.reply("425 Can't open data connection")
             return
-        send_line(ctrl, f"200 OK PORT {port}")
+        sess.reply(f"200 OK{port_field(lease)}")
+        got = offset
+        stored = oversize = False
+        hasher = integrity.new(sess.digest) if sess.digest else None
+        content = content_hasher(sess, hasher)
+        hashers = [h for h in (hasher, content) if h is not None]
+        if content is hasher:
+            hashers = hashers[:1]
+        try:
+            with data_conn(sess, lease) as data_sock, open(tmp_path, "r+b" if offset else "wb") as f:
+                f.truncate(offset)
+                for h in hashers if offset else ():
+                    integrity.update_from_file(h, f.fileno(), 0, offset)
+                writer = UploadWriter(f.fileno(), offset, n, BUFFER_SIZE, FSYNC_MODE, FSYNC_INTERVAL, PREALLOCATE)
+                try:
+                    if codec:
+                        # SIZE and REST count uncompressed bytes; the zlib/lzma stream marks its own end.
+                        for piece in compression.iter_decompressed(data_sock, codec, n - got):
+                            if got + len(piece) > n:
+                                oversize = True  # more than announced; nothing past SIZE is written
+                                break
+                            writer.write(piece)
+                            for h in hashers:
+                                h.update(piece)
+                            got += len(piece)
+                    if not codec and got < n:
+                        chunk = buffers.AdaptiveChunk(min(BUFFER_SIZE, n - got))
+                        while got < n:
+                            view = writer.buffer()
+                            k = data_sock.recv_into(view[:min(chunk.size, n - got)])
+                            if not k:
+                                break
+                            for h in hashers:
+                                h.update(view[:k])
+                            writer.submit(k)
+                            got += k
+                            chunk.record(k)
+                finally:
+                    got = writer.close()  # what reached the file, which is what REST resumes from
+                    with _upload_stats_lock:
+                        _upload_stats["disk_wait_seconds"] += writer.wait_seconds
+                if got == n and not oversize:
+                    writer.sync()  # before commit_upload's os.replace
+                    stored = True
+                    with _upload_stats_lock:
+                        _upload_stats["fsyncs"] += writer.fsyncs
+        except (OSError, zlib.error, lzma.LZMAError):
+            pass  # short upload; whatever arrived stays in the partial file for REST
+        sess.received += max(0, got - offset)
+        if stored:
+            commit_upload(tmp_path, name, synced=True, digest=content.hexdigest() if content else None)
+            digest = None
+            if hasher:
+                digest = hasher.hexdigest()
+                _digest_cache.put(name, os.stat(os.path.join(BASE_DIR, name)), sess.digest, digest)
+            sess.reply("226 File stored" + digest_field(sess.digest, digest))
+        elif oversize:
+            os.remove(tmp_path)
+            sess.reply(f"552 Upload exceeds declared SIZE {n} (discarded)")
+        else:
+            sess.reply(f"550 Incomplete upload ({got} of {n} bytes kept, resume with REST {got})")
+    finally:
+        if lock is not None:
+            lock.release()
+
+def recv_range(data_sock, fd, off, length):
+    """Receive exactly length bytes and pwrite them at offset off of fd; True if all arrived."""
+    buf = bytearray(min(max(length, 1), 1 << 20))
+    view = memoryview(buf)
+    got = 0
+    while got < length:
+        k = data_sock.recv_into(view[:min(len(buf), length - got)])
+        if not k:
+            break
+        os.pwrite(fd, view[:k], off + got)
+        got += k
+    return got == length
+
+def allocate_upload(tmp_path, size):
+    """
+    Create tmp_path reserved to size bytes and return its fd. On failure (a full disk, a size
+    past the file system's limit) the temp file is removed and the OSError raised.
+    """
+    fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if size and hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    except OSError:
+        os.close(fd)
+        os.remove(tmp_path)
+        raise
+    return fd
+
+def handle_put_ranges(sess, name, tmp_path, size, streams, lock):
+    """
+    PUT <name> SIZE <n> STREAMS <k>: receive byte ranges on k data connections at once,
+    pwrite each into a preallocated temp file and commit it with one os.replace.
+    The caller holds the per-name upload lock for the whole assembly. In CAS mode the
+    ranges can't be hashed in order as they arrive, so the file is committed unhashed and
+    the lock goes to a store_later thread; returns True when it did.
+    """
+    leased = open_range_listeners(protocol.split_ranges(size, streams))
+    if leased is None:
+        sess.reply("425 Can't open data connection")
+        return
+    try:
+        fd = allocate_upload(tmp_path, size)
+    except OSError as e:
+        for d, port, _, _ in leased:
+            close_data_listener(d, port)
+        sess.reply("552 Not enough space for upload" if e.errno in (errno.ENOSPC, errno.EFBIG, errno.EDQUOT)
+                   else f"550 Can't create upload file ({e.strerror})")
+        return
+    try:
+        sess.reply(f"200 OK RANGES {protocol.format_ranges((p, o, n) for _, p, o, n in leased)}")
+        ok = run_range_streams(sess, leased, lambda data_sock, off, length: recv_range(data_sock, fd, off, length))
+    finally:
+        os.close(fd)
+    if not ok:
+        # Ranges land out of order, so a half-assembled file is useless for REST.
+        os.remove(tmp_path)
+        sess.reply("550 Incomplete upload (parallel upload discarded)")
+        return False
+    commit_upload(tmp_path, name, hash_later=True)
+    if _store is not None:
+        threading.Thread(target=store_later, args=(name, lock), daemon=True).start()
+    sess.reply("226 File stored")
+    return _store is not None
+
+def resolve_batch(patterns):
+    """Expand MGET arguments (names or globs) against the LS index, in order and without repeats."""
+    names = sorted(row[0] for row in _dir_index.snapshot())
+    seen = set()
+    out = []
+    for pat in patterns:
+        pat = os.path.basename(pat)
+        hits = fnmatch.filter(names, pat) if any(ch in pat for ch in "*?[") else [pat]
+        for name in hits:
+            if name not in seen:
+                seen.add(name)
+                out.append(name)
+    return out
+
+def send_batch(data_sock, names):
+    """
+    Write names as a framed stream (see shared/protocol.py). Small files are read whole
+    and packed into one send with their neighbours; larger ones go through send_file.
+    Returns (files sent, files skipped).
+    """
+    pending = bytearray()
+    sent = skipped = 0
+    for name in names:
         try:
-            data_sock, _ = d.accept()
-            got = 0
-            tmp_path = f"{path}.upload.{threading.get_ident()}"
-            with open(tmp_path, "wb") as f:
-                while got < n:
-                    chunk = data_sock.recv(min(BUFFER_SIZE, n - got))
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    got += len(chunk)
+            f = open(os.path.join(BASE_DIR, name), "rb")
+        except OSError:
+            pending += protocol.frame_error(name, "File not found")
+            skipped += 1
+            continue
+        with f:
+            data = f.read(protocol.BATCH_COALESCE + 1)
+            if len(data) <= protocol.BATCH_COALESCE:
+                pending += protocol.frame_header(name, len(data))
+                pending += data
+            else:
+                size = os.fstat(f.fileno()).st_size
+                pending += protocol.frame_header(name, size)
+                data_sock.sendall(pending)
+                pending.clear()
+                f.seek(0)
+                if send_file(data_sock, f, 0, size) != size:
+                    raise OSError(f"{name} changed size during MGET")
+        sent += 1
+        if len(pending) >= protocol.BATCH_COALESCE:
+            data_sock.sendall(pending)
+            pending.clear()
+    pending += protocol.FRAME_END
+    data_sock.sendall(pending)
+    return sent, skipped
+
+def handle_mget(sess, patterns):
+    names = resolve_batch(patterns)
+    if not names:
+        sess.reply("550 No files matched")
+        return
+    try:
+        lease = lease_data(sess)
+    except Exception:
+        sess.reply("425 Can't open data connection")
+        return
+    sess.reply(f"200 OK{port_field(lease)} COUNT {len(names)}")
+    try:
+        with data_conn(sess, lease) as data_sock:
+            sent, skipped = send_batch(data_sock, names)
+    except OSError:
+        sess.reply("426 Connection closed; transfer aborted")
+        return
+    sess.reply(f"226 Transfer complete ({sent} files, {skipped} skipped)")
+
+def store_frame(rfile, name, size):
+    """
+    Store one MPUT frame body under the same per-name lock and temp + os.replace path as PUT.
+    An invalid name, or one that is being uploaded elsewhere, is drained and reported as not
+    stored (False). Raises ValueError if the stream ends inside the frame.
+    """
+    lock = try_file_lock(name) if valid_name(name) else None
+    locked = lock is not None
+    try:
+        tmp_path = partial_upload_path(name)
+        out = open(tmp_path, "wb") if locked else None
+        content = integrity.new("sha256") if locked and _store is not None else None
+        try:
+            left = size
+            while left:
+                chunk = rfile.read(min(left, protocol.BATCH_COALESCE))
+                if not chunk:
+                    raise ValueError(f"stream ended inside {name}")
+                if out is not None:
+                    out.write(chunk)
+                if content is not None:
+                    content.update(chunk)
+                left -= len(chunk)
         finally:
-            try:
-                data_sock.close()
-            except:
-                pass
-            d.close()
-        if got == n:
-            os.replace(tmp_path, path)
-            send_line(ctrl, "226 File stored")
+            if out is not None:
+                out.close()
+        if locked:
+            commit_upload(tmp_path, name, digest=content.hexdigest() if content else None)
+        return locked
+    finally:
+        if locked:
+            lock.release()
+
+def handle_mput(sess):
+    try:
+        lease = lease_data(sess)
+    except Exception:
+        sess.reply("425 Can't open data connection")
+        return
+    sess.reply(f"200 OK{port_field(lease)}")
+    stored = 0
+    failed = []
+    try:
+        with data_conn(sess, lease) as data_sock, data_sock.makefile("rb") as rfile:
+            while (frame := protocol.read_frame_header(rfile)) is not None:
+                kind, name, size = frame
+                name = os.path.basename(name)
+                if kind == "F" and store_frame(rfile, name, size):
+                    stored += 1
+                else:
+                    failed.append(name)
+    except (OSError, ValueError):
+        # Files committed before the break stay stored; the rest must be sent again.
+        sess.reply(f"426 Connection closed; transfer aborted ({stored} files stored)")
+        return
+    if failed:
+        sess.reply(f"550 Batch incomplete ({stored} stored, {len(failed)} not stored, first: {failed[0]})")
+    else:
+        sess.reply(f"226 Files stored ({stored} files)")
+
+def handle_check(sess, args):
+    """CHECK <sha256>: does the content store already hold this content? 213 <size> or 550."""
+    if _store is None:
+        sess.reply("502 Content store not enabled (FTP_STORAGE=cas)")
+        return
+    digest = args[0].lower()
+    if not is_sha256(digest):
+        sess.reply("501 Usage: CHECK <sha256 hex>")
+        return
+    size = _store.size_of(digest)
+    sess.reply(f"213 {size}" if size is not None else "550 Content not stored")
+
+def handle_link(sess, fn, digest):
+    """LINK <name> <sha256>: store name as a reference to content the server already holds."""
+    if _store is None:
+        sess.reply("502 Content store not enabled (FTP_STORAGE=cas)")
+        return
+    name = os.path.basename(fn)
+    digest = digest.lower()
+    if not is_sha256(digest):
+        sess.reply("501 Usage: LINK <name> <sha256 hex>")
+        return
+    if not valid_name(name):
+        sess.reply("550 Invalid file name (names may not start with '.')")
+        return
+    lock = try_file_lock(name)
+    if lock is None:
+        sess.reply("550 File is currently being uploaded")
+        return
+    try:
+        if _store.link(digest, partial_upload_path(name), os.path.join(BASE_DIR, name)):
+            sync_dirs()
+            sess.reply("226 File stored (linked)")
         else:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-            send_line(ctrl, "550 Incomplete upload")
+            sess.reply("550 Content not stored")
     finally:
         lock.release()
-            
+
+def handle_sync(sess, fn, nbytes):
+    """
+    SYNC <name> SIZE <n>: update an existing file by delta (rsync-style, see shared/delta.py).
+    One data connection carries both directions: block signatures of the server's copy go
+    out, then COPY/LITERAL ops come back and are assembled into a temp file that is
+    verified against the client's sha256 and committed like any upload.
+    """
+    name = os.path.basename(fn)
+    path = os.path.join(BASE_DIR, name)
+    n = parse_size(nbytes)
+    if n is None:
+        sess.reply("501 Usage: SYNC <name> SIZE <n> (n: byte count)")
+        return
+    if not valid_name(name) or not os.path.isfile(path):
+        sess.reply("550 File not found")
+        return
+    lock = try_file_lock(name)
+    if lock is None:
+        sess.reply("550 File is currently being uploaded")
+        return
+    try:
+        tmp_path = partial_upload_path(name)
+        with open(path, "rb") as src:
+            size = os.fstat(src.fileno()).st_size
+            block_size = delta.block_size_for(size)
+            sigs = delta.signatures(src, block_size)
+            try:
+                lease = lease_data(sess)
+            except Exception:
+                sess.reply("425 Can't open data connection")
+                return
+            sess.reply(f"200 OK{port_field(lease)} SIZE {size} BLOCK {block_size} "
+                       f"COUNT {len(sigs) // delta.SIGNATURE.size}")
+            fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            content = integrity.new("sha256")  # hashed as the ops are applied, not read back afterwards
+            try:
+                with data_conn(sess, lease) as data_sock:
+                    data_sock.sendall(sigs)
+                    written, literal, claimed = delta.apply_delta(data_sock, src.fileno(), fd, content)
+            except (OSError, ValueError):
+                written = None
+            finally:
+                os.close(fd)
+        if written is None:
+            os.remove(tmp_path)
+            sess.reply("426 Connection closed; transfer aborted")
+            return
+        if written != n or content.digest() != claimed:
+            os.remove(tmp_path)
+            sess.reply("550 Sync verification failed (file unchanged)")
+            return
+        commit_upload(tmp_path, name, digest=content.hexdigest())
+        sess.reply(f"226 File synced ({literal} literal bytes, {written - literal} reused)")
+    finally:
+        lock.release()
+
+def handle_size(sess, args):
+    """SIZE <name> reports a stored file; SIZE <name> PARTIAL reports a resumable upload."""
+    name = os.path.basename(args[0])
+    if len(args) >= 2 and args[1].upper() == "PARTIAL":
+        path = partial_upload_path(name)
+    else:
+        path = os.path.join(BASE_DIR, name)
+    if not os.path.isfile(path):
+        sess.reply("550 File not found")
+        return
+    sess.reply(f"213 {os.path.getsize(path)}")
+
+def handle_rest(sess, arg):
+    try:
+        offset = int(arg)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        sess.reply("501 REST needs a non-negative byte offset")
+        return
+    sess.rest = offset
+    sess.reply(f"350 Restarting at {offset}")
 
 def handle_client(c, addr):
+    sess = Session(c, addr)
+    lines = LineReader(c, MAX_LINE, CONTROL_BUFFER)
+    _metrics.session_started()
+    # Replies come in pairs (200 ... 226) with no client write in between; without NODELAY
+    # the second one waits for the client's delayed ACK (~40 ms per transfer).
+    c.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     try:
         # Send welcome message
-        send_line(c, "220 Welcome to Simple FTP Server")
+        sess.reply("220 Welcome to Simple FTP Server")
         
         while True:
-            buf = b""
-            while not buf.endswith(b"\n"):
-                part = c.recv(BUFFER_SIZE)
-                if not part:
-                    return
-                buf += part
-            line = buf.decode("utf-8").strip()
+            # Commands pipelined into one segment stay buffered in the reader and run in order.
+            try:
+                raw = lines.readline()
+            except LineTooLong:
+                sess.reply(f"500 Command line too long (max {MAX_LINE} bytes)")
+                continue
+            if raw is None:
+                return
+            line = raw.decode("utf-8").strip()
             if not line:
                 continue
             parts = line.split()
             cmd = parts[0].upper()
+            t0 = time.perf_counter()
+            sess.sent = sess.received = 0
             if cmd == "LS":
-                handle_ls(c)
+                handle_ls(sess, parts[1:])
             elif cmd == "GET" and len(parts) >= 2:
-                handle_get(c, parts[1])
+                handle_get(sess, parts[1], parts[2:])
             elif cmd == "PUT" and len(parts) >= 4 and parts[2].upper() == "SIZE":
-                handle_put(c, parts[1], parts[3])
+                handle_put(sess, parts[1], parts[3], parts[4:])
+            elif cmd == "MGET" and len(parts) >= 2:
+                handle_mget(sess, parts[1:])
+            elif cmd == "MPUT":
+                handle_mput(sess)
+            elif cmd == "CHECK" and len(parts) >= 2:
+                handle_check(sess, parts[1:])
+            elif cmd == "LINK" and len(parts) >= 3:
+                handle_link(sess, parts[1], parts[2])
+            elif cmd == "SYNC" and len(parts) >= 4 and parts[2].upper() == "SIZE":
+                handle_sync(sess, parts[1], parts[3])
+            elif cmd == "STAT":
+                handle_stat(sess)
+            elif cmd == "DIGEST":
+                handle_digest(sess, parts[1:])
+            elif cmd == "MODE":
+                handle_mode(sess, parts[1:])
+            elif cmd == "REST" and len(parts) >= 2:
+                handle_rest(sess, parts[1])
+                continue
+            elif cmd == "SIZE" and len(parts) >= 2:
+                handle_size(sess, parts[1:])
+            elif cmd == "NOOP":
+                sess.reply("200 NOOP ok")
             elif cmd == "EXIT":
-                send_line(c, "221 Goodbye")
+                sess.reply("221 Goodbye")
                 return
             else:
-                send_line(c, "500 Unknown command")
+                sess.reply("500 Unknown command")
+            if cmd in METERED_COMMANDS:
+                _metrics.observe(cmd, time.perf_counter() - t0, sess.sent, sess.received)
+            sess.rest = 0
     finally:
+        _metrics.session_ended()
+        drop_data_channel(sess)
         try: c.close()
         except: pass
 
+def refuse(c, addr=None):
+    """Turn a control connection away with 421 instead of the banner."""
+    try:
+        send_line(c, "421 Too many connections")
+    except OSError:
+        pass
+    c.close()
+
+def serve(s):
+    """Accept control connections on the listening socket s and hand them to the worker pool."""
+    pool = SessionPool(handle_client, WORKERS, MAX_PENDING, MAX_QUEUE_WAIT, refuse)
+    _metrics.register("session_pool", pool.stats)
+    if POOL_STATS_INTERVAL > 0:
+        threading.Thread(target=pool.report_forever, args=(POOL_STATS_INTERVAL,), daemon=True).start()
+    while True:
+        c, addr = s.accept()
+        if not pool.submit(c, addr):
+            refuse(c)
+
+def control_socket(reuse_port=False, listen=True):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if reuse_port:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind((HOST, CONTROL_PORT))
+    if listen:
+        s.listen(LISTEN_BACKLOG)
+    return s
+
+def run_engine(s, metrics_port):
+    _port_pool.refill()
+    if metrics_port:
+        serve_http(_metrics, METRICS_HOST, metrics_port)
+        print(f"[SERVER] Metrics at http://{METRICS_HOST}:{metrics_port}/metrics")
+    if ENGINE == "asyncio":
+        from server import async_server
+        async_server.serve(s)
+    else:
+        serve(s)
+
+def run_worker(index, count, shared):
+    """
+    Body of pre-forked worker `index` of `count`: take this worker's slice of the data-port
+    range, open its own SO_REUSEPORT listener (or use the shared one) and serve until killed.
+    """
+    global _port_pool
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    lo, hi = port_slice(DATA_PORT_MIN, DATA_PORT_MAX, index, count)
+    _port_pool = PortPool(lo, hi, PREBOUND_PORTS, SOCKET_SNDBUF, SOCKET_RCVBUF)
+    _metrics.register("port_pool", _port_pool.stats)
+    s = shared if shared is not None else control_socket(reuse_port=True)
+    print(f"[SERVER] Worker {index} (pid {os.getpid()}) serving, data ports {lo}-{hi}", flush=True)
+    run_engine(s, METRICS_PORT + index if METRICS_PORT else 0)
+
+def run_processes(count):
+    """
+    Pre-fork `count` workers and restart any that dies. With SO_REUSEPORT each worker binds
+    its own listener and the kernel spreads new connections across them; the parent only
+    keeps a bound, non-listening socket to reserve the port. Without it the workers accept
+    on one listener inherited over fork. SIGTERM/SIGINT to the parent stop all workers.
+    """
+    reuse = hasattr(socket, "SO_REUSEPORT")
+    anchor = control_socket(reuse_port=reuse, listen=not reuse)
+    shared = None if reuse else anchor
+    print(f"[SERVER] Listening on {HOST}:{CONTROL_PORT} ({ENGINE} engine, {count} processes, "
+          f"{'SO_REUSEPORT' if reuse else 'shared listener'})", flush=True)
+    workers = {}  # pid -> (index, start time)
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(index, count, shared)
+            except Exception:
+                sys.excepthook(*sys.exc_info())
+            finally:
+                sys.stdout.flush()
+                os._exit(1)
+        workers[pid] = (index, time.monotonic())
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for index in range(count):
+            spawn(index)
+        while workers:
+            pid, status = os.wait()
+            index, started = workers.pop(pid, (None, 0))
+            if index is None:
+                continue
+            print(f"[SERVER] Worker {index} (pid {pid}) exited with status {status}", flush=True)
+            if time.monotonic() - started > 1:
+                spawn(index)  # a worker that dies at startup would only die again
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in workers:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        for pid in workers:
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+        anchor.close()
+
 def main():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, CONTROL_PORT))
-        s.listen(5)
-        print(f"[SERVER] Listening on {HOST}:{CONTROL_PORT}")
-        while True:
-            c, addr = s.accept()
-            t = threading.Thread(target=handle_client, args=(c, addr), daemon=True)
-            t.start()
+    if PROCESSES > 1:
+        run_processes(PROCESSES)
+        return
+    with control_socket() as s:
+        print(f"[SERVER] Listening on {HOST}:{CONTROL_PORT} ({ENGINE} engine)")
+        run_engine(s, METRICS_PORT)
 
 if __name__ == "__main__":
+    # Run as a script, this module is __main__; register it under its package name so that
+    # async_server's "from server import ftp_server" gets this copy (its port pool, metrics,
+    # caches and index) instead of importing a second one.
+    sys.modules.setdefault("server.ftp_server", sys.modules[__name__])
     main()
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Open, memory-mapped hot files for FTP_GET_MODE=mmap.
+
+The first GET of a file maps it read-only; later GETs of the same file, concurrent or not,
+lease that one mapping and send memoryview slices of it, so there is no open()/read() per
+request and every reader shares the same page-cache pages. Entries are kept in an LRU
+bounded by total mapped bytes; files bigger than the whole budget are not cached.
+
+A lease is validated with os.stat: a different inode, size or mtime (an upload committed
+with os.replace, an external edit) remaps the file. commit_upload also calls invalidate()
+so the stale mapping is dropped at once. An evicted or replaced mapping stays open until
+its last lease is released, so a transfer in flight never loses its pages.
+
+Requirement: BASE_DIR must only be modified through the server. Uploads never write a
+served file in place, but a file truncated in place by another program while a GET sends
+from its mapping raises SIGBUS, which kills the whole server process, not just one
+session. Revalidation only happens when a lease is taken, so it can't prevent this.
+Use the default sendfile mode when other programs edit files in BASE_DIR.
+"""
+
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+class Mapping:
+    """One mapped file: view covers the whole file, st is the os.stat it was mapped at."""
+
+    def __init__(self, path, st):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_WILLNEED"):
+            self._mm.madvise(mmap.MADV_WILLNEED)
+        self.view = memoryview(self._mm)
+        self.st = st
+        self.size = st.st_size
+        self.leases = 0
+        self.retired = False  # evicted or replaced: close when the last lease is released
+
+    def close(self):
+        self.view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # a slice is still referenced somewhere; the pages are unmapped when it goes away
+
+def _same_file(a, b):
+    return (a.st_ino, a.st_dev, a.st_size, a.st_mtime_ns) == (b.st_ino, b.st_dev, b.st_size, b.st_mtime_ns)
+
+class MapCache:
+    def __init__(self, capacity):
+        self.capacity = capacity  # bytes of mapped files to keep
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # name -> Mapping
+        self.mapped = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def acquire(self, name, path):
+        """
+        Lease the mapping of path (cached under name); None if the file is missing, empty or
+        too big to cache. Hand it back with release().
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_size == 0 or st.st_size > self.capacity:
+            return None
+        with self._lock:
+            m = self._entries.get(name)
+            if m is not None and _same_file(m.st, st):
+                self._entries.move_to_end(name)
+                self.hits += 1
+                m.leases += 1
+                return m
+            if m is not None:
+                self._drop(name)
+                self.invalidations += 1
+            self.misses += 1
+            try:
+                m = Mapping(path, st)
+            except (OSError, ValueError):
+                return None
+            self._entries[name] = m
+            self.mapped += m.size
+            while self.mapped > self.capacity:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            m.leases += 1
+            return m
+
+    def release(self, m):
+        with self._lock:
+            m.leases -= 1
+            if m.retired and not m.leases:
+                m.close()
+
+    def invalidate(self, name):
+        """Forget name's mapping (its file was just replaced)."""
+        with self._lock:
+            if name in self._entries:
+                self._drop(name)
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "mapped_bytes": self.mapped,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, name):
+        m = self._entries.pop(name)
+        self.mapped -= m.size
+        m.retired = True
+        if not m.leases:
+            m.close()
@@ -0,0 +1,123 @@
+"""
+Server metrics in the Prometheus text format.
+
+Command handlers are timed by handle_client into per-command latency histograms, and
+report the data bytes they moved into per-command counters (bytes/s is the rate of
+ftp_data_bytes_total, or bytes_total / duration_seconds_sum per transfer). Other
+components register a collector: a callable returning {name: number} that is read at
+render time, so the session pool, port pool, locks, caches and throttles cost nothing
+between scrapes.
+
+render() is served by the STAT command over a data connection (like LS) and, with
+FTP_METRICS_PORT set, by a small HTTP endpoint at /metrics.
+"""
+
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the command latency buckets; +Inf is implied.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip([*map(str, self.bounds), "+Inf"], self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}                # command -> Histogram
+        self._bytes = defaultdict(int)    # (command, "sent"|"received") -> bytes
+        self._collectors = {}             # prefix -> callable returning {name: number}
+        self.sessions_active = 0
+        self.sessions_total = 0
+
+    def observe(self, command, seconds, sent=0, received=0):
+        """Record one finished command: its latency and the data bytes it moved."""
+        with self._lock:
+            hist = self._latency.get(command)
+            if hist is None:
+                hist = self._latency[command] = Histogram(LATENCY_BUCKETS)
+            hist.observe(seconds)
+            if sent:
+                self._bytes[command, "sent"] += sent
+            if received:
+                self._bytes[command, "received"] += received
+
+    def session_started(self):
+        with self._lock:
+            self.sessions_active += 1
+            self.sessions_total += 1
+
+    def session_ended(self):
+        with self._lock:
+            self.sessions_active -= 1
+
+    def register(self, prefix, collect):
+        """Export collect()'s numeric values as ftp_<prefix>_<name> gauges (replaces an earlier prefix)."""
+        self._collectors[prefix] = collect
+
+    def render(self):
+        """All metrics as Prometheus text exposition."""
+        out = ["# TYPE ftp_command_duration_seconds histogram"]
+        with self._lock:
+            for command, hist in sorted(self._latency.items()):
+                out.extend(hist.lines("ftp_command_duration_seconds", f'command="{command}"'))
+            out.append("# TYPE ftp_data_bytes_total counter")
+            for (command, direction), n in sorted(self._bytes.items()):
+                out.append(f'ftp_data_bytes_total{{command="{command}",direction="{direction}"}} {n}')
+            out.append("# TYPE ftp_sessions_active gauge")
+            out.append(f"ftp_sessions_active {self.sessions_active}")
+            out.append("# TYPE ftp_sessions_total counter")
+            out.append(f"ftp_sessions_total {self.sessions_total}")
+        for prefix, collect in sorted(self._collectors.items()):
+            try:
+                values = collect()
+            except Exception:
+                continue  # a broken collector must not take the endpoint down
+            for name, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    out.append(f"ftp_{prefix}_{name} {value}")
+        return "\n".join(out) + "\n"
+
+def serve_http(metrics, host, port):
+    """Serve metrics.render() at http://host:port/metrics on a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # scrapes every few seconds would drown the server log
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
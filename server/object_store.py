@@ -0,0 +1,150 @@
+"""
+Content-addressed storage for uploads (FTP_STORAGE=cas).
+
+Every distinct file content is stored once as <objects>/<sha256>; the visible names
+in BASE_DIR are hard links to those objects. Uploading content the server already
+has costs no extra disk, and the LINK command can create a name for it without any
+data transfer. Because names are hard links, GET/LS/sendfile need no changes.
+
+This only works because nothing ever writes to a name in place: uploads land in a
+temp file and are committed with os.replace, so replacing one name never touches
+the object other names share. An object is deleted once no name links to it.
+
+Uploads are hashed as they arrive, so commit() gets the sha256 without reading the file
+again. A parallel upload's ranges arrive out of order; its name is place()d as a plain
+file first and adopt()ed into the store once a background thread has hashed it.
+"""
+
+import os
+import string
+import threading
+
+from shared import integrity
+
+def is_sha256(text):
+    """True for a 64-digit lowercase hex string (the only names allowed under the objects dir)."""
+    return len(text) == 64 and all(ch in string.hexdigits and not ch.isupper() for ch in text)
+
+class ObjectStore:
+    def __init__(self, path, index):
+        self.path = path
+        self.index = index  # DirIndex of the directory the names live in
+        self._lock = threading.Lock()
+        self._by_inode = {}  # st_ino -> sha256 hex, for name -> hash lookups
+        os.makedirs(path, exist_ok=True)
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file():
+                    self._by_inode[entry.inode()] = entry.name
+        self.dedup_hits = 0
+
+    def object_path(self, digest):
+        return os.path.join(self.path, digest)
+
+    def size_of(self, digest):
+        """Size of the object with this sha256, or None if the store doesn't have it."""
+        if not is_sha256(digest):
+            return None
+        try:
+            return os.stat(self.object_path(digest)).st_size
+        except OSError:
+            return None
+
+    def digest_of(self, path):
+        """sha256 of the content a name links to, or None for a file that isn't in the store."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        digest = self._by_inode.get(st.st_ino)
+        if digest is not None and os.path.samestat(st, os.stat(self.object_path(digest))):
+            return digest
+        return None
+
+    def commit(self, tmp_path, path, digest=None):
+        """
+        Store a finished upload's content once and point path at it. digest is its sha256 hex
+        when the caller hashed it while receiving; without one the file is read and hashed here.
+        Returns the sha256.
+        """
+        if digest is None:
+            with open(tmp_path, "rb") as f:
+                digest = integrity.sha256_file(f).hexdigest()
+        obj = self.object_path(digest)
+        with self._lock:
+            try:
+                os.link(tmp_path, obj)
+                self._by_inode[os.stat(obj).st_ino] = digest
+            except FileExistsError:
+                # Known content: drop the upload and link the name to the existing object.
+                self.dedup_hits += 1
+                os.remove(tmp_path)
+                os.link(obj, tmp_path)
+            self._replace(tmp_path, path)
+        return digest
+
+    def place(self, tmp_path, path):
+        """Point path at an upload whose sha256 isn't known yet, as a plain file outside the store (see adopt)."""
+        with self._lock:
+            self._replace(tmp_path, path)
+
+    def adopt(self, path, digest, st, tmp_path):
+        """
+        Move a name placed as a plain file into the store once its sha256 is known: st is the
+        os.stat it was hashed under, and a name replaced since then is left alone (False).
+        Known content relinks the name to the existing object through tmp_path.
+        """
+        obj = self.object_path(digest)
+        with self._lock:
+            try:
+                cur = os.stat(path)
+            except FileNotFoundError:
+                return False
+            if not os.path.samestat(cur, st) or cur.st_mtime_ns != st.st_mtime_ns:
+                return False
+            try:
+                os.link(path, obj)
+                self._by_inode[cur.st_ino] = digest
+            except FileExistsError:
+                self.dedup_hits += 1
+                if os.path.lexists(tmp_path):
+                    os.remove(tmp_path)
+                os.link(obj, tmp_path)
+                self._replace(tmp_path, path)
+        return True
+
+    def link(self, digest, tmp_path, path):
+        """Point path at an existing object (LINK command). False if the store doesn't have it."""
+        obj = self.object_path(digest)
+        with self._lock:
+            if self.size_of(digest) is None:
+                return False
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            os.link(obj, tmp_path)
+            self.dedup_hits += 1
+            self._replace(tmp_path, path)
+        return True
+
+    def _replace(self, tmp_path, path):
+        try:
+            old = os.stat(path)
+        except FileNotFoundError:
+            old = None
+        self.index.commit(tmp_path, path)
+        if old is not None:
+            self._release(old)
+
+    def _release(self, st):
+        """Delete the object a replaced name pointed at if no other name links to it any more."""
+        digest = self._by_inode.get(st.st_ino)
+        if digest is None:
+            return
+        obj = self.object_path(digest)
+        try:
+            cur = os.stat(obj)
+        except FileNotFoundError:
+            return
+        if os.path.samestat(cur, st) and cur.st_nlink == 1:
+            os.remove(obj)
+            del self._by_inode[st.st_ino]
@@ -0,0 +1,113 @@
+"""
+Passive data-port allocator for the DATA_PORT_MIN..DATA_PORT_MAX window.
+
+Free ports wait in a FIFO, so a port that was just released cools down before it
+is handed out again, and every leased port is tracked until release() returns it.
+A few listeners are kept bound and listening ahead of time, so acquire() normally
+pops a ready socket and the "200 OK PORT" reply goes out without any bind().
+"""
+
+import socket
+import threading
+from collections import deque
+
+class PortPool:
+    def __init__(self, lo, hi, prebound=8, sndbuf=0, rcvbuf=0):
+        self.lo = lo
+        self.hi = hi
+        self.prebound = prebound
+        self.sndbuf = sndbuf  # SO_SNDBUF/SO_RCVBUF for the listeners (accepted sockets inherit them), 0 = kernel default
+        self.rcvbuf = rcvbuf
+        self._lock = threading.Lock()
+        self._free = deque(range(lo, hi + 1))
+        self._ready = deque()  # (sock, port) bound + listening, not yet leased
+        self._leased = {}      # port -> listening sock
+        self.bind_failures = 0
+
+    def acquire(self):
+        """Lease a listening socket; returns (sock, port)."""
+        with self._lock:
+            ready = self._ready.popleft() if self._ready else None
+        if ready is not None:
+            s, port = ready
+            _drop_stray_connections(s)
+        else:
+            s, port = self._bind_one()
+        with self._lock:
+            self._leased[port] = s
+        return s, port
+
+    def release(self, s, port):
+        """Close a leased listener, return its port to the free list and top up ready listeners."""
+        s.close()
+        with self._lock:
+            if self._leased.pop(port, None) is not None:
+                self._free.append(port)
+        self.refill()
+
+    def refill(self):
+        """Bind listeners until `prebound` are ready (runs after a transfer, off the reply path)."""
+        while True:
+            with self._lock:
+                if len(self._ready) >= self.prebound or not self._free:
+                    return
+            try:
+                ready = self._bind_one()
+            except OSError:
+                return
+            with self._lock:
+                self._ready.append(ready)
+
+    def _bind_one(self):
+        # Each free port is tried at most once; ports that fail (TIME_WAIT from a
+        # non-reusable socket, taken by another process) go to the back of the line.
+        with self._lock:
+            attempts = len(self._free)
+        for _ in range(attempts):
+            with self._lock:
+                if not self._free:
+                    break
+                port = self._free.popleft()
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.sndbuf:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+            if self.rcvbuf:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            try:
+                s.bind(("", port))
+                s.listen(1)
+                return s, port
+            except OSError:
+                s.close()
+                with self._lock:
+                    self._free.append(port)
+                    self.bind_failures += 1
+        raise OSError(f"No available data ports in range {self.lo}-{self.hi}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.hi - self.lo + 1,
+                "free": len(self._free),
+                "ready": len(self._ready),
+                "leased": len(self._leased),
+                "bind_failures": self.bind_failures,
+            }
+
+def _drop_stray_connections(s):
+    """Close anything that connected to a pre-bound listener before it was handed out."""
+    s.setblocking(False)
+    try:
+        while True:
+            conn, _ = s.accept()
+            conn.close()
+    except (BlockingIOError, InterruptedError):
+        pass
+    finally:
+        s.setblocking(True)
+
+def port_slice(lo, hi, index, count):
+    """The index-th of count disjoint, near-equal slices of lo..hi, as (lo, hi) inclusive."""
+    total = hi - lo + 1
+    return lo + total * index // count, lo + total * (index + 1) // count - 1
@@ -0,0 +1,148 @@
+"""
+Bounded worker pool for control sessions.
+
+The accept loop hands each connection to submit(); a fixed set of worker threads
+runs the session handler. Connections wait in a bounded FIFO when every worker is
+busy, and are refused once that queue is full, so a burst of clients can no longer
+create an unbounded number of threads. Workers can stay busy for as long as their
+interactive sessions last, so a connection that has waited max_wait seconds is
+handed to reject() (the server answers 421) instead of waiting until the client
+gives up on the banner.
+"""
+
+import collections
+import threading
+import time
+
+# Upper bounds (ms) of the queue-wait histogram buckets; the last bucket is open-ended.
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+class SessionPool:
+    def __init__(self, handler, workers, max_pending, max_wait=0, reject=None):
+        """reject(conn, addr) is called for connections that queued longer than max_wait seconds (0 = no limit)."""
+        self._handler = handler
+        self._reject = reject
+        self._pending = collections.deque()  # (conn, addr, queued_at), oldest first
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.sessions = 0  # queued + running; admission is capped at workers + max_pending
+        self.active = 0
+        self.served = 0
+        self.rejected = 0
+        self.expired = 0  # rejected after waiting max_wait in the queue
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+        if max_wait > 0 and reject is not None:
+            threading.Thread(target=self._expire_forever, daemon=True).start()
+
+    def submit(self, conn, addr):
+        """Queue a new session. Returns False (and queues nothing) when the pool is full."""
+        with self._lock:
+            if self.sessions >= self.workers + self.max_pending:
+                self.rejected += 1
+                return False
+            self.sessions += 1
+            self._pending.append((conn, addr, time.monotonic()))
+            self._ready.notify_all()
+        return True
+
+    def _record_wait(self, waited):
+        ms = waited * 1000
+        with self._lock:
+            self.served += 1
+            self.active += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if ms <= bound:
+                    self.wait_counts[i] += 1
+                    break
+            else:
+                self.wait_counts[-1] += 1
+
+    def _worker(self):
+        while True:
+            with self._ready:
+                while not self._pending:
+                    self._ready.wait()
+                conn, addr, queued_at = self._pending.popleft()
+            self._record_wait(time.monotonic() - queued_at)
+            try:
+                self._handler(conn, addr)
+            except Exception as e:
+                print(f"[SERVER] Session {addr} ended with error: {e!r}")
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.sessions -= 1
+
+    def _expire_forever(self):
+        """Hand connections that have waited max_wait seconds to reject(), oldest first."""
+        while True:
+            with self._ready:
+                while True:
+                    if self._pending:
+                        left = self._pending[0][2] + self.max_wait - time.monotonic()
+                        if left <= 0:
+                            break
+                        self._ready.wait(left)
+                    else:
+                        self._ready.wait()
+                conn, addr, _ = self._pending.popleft()
+                self.sessions -= 1
+                self.rejected += 1
+                self.expired += 1
+            try:
+                self._reject(conn, addr)
+            except Exception as e:
+                print(f"[SERVER] Rejecting queued session {addr} failed: {e!r}")
+
+    def wait_percentile(self, p):
+        """Bucket upper bound (ms) at or below which fraction p of queue waits fell; None if open-ended."""
+        with self._lock:
+            total = sum(self.wait_counts)
+            if not total:
+                return 0
+            seen = 0
+            for i, count in enumerate(self.wait_counts):
+                seen += count
+                if seen >= p * total:
+                    return WAIT_BUCKETS_MS[i] if i < len(WAIT_BUCKETS_MS) else None
+        return None
+
+    def stats(self):
+        """Snapshot of pool occupancy and queue-wait figures."""
+        with self._lock:
+            served = self.served
+            return {
+                "workers": self.workers,
+                "active": self.active,
+                "pending": self.sessions - self.active,
+                "max_pending": self.max_pending,
+                "served": served,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "wait_avg_ms": (self.wait_total / served * 1000) if served else 0.0,
+                "wait_max_ms": self.wait_max * 1000,
+                "wait_buckets_ms": dict(zip([*map(str, WAIT_BUCKETS_MS), "+Inf"], self.wait_counts)),
+            }
+
+    def report_forever(self, interval):
+        """Print a one-line pool summary every interval seconds whenever sessions came in."""
+        last = None
+        while True:
+            time.sleep(interval)
+            s = self.stats()
+            if (s["served"], s["rejected"]) == last:
+                continue
+            last = (s["served"], s["rejected"])
+            p99 = self.wait_percentile(0.99)
+            print(f"[POOL] active={s['active']}/{s['workers']} pending={s['pending']}/{s['max_pending']} "
+                  f"served={s['served']} rejected={s['rejected']} wait avg={s['wait_avg_ms']:.1f}ms "
+                  f"max={s['wait_max_ms']:.1f}ms p99<={p99 if p99 is not None else '>5000'}ms", flush=True)
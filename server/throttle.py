@@ -0,0 +1,167 @@
+"""
+Bandwidth limits for data transfers.
+
+Two layers, each applied separately to bytes sent and bytes received:
+- a TokenBucket per session (FTP_SESSION_RATE), so one client can't take more than its share;
+- a FairScheduler for the whole server (FTP_GLOBAL_RATE), standing in for the NIC.
+
+When the global budget is contended, the FairScheduler hands the next tokens to the waiting
+transfer that has moved the fewest bytes so far (least attained service). A fresh LS or small
+GET therefore goes ahead of the chunks of a long-running download instead of queueing behind
+them, and long transfers running side by side converge to equal shares. With fair=False
+waiters are served first come, first served.
+
+ThrottledConn wraps a data socket (or a MODE B BlockChannel) and pays for every chunk before
+it is sent or after it is received, so the existing transfer loops need no changes.
+"""
+
+import heapq
+import io
+import itertools
+import os
+import threading
+import time
+
+class TokenBucket:
+    """rate bytes/s with up to `burst` bytes saved up. consume() may go into debt and sleeps it off."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def consume(self, n):
+        with self._lock:
+            self.refill()
+            self.tokens -= n
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+class Flow:
+    """One transfer's position in a FairScheduler: the bytes it has been granted so far."""
+
+    __slots__ = ("served",)
+
+    def __init__(self):
+        self.served = 0
+
+class FairScheduler:
+    """A TokenBucket shared by all transfers; waiters are ordered by bytes served (fair) or arrival."""
+
+    def __init__(self, rate, burst, fair=True):
+        self.bucket = TokenBucket(rate, burst)
+        self.fair = fair
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self.granted = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def grant(self, flow, n):
+        """Block until flow may move n bytes."""
+        need = min(n, self.bucket.burst)
+        with self._cond:
+            entry = (flow.served if self.fair else 0, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            t0 = time.monotonic()
+            while True:
+                self.bucket.refill()
+                if self._queue[0] is not entry:
+                    self._cond.wait()
+                elif self.bucket.tokens < need:
+                    self._cond.wait((need - self.bucket.tokens) / self.bucket.rate)
+                else:
+                    break
+            heapq.heappop(self._queue)
+            self.bucket.tokens -= n
+            flow.served += n
+            self.granted += n
+            waited = time.monotonic() - t0
+            if waited > 0.001:
+                self.waits += 1
+                self.wait_seconds += waited
+            self._cond.notify_all()
+
+class _Meter:
+    """The limits one direction of one transfer pays into."""
+
+    def __init__(self, bucket, scheduler):
+        self.bucket = bucket
+        self.scheduler = scheduler
+        self.flow = Flow()
+
+    def pay(self, n):
+        if self.bucket is not None:
+            self.bucket.consume(n)
+        if self.scheduler is not None:
+            self.scheduler.grant(self.flow, n)
+
+class ThrottledConn:
+    """
+    A data socket or BlockChannel whose sendall/sendfile/recv/recv_into are paced by the
+    given (session bucket, global scheduler) pairs. Sends go out in chunks of `chunk` bytes
+    so no single call holds the global budget for long.
+    """
+
+    def __init__(self, conn, send, recv, chunk):
+        self.conn = conn
+        self.chunk = chunk
+        self._send = _Meter(*send)
+        self._recv = _Meter(*recv)
+
+    def sendall(self, data):
+        view = memoryview(data).cast("B")
+        for off in range(0, len(view), self.chunk):
+            piece = view[off:off + self.chunk]
+            self._send.pay(len(piece))
+            self.conn.sendall(piece)
+
+    def sendfile(self, f, offset=0, count=None):
+        if count is None:
+            count = os.fstat(f.fileno()).st_size - offset
+        sent = 0
+        while sent < count:
+            n = min(self.chunk, count - sent)
+            self._send.pay(n)
+            k = self.conn.sendfile(f, offset + sent, n)
+            if not k:
+                break
+            sent += k
+        return sent
+
+    def recv_into(self, buf, nbytes=0):
+        want = min(nbytes or len(buf), len(buf), self.chunk)
+        k = self.conn.recv_into(memoryview(buf)[:want], want)
+        if k:
+            self._recv.pay(k)
+        return k
+
+    def recv(self, n):
+        buf = bytearray(min(n, self.chunk))
+        k = self.recv_into(buf)
+        return bytes(buf[:k])
+
+    def makefile(self, mode="rb"):
+        return io.BufferedReader(_RawThrottled(self))
+
+    def close(self):
+        self.conn.close()
+
+class _RawThrottled(io.RawIOBase):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self.conn.recv_into(b)
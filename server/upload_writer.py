@@ -0,0 +1,144 @@
+"""
+Disk side of a PUT: preallocation, a writer thread fed through two buffers, and fsync policy.
+
+The session thread recv_into()s one buffer while a writer thread pwrite()s the other, so a
+slow disk write no longer stalls the socket (and a slow socket no longer idles the disk).
+The handoff is bounded: with both buffers queued for the disk, buffer() waits, which keeps
+the TCP window closed instead of piling received data up in memory. Uploads that fit in one
+buffer are written inline; a thread would cost more than it saves.
+
+The declared size is reserved up front with posix_fallocate, so the file gets (near-)
+contiguous extents even while other uploads interleave their writes, and a full disk fails
+the upload at the start instead of halfway. A short upload is truncated back to the bytes
+written, so REST sees the true partial size.
+
+fsync modes, applied by sync() before commit_upload renames the file into place (commit_upload
+then fsyncs the directory, so the rename itself is durable too):
+  none      leave flushing to the kernel (a crash can lose recently committed uploads)
+  commit    fsync once, after the last byte and before the rename
+  periodic  also fdatasync every `interval` bytes while receiving, so the final fsync
+            has little left to flush and dirty pages don't pile up behind a large upload
+"""
+
+import errno
+import os
+import queue
+import threading
+import time
+
+FSYNC_MODES = ("none", "commit", "periodic")
+
+class UploadWriter:
+    def __init__(self, fd, offset, size, buffer_size, fsync="none", interval=64 << 20, preallocate=True):
+        """Write to fd from offset; size is the declared end of the file (SIZE)."""
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"fsync mode must be one of {', '.join(FSYNC_MODES)}")
+        self.fd = fd
+        self.end = offset  # file offset up to which everything submitted is on disk (or in the page cache)
+        self.size = size
+        self.fsync = fsync
+        self.interval = interval
+        self.error = None  # first write error from the writer thread
+        self.wait_seconds = 0.0  # time the receiver spent waiting for a free buffer
+        self.fsyncs = 0
+        self._unsynced = 0
+        self._pos = offset  # where the next submitted buffer goes
+        if preallocate and size > offset:
+            try:
+                os.posix_fallocate(fd, offset, size - offset)
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                    os.ftruncate(fd, offset)  # give back whatever was reserved
+                    raise  # ENOSPC and friends: fail before receiving anything
+        n = max(1, min(buffer_size, size - offset))
+        self._free = queue.Queue()
+        self._full = queue.Queue()
+        self._thread = None
+        if size - offset > buffer_size:
+            for _ in range(2):
+                self._free.put(memoryview(bytearray(n)))
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        else:
+            self._free.put(memoryview(bytearray(n)))
+        self._current = None
+
+    def buffer(self):
+        """A free buffer to receive into; pass the byte count to submit(). Raises the writer's error."""
+        if self.error is not None:
+            raise self.error
+        try:
+            self._current = self._free.get_nowait()
+        except queue.Empty:
+            t0 = time.perf_counter()
+            self._current = self._free.get()
+            self.wait_seconds += time.perf_counter() - t0
+        return self._current
+
+    def submit(self, nbytes):
+        """Queue the first nbytes of the last buffer() for writing."""
+        buf, self._current = self._current, None
+        pos, self._pos = self._pos, self._pos + nbytes
+        if self._thread is None:
+            self._write(buf[:nbytes], pos)
+            self._free.put(buf)
+        else:
+            self._full.put((buf, nbytes, pos))
+
+    def write(self, data):
+        """Copy data into buffers and submit them (for decompressed pieces of any size)."""
+        data = memoryview(data)
+        while data:
+            buf = self.buffer()
+            k = min(len(buf), len(data))
+            buf[:k] = data[:k]
+            self.submit(k)
+            data = data[k:]
+
+    def close(self):
+        """
+        Wait for queued writes, stop the writer thread and return the end offset of what was
+        written. If that is short of the preallocated size, the file is truncated to it.
+        """
+        if self._current is not None:
+            self._free.put(self._current)  # a buffer() that never got submit()ted
+            self._current = None
+        if self._thread is not None:
+            self._full.put(None)
+            self._thread.join()
+            self._thread = None
+        if self.end < self.size:
+            try:
+                os.ftruncate(self.fd, self.end)
+            except OSError:
+                pass
+        return self.end
+
+    def sync(self):
+        """Make the written file durable per the fsync mode; call after close(), before the rename."""
+        if self.fsync != "none":
+            os.fsync(self.fd)
+            self.fsyncs += 1
+
+    def _run(self):
+        while (item := self._full.get()) is not None:
+            buf, nbytes, pos = item
+            if self.error is None:
+                try:
+                    self._write(buf[:nbytes], pos)
+                except OSError as e:
+                    self.error = e
+            self._free.put(buf)
+
+    def _write(self, view, pos):
+        n = len(view)
+        while view:
+            k = os.pwrite(self.fd, view, pos)
+            view, pos = view[k:], pos + k
+        self.end = pos
+        if self.fsync == "periodic":
+            self._unsynced += n
+            if self._unsynced >= self.interval:
+                os.fdatasync(self.fd)
+                self.fsyncs += 1
+                self._unsynced = 0
@@ -0,0 +1,133 @@
+"""
+MODE B framing for a persistent data connection.
+
+Each transfer on the connection is a run of blocks, each a 4-byte big-endian length
+followed by that many bytes, closed by an empty block (length 0) as the end marker.
+The connection stays open afterwards for the next transfer, so no new TCP handshake
+or passive port is needed per LS/GET/PUT.
+"""
+
+import io
+import os
+import socket
+import struct
+
+HEADER = struct.Struct("!I")
+END_MARKER = HEADER.pack(0)
+MAX_BLOCK = (1 << 32) - 1
+SEND_SLICE = 1024 * 1024  # one sendall per slice, so a socket timeout bounds a slice, not the payload
+_COALESCE = 64 * 1024  # small payloads share one send with their header
+_MORE = getattr(socket, "MSG_MORE", 0)  # Linux: hold a header back until its body follows
+
+class BlockChannel:
+    """
+    One transfer over a persistent data socket. Quacks like the socket calls the
+    LS/GET/PUT loops already use (sendall, sendfile, recv, recv_into, makefile, close),
+    so the same loops work in MODE S and MODE B.
+    close() ends the transfer: a writer sends the end marker, a reader skips to it
+    (a side that did both, like SYNC, does both). It never closes the underlying socket.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.wrote = False
+        self.read = False
+        self.left = 0      # bytes remaining in the block being read
+        self.ended = False  # end marker seen
+        self.sent_end = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # After an error the channel is out of step; leave it to the owner to drop it.
+        if exc_type is None:
+            self.close()
+
+    # -- writing --
+
+    def sendall(self, data):
+        self.wrote = True
+        view = memoryview(data)
+        while len(view):
+            block = view[:MAX_BLOCK]
+            if len(block) <= _COALESCE:
+                self.sock.sendall(HEADER.pack(len(block)) + block)
+            else:
+                self.sock.sendall(HEADER.pack(len(block)), _MORE)
+                for start in range(0, len(block), SEND_SLICE):
+                    self.sock.sendall(block[start:start + SEND_SLICE])
+            view = view[len(block):]
+
+    def sendfile(self, f, offset=0, count=None):
+        """Send count bytes (default: to EOF) of f as blocks; the bodies still go through os.sendfile."""
+        self.wrote = True
+        if count is None:
+            count = os.fstat(f.fileno()).st_size - offset
+        sent = 0
+        while sent < count:
+            n = min(MAX_BLOCK, count - sent)
+            self.sock.sendall(HEADER.pack(n), _MORE)
+            if self.sock.sendfile(f, offset + sent, n) != n:
+                raise OSError("file shrank during MODE B transfer")
+            sent += n
+        return sent
+
+    # -- reading --
+
+    def recv_into(self, buf, nbytes=0):
+        self.read = True
+        if self.ended:
+            return 0
+        while self.left == 0:
+            n = HEADER.unpack(self._recv_exact(HEADER.size))[0]
+            if n == 0:
+                self.ended = True
+                return 0
+            self.left = n
+        view = memoryview(buf)
+        want = min(nbytes or len(view), len(view), self.left)
+        k = self.sock.recv_into(view[:want])
+        if not k:
+            raise ConnectionError("data channel closed inside a block")
+        self.left -= k
+        return k
+
+    def recv(self, n):
+        buf = bytearray(n)
+        k = self.recv_into(buf)
+        return bytes(buf[:k])
+
+    def makefile(self, mode="rb"):
+        return io.BufferedReader(_RawBlocks(self))
+
+    def _recv_exact(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("data channel closed")
+            buf += chunk
+        return bytes(buf)
+
+    def close(self):
+        if self.wrote and not self.sent_end:
+            self.sock.sendall(END_MARKER)
+            self.sent_end = True
+        if self.ended or (self.wrote and not self.read):
+            return
+        sink = bytearray(_COALESCE)
+        while self.recv_into(sink):
+            pass
+
+class _RawBlocks(io.RawIOBase):
+    """Raw file view of a reading BlockChannel, so BufferedReader can provide readline/read."""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self.channel.recv_into(b)
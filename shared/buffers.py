@@ -0,0 +1,65 @@
+"""
+Buffer sizing for the data copy loops, shared by the server and the client.
+
+A copy loop preallocates one bytearray per transfer, recv_into()/readinto()s it and writes
+straight from a memoryview slice, so no bytes object is created per chunk. AdaptiveChunk
+decides how much of that buffer each call uses: it starts at MIN_CHUNK and follows the
+measured throughput, aiming for about TARGET_SECONDS of data per call, up to the buffer size.
+A slow link keeps small chunks; a fast one reaches the whole buffer after a few calls.
+
+set_socket_buffers() applies SO_SNDBUF/SO_RCVBUF. Linux doubles the value for bookkeeping
+and stops autotuning a socket once it is set, so 0 leaves the kernel in charge. The TCP
+window scale is fixed in the handshake: set it on listeners before listen() and on client
+sockets before connect().
+"""
+
+import socket
+import time
+
+MIN_CHUNK = 4096
+TARGET_SECONDS = 0.002
+SAMPLE_CALLS = 8  # calls per throughput sample, so the clock isn't read on every call
+SMOOTHING = 0.25  # weight of the newest sample in the throughput average
+
+class AdaptiveChunk:
+    """Per-call chunk size for one transfer's copy loop; call record() after every call."""
+
+    def __init__(self, maximum, minimum=MIN_CHUNK):
+        self.maximum = max(1, maximum)
+        self.minimum = min(minimum, self.maximum)
+        self.size = self.minimum
+        self.rate = None  # smoothed bytes/s
+        self._calls = 0
+        self._bytes = 0
+        self._stamp = time.perf_counter()
+
+    def record(self, nbytes):
+        """Account for a call that moved nbytes; every SAMPLE_CALLS calls, pick a new size."""
+        if self.maximum == self.minimum:
+            return
+        self._bytes += nbytes
+        self._calls += 1
+        if self._calls < SAMPLE_CALLS:
+            return
+        now = time.perf_counter()
+        elapsed, self._stamp = now - self._stamp, now
+        rate = self._bytes / elapsed if elapsed > 0 else None
+        self._calls = self._bytes = 0
+        if rate is None:
+            return
+        self.rate = rate if self.rate is None else self.rate + SMOOTHING * (rate - self.rate)
+        want = self.rate * TARGET_SECONDS
+        if want >= self.maximum:
+            self.size = self.maximum
+            return
+        size = self.minimum
+        while size * 2 <= want:
+            size *= 2
+        self.size = size
+
+def set_socket_buffers(sock, sndbuf=0, rcvbuf=0):
+    """Set SO_SNDBUF/SO_RCVBUF on sock; 0 keeps the kernel's autotuned default."""
+    if sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
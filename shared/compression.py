@@ -0,0 +1,88 @@
+"""
+MODE Z: on-the-fly compression of GET/PUT data.
+
+A compressed transfer is one self-terminating zlib or lzma stream carrying the file
+bytes (from the REST offset on, if any). SIZE and REST still count uncompressed bytes,
+so resume works the same as in plain transfers. Compression is orthogonal to MODE S/B:
+the compressed stream is what goes over the fresh or the persistent data connection.
+"""
+
+import lzma
+import os
+import zlib
+
+ALGORITHMS = ("zlib", "lzma")
+DEFAULT_ALGORITHM = "zlib"
+DEFAULT_LEVEL = 6
+MAX_LEVEL = 9
+
+# Sampling heuristic: compress a few slices of the file with fast zlib and only use
+# MODE Z when they shrink to at most SAMPLE_RATIO of their size. Already-compressed
+# media and archives skip the CPU cost and go out raw.
+SAMPLE_BYTES = 64 * 1024
+SAMPLE_PROBES = 3
+SAMPLE_RATIO = 0.9
+MIN_COMPRESS_SIZE = 1024  # below this the stream headers cost more than they save
+
+def parse_mode_z(args):
+    """Parse the arguments after "MODE Z": [zlib|lzma|NONE] [level]. Returns ((algo, level) or None, error)."""
+    algo = args[0].lower() if args else DEFAULT_ALGORITHM
+    if algo == "none":
+        return None, None
+    if algo not in ALGORITHMS:
+        return None, f"Unknown compression {args[0]} (use {'|'.join(ALGORITHMS)}|NONE)"
+    level = DEFAULT_LEVEL
+    if len(args) >= 2:
+        if not args[1].isdigit() or int(args[1]) > MAX_LEVEL:
+            return None, f"Compression level must be 0-{MAX_LEVEL}"
+        level = int(args[1])
+    return (algo, level), None
+
+def compressor(algo, level):
+    if algo == "lzma":
+        return lzma.LZMACompressor(preset=level)
+    return zlib.compressobj(level)
+
+def decompressor(algo):
+    if algo == "lzma":
+        return lzma.LZMADecompressor()
+    return zlib.decompressobj()
+
+def worth_compressing(fd, size, offset=0):
+    """Sample up to SAMPLE_PROBES slices of [offset, size) in file descriptor fd with os.pread."""
+    span = size - offset
+    if span < MIN_COMPRESS_SIZE:
+        return False
+    probes = 1 if span <= SAMPLE_BYTES * SAMPLE_PROBES else SAMPLE_PROBES
+    step = (span - SAMPLE_BYTES) // max(probes - 1, 1)
+    raw = packed = 0
+    for i in range(probes):
+        sample = os.pread(fd, SAMPLE_BYTES if probes > 1 else span, offset + i * step)
+        raw += len(sample)
+        packed += len(zlib.compress(sample, 1))
+    return raw > 0 and packed <= raw * SAMPLE_RATIO
+
+def iter_decompressed(sock, algo, limit, bufsize=64 * 1024):
+    """
+    Yield the decompressed pieces of one MODE Z stream read from sock, until the stream or the
+    socket ends. Output is produced at most bufsize bytes per call and stops after limit + 1
+    bytes in total (one byte past limit tells the caller the stream is longer than announced),
+    so a small, highly compressible stream can't expand into unbounded memory.
+    """
+    dec = decompressor(algo)
+    left = limit + 1
+    data = b""
+    more = False  # the last call filled its max_length: output may be pending without new input
+    while not dec.eof and left > 0:
+        if not data and not more:
+            data = sock.recv(bufsize)
+            if not data:
+                return
+        want = min(bufsize, left)
+        piece = dec.decompress(data, want)
+        # zlib hands back the input it didn't get to; lzma keeps it buffered internally.
+        data = getattr(dec, "unconsumed_tail", b"")
+        more = len(piece) == want
+        if piece:
+            left -= len(piece)
+            yield piece
@@ -0,0 +1,228 @@
+"""
+rsync-style delta encoding for SYNC.
+
+The server splits its copy of a file into fixed-size blocks and sends one signature
+per block: the Adler-32 checksum (zlib.adler32, cheap, rollable) and the first 16
+bytes of its SHA-256 (strong; faster than MD5 or BLAKE2 on CPUs with SHA extensions).
+The client slides a window over its new version; wherever the window's Adler-32
+matches a signature and the strong digest confirms it, that block is sent as a COPY
+of the server's bytes, everything else as LITERAL data.
+
+Delta stream ops (big-endian):
+  b"C" <offset u64> <length u64>   copy bytes from the server's current copy
+  b"L" <length u32> <data>         literal bytes
+  b"E" <sha256 32 bytes>           end; digest of the complete new file
+
+Aligned blocks are checked with zlib at C speed first, so files edited in place are
+encoded without per-byte Python work; only insertions/deletions fall back to rolling
+the checksum one byte at a time until the blocks line up again.
+"""
+
+import hashlib
+import os
+import struct
+import zlib
+
+MOD_ADLER = 65521
+BLOCK_MIN = 2 * 1024
+BLOCK_MAX = 1024 * 1024
+LITERAL_MAX = 1024 * 1024  # longest single LITERAL op
+PROBE_BLOCKS = 16  # aligned blocks checked ahead before rolling byte by byte
+
+SIGNATURE = struct.Struct("!I16s")
+COPY = struct.Struct("!QQ")
+LITERAL = struct.Struct("!I")
+
+def block_size_for(size):
+    """About sqrt(size) rounded to a power of two, like rsync, clamped to [BLOCK_MIN, BLOCK_MAX]."""
+    bs = BLOCK_MIN
+    while bs * bs < size and bs < BLOCK_MAX:
+        bs *= 2
+    return bs
+
+def strong(block):
+    return hashlib.sha256(block).digest()[:16]
+
+def signatures(f, block_size):
+    """Signature bytes (SIGNATURE per block) for the open binary file f, read from its start."""
+    out = bytearray()
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return bytes(out)
+        out += SIGNATURE.pack(zlib.adler32(block), strong(block))
+
+class SignatureIndex:
+    """Server signatures looked up by Adler-32, then confirmed by the strong digest."""
+
+    def __init__(self, sig_bytes, block_size, size):
+        self.block_size = block_size
+        self.size = size
+        self.weak = {}
+        self.strong = []
+        for i, (weak, digest) in enumerate(SIGNATURE.iter_unpack(sig_bytes)):
+            self.weak.setdefault(weak, []).append(i)
+            self.strong.append(digest)
+        count = len(self.strong)
+        self.tail_len = size - (count - 1) * block_size if count else 0
+
+    def find(self, weak, block):
+        """Index of a server block equal to block, or None."""
+        candidates = self.weak.get(weak)
+        if not candidates:
+            return None
+        digest = strong(block)
+        for i in candidates:
+            if self.strong[i] == digest and self.length(i) == len(block):
+                return i
+        return None
+
+    def length(self, i):
+        return self.tail_len if i == len(self.strong) - 1 else self.block_size
+
+def iter_delta(data, index):
+    """
+    Yield encoded ops turning the server's copy into data (bytes-like, e.g. an mmap),
+    without the final END op.
+    """
+    bs = index.block_size
+    n = len(data)
+    pos = lit_start = 0
+    copy_off = copy_len = 0
+
+    def flush_copy():
+        nonlocal copy_len
+        if copy_len:
+            yield b"C" + COPY.pack(copy_off, copy_len)
+            copy_len = 0
+
+    def flush_literal(end):
+        for start in range(lit_start, end, LITERAL_MAX):
+            chunk = data[start:min(end, start + LITERAL_MAX)]
+            yield b"L" + LITERAL.pack(len(chunk)) + chunk
+
+    def copy(i):
+        nonlocal copy_off, copy_len
+        off = i * bs
+        if copy_len and copy_off + copy_len == off:
+            copy_len += index.length(i)
+            return ()
+        ops = list(flush_copy())
+        copy_off, copy_len = off, index.length(i)
+        return ops
+
+    while pos + bs <= n:
+        block = data[pos:pos + bs]
+        weak = zlib.adler32(block)
+        i = index.find(weak, block)
+        # In-place edits keep block boundaries: if one of the next few aligned blocks
+        # matches, the ones before it are simply literal and no byte-by-byte rolling is needed.
+        ahead = pos + bs
+        while i is None and ahead + bs <= n and ahead - pos <= PROBE_BLOCKS * bs:
+            nxt = data[ahead:ahead + bs]
+            i = index.find(zlib.adler32(nxt), nxt)
+            if i is not None:
+                pos = ahead
+            ahead += bs
+        if i is None:
+            # Roll the window one byte at a time until a block lines up again.
+            a, b = weak & 0xFFFF, weak >> 16
+            while pos + bs < n:
+                out, inn = data[pos], data[pos + bs]
+                a = (a - out + inn) % MOD_ADLER
+                b = (b - bs * out + a - 1) % MOD_ADLER
+                pos += 1
+                weak = (b << 16) | a
+                if weak in index.weak:
+                    i = index.find(weak, data[pos:pos + bs])
+                    if i is not None:
+                        break
+                if pos - lit_start >= LITERAL_MAX:
+                    yield from flush_copy()
+                    yield from flush_literal(pos)
+                    lit_start = pos
+            if i is None:
+                pos = n  # reached the end without another match: the rest is literal
+                break
+        if pos > lit_start:
+            yield from flush_copy()
+            yield from flush_literal(pos)
+        yield from copy(i)
+        pos += index.length(i)
+        lit_start = pos
+    # Tail shorter than a block: only the server's (short) last block can match it.
+    tail = data[lit_start:]
+    if tail and index.strong and index.tail_len == len(tail) and lit_start == pos:
+        i = index.find(zlib.adler32(tail), tail)
+        if i is not None:
+            yield from copy(i)
+            lit_start = n
+    yield from flush_copy()
+    yield from flush_literal(n)
+
+def end_op(digest):
+    return b"E" + digest
+
+def apply_delta(sock, src_fd, dst_fd, hasher=None):
+    """
+    Read ops from sock (anything with recv_into) and write the new file to dst_fd, copying
+    unchanged ranges from src_fd in the kernel where possible. With a hasher, the new file's
+    bytes are fed to it in order as they are written (COPY ranges then go through userspace),
+    so the claimed digest can be checked without reading the result back.
+    Returns (bytes written, literal bytes, sha256 digest the sender claimed).
+    Raises ValueError on a malformed or truncated stream.
+    """
+    written = literal = 0
+    buf = bytearray(LITERAL_MAX)
+    while True:
+        op = recv_exact(sock, 1)
+        if op == b"E":
+            return written, literal, bytes(recv_exact(sock, 32))
+        if op == b"C":
+            off, length = COPY.unpack(recv_exact(sock, COPY.size))
+            _copy_range(src_fd, dst_fd, off, length, written, hasher)
+            written += length
+        elif op == b"L":
+            (length,) = LITERAL.unpack(recv_exact(sock, LITERAL.size))
+            if length > LITERAL_MAX:
+                raise ValueError("literal too long")
+            view = recv_exact(sock, length, buf)
+            os.pwrite(dst_fd, view, written)
+            if hasher is not None:
+                hasher.update(view)
+            written += length
+            literal += length
+        else:
+            raise ValueError(f"bad delta op {op!r}")
+
+def recv_exact(sock, n, buf=None):
+    """Exactly n bytes from sock (socket or BlockChannel) as a memoryview, into buf if given."""
+    view = memoryview(buf if buf is not None else bytearray(n))[:n]
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if not k:
+            raise ValueError("delta stream ended early")
+        got += k
+    return view
+
+def _copy_range(src_fd, dst_fd, off, length, dst_off, hasher=None):
+    done = 0
+    if hasher is None and hasattr(os, "copy_file_range"):
+        try:
+            while done < length:
+                k = os.copy_file_range(src_fd, dst_fd, length - done, off + done, dst_off + done)
+                if not k:
+                    raise ValueError("COPY past end of the server's copy")
+                done += k
+            return
+        except OSError:
+            pass  # e.g. filesystem without support; fall back to userspace copy
+    while done < length:
+        chunk = os.pread(src_fd, min(LITERAL_MAX, length - done), off + done)
+        if not chunk:
+            raise ValueError("COPY past end of the server's copy")
+        os.pwrite(dst_fd, chunk, dst_off + done)
+        if hasher is not None:
+            hasher.update(chunk)
+        done += len(chunk)
@@ -0,0 +1,63 @@
+"""
+Per-transfer digests (DIGEST command).
+
+After DIGEST <algo> both sides hash the file bytes as they pass through the GET/PUT
+loops and the server reports its digest on the 226 line; the client compares it with
+its own. Digests always cover the whole file, so a transfer resumed with REST hashes
+the bytes already on disk first. sha256/md5 come from hashlib, crc32/adler32 from zlib
+(the cheap checks: they catch corruption, not tampering).
+"""
+
+import hashlib
+import os
+import zlib
+
+ALGORITHMS = ("sha256", "md5", "crc32", "adler32")
+READ_CHUNK = 1024 * 1024
+
+class _Checksum:
+    """zlib.crc32/adler32 behind the hashlib update()/hexdigest() interface."""
+
+    def __init__(self, func):
+        self.func = func
+        self.value = func(b"")
+
+    def update(self, data):
+        self.value = self.func(data, self.value)
+
+    def hexdigest(self):
+        return f"{self.value:08x}"
+
+def new(algo):
+    if algo == "crc32":
+        return _Checksum(zlib.crc32)
+    if algo == "adler32":
+        return _Checksum(zlib.adler32)
+    return hashlib.new(algo)
+
+def update_from_file(h, fd, start, end):
+    """Feed bytes [start, end) of file descriptor fd into h with os.pread (leaves the file position alone)."""
+    while start < end:
+        chunk = os.pread(fd, min(READ_CHUNK, end - start), start)
+        if not chunk:
+            raise OSError(f"file ended at {start} while hashing up to {end}")
+        h.update(chunk)
+        start += len(chunk)
+
+def sha256_file(f):
+    """sha256 hasher fed with file object f up to EOF (hashlib.file_digest needs Python 3.11)."""
+    h = hashlib.sha256()
+    view = memoryview(bytearray(READ_CHUNK))
+    while k := f.readinto(view):
+        h.update(view[:k])
+    return h
+
+def reply_digest(line):
+    """(algo, hex digest) from a 226 line ending in "DIGEST <algo> <hex>", or None."""
+    parts = line.split()
+    if "DIGEST" not in parts:
+        return None
+    i = parts.index("DIGEST")
+    if i + 2 >= len(parts):
+        return None
+    return parts[i + 1], parts[i + 2]
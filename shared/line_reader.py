@@ -0,0 +1,63 @@
+"""
+Buffered line reader for the control connection, shared by the server and the client.
+
+Bytes received after a newline stay buffered for the next readline(), so commands a client
+pipelines into one segment (or a 200 and its 226 arriving together) are all read, in order.
+The newline search resumes where the previous one stopped and the buffer is a bytearray
+that is appended to in place, so assembling a line of n bytes costs O(n), not O(n²).
+
+A line longer than max_line raises LineTooLong; the reader then discards input up to the
+next newline, so the caller can answer with an error and carry on with the next command.
+"""
+
+MAX_LINE = 64 * 1024  # room for an MGET with many names
+RECV_SIZE = 4096
+
+class LineTooLong(ValueError):
+    """A control line exceeded the reader's max_line."""
+
+class LineReader:
+    def __init__(self, sock, max_line=MAX_LINE, recv_size=RECV_SIZE):
+        self.sock = sock
+        self.max_line = max_line
+        self.recv_size = recv_size
+        self._buf = bytearray()
+        self._start = 0  # bytes of _buf already returned
+        self._discarding = False  # skipping the rest of an over-long line
+
+    def readline(self):
+        """
+        Next line as bytes, without the trailing \\n (or \\r\\n). At end of stream an
+        unterminated last line is returned as is, then None.
+        """
+        scan = self._start
+        while True:
+            end = self._buf.find(b"\n", scan)
+            if end >= 0:
+                line = bytes(self._buf[self._start:end])
+                self._start = end + 1
+                if self._discarding:
+                    self._discarding = False
+                    scan = self._start
+                    continue
+                if len(line) > self.max_line:
+                    raise LineTooLong(f"line longer than {self.max_line} bytes")
+                return line[:-1] if line.endswith(b"\r") else line
+            if self._discarding:
+                self._start = len(self._buf)
+            elif len(self._buf) - self._start > self.max_line:
+                self._discarding = True
+                self._start = len(self._buf)
+                raise LineTooLong(f"line longer than {self.max_line} bytes")
+            # Drop what was consumed before reading more; what's left is under max_line.
+            del self._buf[:self._start]
+            self._start = 0
+            scan = len(self._buf)
+            chunk = self.sock.recv(self.recv_size)
+            if not chunk:
+                if self._buf and not self._discarding:
+                    line = bytes(self._buf)
+                    self._buf.clear()
+                    return line
+                return None
+            self._buf += chunk
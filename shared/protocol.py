@@ -1,3 +1,62 @@
 OK = "200"
 DONE = "226"
 ERR = "550"
+FILE_STATUS = "213"  # SIZE reply: "213 <bytes>"
+PENDING = "350"      # REST accepted, waiting for GET/PUT
+ABORTED = "426"      # data connection dropped mid-transfer; control session still usable
+
+# Ranged multi-stream transfers (GET/PUT ... STREAMS <n>) describe each stream as
+# "<port>:<offset>:<length>", comma-separated, after the RANGES keyword.
+MAX_STREAMS = 16
+MIN_RANGE = 1 << 20  # don't split below 1 MiB per stream
+
+def split_ranges(size, streams):
+    """Split [0, size) into at most `streams` contiguous (offset, length) ranges."""
+    if size <= 0:
+        return [(0, 0)]
+    streams = max(1, min(streams, MAX_STREAMS, size // MIN_RANGE or 1))
+    step = -(-size // streams)
+    return [(off, min(step, size - off)) for off in range(0, size, step)]
+
+def format_ranges(ranges):
+    return ",".join(f"{port}:{off}:{length}" for port, off, length in ranges)
+
+def parse_ranges(text):
+    return [tuple(int(x) for x in item.split(":")) for item in text.split(",")]
+
+# Batch transfers (MGET/MPUT) carry many files on one data connection as a framed stream:
+#   "F <size> <name>\n" followed by exactly <size> bytes of file content,
+#   "E <name> <reason>\n" for a file the sender skipped,
+#   "END\n" after the last frame.
+MAX_FRAME_HEADER = 1024
+FRAME_END = b"END\n"
+BATCH_COALESCE = 64 * 1024  # files up to this size are packed with their neighbours into one send
+
+def frame_header(name, size):
+    return f"F {size} {name}\n".encode("utf-8")
+
+def frame_error(name, reason):
+    return f"E {name} {reason}\n".encode("utf-8")
+
+def read_frame_header(rfile):
+    """
+    Read one frame header from a buffered binary file (socket.makefile("rb")).
+    Returns ("F", name, size), ("E", name, reason) or None at END; the caller must
+    consume the <size> content bytes before reading the next header.
+    Raises ValueError on a truncated or malformed stream.
+    """
+    line = rfile.readline(MAX_FRAME_HEADER)
+    if line == FRAME_END:
+        return None
+    if not line.endswith(b"\n"):
+        raise ValueError("truncated frame header")
+    kind, _, rest = line.decode("utf-8").rstrip("\n").partition(" ")
+    if kind == "F":
+        size, _, name = rest.partition(" ")
+        if not size.isdigit() or not name:
+            raise ValueError(f"bad frame header: {line!r}")
+        return "F", name, int(size)
+    if kind == "E":
+        name, _, reason = rest.partition(" ")
+        return "E", name, reason
+    raise ValueError(f"bad frame header: {line!r}")
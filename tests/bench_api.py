@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: small-file GETs/sec through client/api.py, a new session per operation vs SessionPool vs AsyncSessionPool.
+
+--ops GETs of --size byte files go to a server subprocess (started as in bench_load):
+  per-op     api.Session opened and closed for every GET, from --threads threads
+             (what wrapping ftp_client.repl per command amounts to: handshake + banner each time)
+  pool       api.SessionPool(size=--threads), --threads threads sharing warm sessions
+  async      api.AsyncSessionPool(size=--sessions), --sessions tasks on one event loop
+Reported: operations/sec, p50/p99 latency and control sessions opened.
+
+Usage: python3 tests/bench_api.py [--ops 5000] [--size 4K] [--threads 16] [--sessions 64]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import bench_load
+from client import api
+
+def threaded(ops, threads, get_one):
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(ops))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            t0 = time.perf_counter()
+            get_one(i)
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - t0, latencies
+
+def run_per_op(addr, args, names):
+    def get_one(i):
+        with api.Session(*addr) as s:
+            s.get(names[i % len(names)], io.BytesIO())
+    wall, lat = threaded(args.ops, args.threads, get_one)
+    return wall, lat, args.ops
+
+def run_pool(addr, args, names):
+    with api.SessionPool(*addr, size=args.threads) as pool:
+        wall, lat = threaded(args.ops, args.threads, lambda i: pool.get(names[i % len(names)], io.BytesIO()))
+        return wall, lat, pool.stats()["created"]
+
+def run_async(addr, args, names):
+    async def main():
+        async with api.AsyncSessionPool(*addr, size=args.sessions) as pool:
+            latencies = []
+            counter = iter(range(args.ops))
+
+            async def worker():
+                # Workers pull from a shared counter like the threads do, so latency excludes queueing.
+                for i in counter:
+                    t0 = time.perf_counter()
+                    await pool.get(names[i % len(names)], io.BytesIO())
+                    latencies.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.sessions)))
+            return time.perf_counter() - t0, latencies, pool.stats()["created"]
+    return asyncio.run(main())
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--ops", type=int, default=5000)
+    ap.add_argument("--size", default="4K")
+    ap.add_argument("--files", type=int, default=100)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--sessions", type=int, default=64)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="ftp_api_")
+    os.mkdir(os.path.join(work, "files"))
+    names = [f"f{i}.bin" for i in range(args.files)]
+    for name in names:
+        with open(os.path.join(work, "files", name), "wb") as f:
+            f.write(os.urandom(bench_load.parse_size(args.size)))
+    server_args = argparse.Namespace(engine="threads", server_env=[f"FTP_WORKERS={max(args.threads, args.sessions) + 8}"])
+    proc, addr = bench_load.start_server(work, server_args, max(args.threads, args.sessions))
+    try:
+        print(f"{args.ops} GETs of {args.size} files")
+        print(f"{'client':<10}{'ops/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'sessions':>10}")
+        for label, run in (("per-op", run_per_op), ("pool", run_pool), ("async", run_async)):
+            wall, lat, sessions = run(addr, args, names)
+            lat.sort()
+            print(f"{label:<10}{args.ops / wall:>8.0f}{bench_load.percentile(lat, 0.5) * 1e3:>9.2f}"
+                  f"{bench_load.percentile(lat, 0.99) * 1e3:>9.2f}{sessions:>10}")
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
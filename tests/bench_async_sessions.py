@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Load test: thread-per-client engine vs asyncio engine (FTP_ENGINE).
+
+For each engine a server subprocess is started on a scratch BASE_DIR, then:
+  1. N idle control sessions are opened; server RSS growth / N gives memory per idle session.
+  2. All N sessions issue GET small.txt at the same moment; per-request latency
+     (command sent -> 226 received) is reported as p50 / p99 / max.
+
+Usage: python3 tests/bench_async_sessions.py [--clients 1000] [--engines threads,asyncio]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+def start_server(engine, base_dir, extra_env=None):
+    port = free_port()
+    env = dict(os.environ, FTP_ENGINE=engine, FTP_PORT=str(port), FTP_HOST="127.0.0.1",
+               FTP_BASE_DIR=base_dir, PYTHONPATH=str(project_root))
+    env.update(extra_env or {})
+    proc = subprocess.Popen([sys.executable, "-m", "server.ftp_server"], cwd=project_root, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    proc.stdout.readline()  # "[SERVER] Listening on ..."
+    return proc, port
+
+async def open_session(port, gate):
+    async with gate:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await reader.readline()  # 220 banner
+    return reader, writer
+
+async def timed_get(reader, writer, name):
+    t0 = time.perf_counter()
+    writer.write(f"GET {name}\n".encode())
+    await writer.drain()
+    first = (await reader.readline()).decode()
+    if not first.startswith("200"):
+        return None
+    parts = first.split()
+    port, size = int(parts[parts.index("PORT") + 1]), int(parts[parts.index("SIZE") + 1])
+    dr, dw = await asyncio.open_connection("127.0.0.1", port)
+    await dr.readexactly(size)
+    dw.close()
+    done = await reader.readline()
+    return time.perf_counter() - t0 if done.startswith(b"226") else None
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+async def drive(port, pid, clients):
+    gate = asyncio.Semaphore(64)  # keep connect bursts under the server's listen backlog
+    base_rss = rss_kb(pid)
+    sessions = await asyncio.gather(*(open_session(port, gate) for _ in range(clients)))
+    await asyncio.sleep(0.5)
+    idle_kb = (rss_kb(pid) - base_rss) / clients
+
+    results = await asyncio.gather(*(timed_get(r, w, "small.txt") for r, w in sessions),
+                                   return_exceptions=True)
+    lat = [x for x in results if isinstance(x, float)]
+    for _, w in sessions:
+        w.close()
+    return idle_kb, lat
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--clients", type=int, default=1000)
+    ap.add_argument("--engines", default="threads,asyncio")
+    args = ap.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 4 * args.clients + 256)), hard))
+
+    print(f"{'engine':<10}{'clients':>8}{'KiB/idle':>10}{'ok':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for engine in args.engines.split(","):
+        base_dir = tempfile.mkdtemp(prefix="ftp_bench_")
+        shutil.copy(project_root / "tests" / "test_data" / "small.txt", base_dir)
+        # Size the threaded engine's worker pool so every session is served, not queued.
+        proc, port = start_server(engine, base_dir, {"FTP_WORKERS": str(args.clients)})
+        try:
+            idle_kb, lat = asyncio.run(drive(port, proc.pid, args.clients))
+        finally:
+            proc.kill()
+            proc.wait()
+            shutil.rmtree(base_dir, ignore_errors=True)
+        if lat:
+            print(f"{engine:<10}{args.clients:>8}{idle_kb:>10.1f}{len(lat):>7}"
+                  f"{percentile(lat, 0.5) * 1e3:>9.1f}{percentile(lat, 0.99) * 1e3:>9.1f}{max(lat) * 1e3:>9.1f}")
+        else:
+            print(f"{engine:<10}{args.clients:>8}{idle_kb:>10.1f}{0:>7}")
+
+if __name__ == "__main__":
+    main()
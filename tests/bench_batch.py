@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark: files per second for many small files, per-file GET/PUT vs batched MGET/MPUT.
+
+Runs an in-process server on a scratch BASE_DIR. The per-file flow pays a control round
+trip, a data-port lease, a TCP handshake and a 226 per file; "per-file B" is the same flow
+over a persistent MODE B data channel (no handshake or port lease); MGET/MPUT move the
+whole set as one framed stream over a single data connection.
+
+Usage: python3 tests/bench_batch.py [--files 10000] [--size-kb 4]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import start_engine
+
+from client import ftp_client
+from client.connection_handler import ControlConn
+from server import ftp_server
+from shared import protocol
+
+def clear(path):
+    for entry in os.scandir(path):
+        if entry.is_file():
+            os.remove(entry.path)
+
+def count_files(path):
+    """Regular files directly in path (the server's .uploads/.locks work directories don't count)."""
+    return sum(entry.is_file() for entry in os.scandir(path))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--files", type=int, default=10000)
+    ap.add_argument("--size-kb", type=int, default=4)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="batch_bench_")
+    src = os.path.join(work, "src")
+    downloads = os.path.join(work, "downloads")
+    os.mkdir(src)
+    os.mkdir(downloads)
+    os.chdir(downloads)
+    names = [f"small_{i:06d}.bin" for i in range(args.files)]
+    for name in names:
+        with open(os.path.join(src, name), "wb") as f:
+            f.write(os.urandom(args.size_kb << 10))
+    paths = [os.path.join(src, name) for name in names]
+
+    addr = start_engine(ftp_server.serve)
+
+    def per_file_put(ctrl):
+        for path in paths:
+            _, last = ftp_client.put_once(ctrl, path, "127.0.0.1", 0)
+            if not last.startswith(protocol.DONE):
+                raise RuntimeError(f"PUT {path}: {last}")
+
+    def per_file_get(ctrl):
+        for name in names:
+            _, _, last = ftp_client.get_once(ctrl, name, "127.0.0.1", name, 0)
+            if not last.startswith(protocol.DONE):
+                raise RuntimeError(f"GET {name}: {last}")
+
+    runs = [
+        ("PUT", "per-file", per_file_put),
+        ("PUT", "per-file B", per_file_put),
+        ("PUT", "MPUT", lambda ctrl: ftp_client.do_mput(ctrl, paths, "127.0.0.1")),
+        ("GET", "per-file", per_file_get),
+        ("GET", "per-file B", per_file_get),
+        ("GET", "MGET", lambda ctrl: ftp_client.do_mget(ctrl, ["small_*.bin"], "127.0.0.1")),
+    ]
+    print(f"{args.files} files x {args.size_kb} KiB")
+    print(f"{'op':<5}{'flow':<12}{'seconds':>10}{'files/s':>12}")
+    for op, flow, fn in runs:
+        if op == "PUT":
+            clear(ftp_server.BASE_DIR)
+        else:
+            clear(downloads)
+        with ControlConn(*addr) as ctrl, contextlib.redirect_stdout(io.StringIO()):
+            if flow.endswith(" B"):
+                ctrl.enable_block_mode("127.0.0.1")
+            t0 = time.perf_counter()
+            fn(ctrl)
+            elapsed = time.perf_counter() - t0
+        stored = count_files(ftp_server.BASE_DIR if op == "PUT" else downloads)
+        assert stored == args.files, f"{op} {flow}: {stored} of {args.files} files"
+        print(f"{op:<5}{flow:<12}{elapsed:>10.2f}{args.files / elapsed:>12.0f}")
+
+if __name__ == "__main__":
+    main()
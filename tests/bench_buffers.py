@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark: data copy loops at 4 KiB, 64 KiB and 1 MiB buffers, fresh recv() bytes vs a reused recv_into buffer.
+
+Loop: a sender thread streams --size-mb over loopback TCP and the receiver writes it to
+/dev/null with one of three loops, at each buffer size:
+  recv       chunk = sock.recv(n); f.write(chunk)     (a new bytes object per call)
+  recv_into  one bytearray, sock.recv_into(view[:n]); f.write(view[:k])
+  adaptive   recv_into, with buffers.AdaptiveChunk choosing n up to the buffer size
+Receiver CPU is time.thread_time(). "allocs/GB" counts the bytes objects the loop created and
+"alloc MB/GB" the memory requested for them: recv(n) allocates n bytes up front, however few arrive.
+
+End to end: GET (FTP_GET_MODE=copy, so the server's read loop runs too) and PUT of the same
+file through an in-process server and the client, with FTP_BUFFER_SIZE set to each size on
+both sides. --sndbuf/--rcvbuf set SO_SNDBUF/SO_RCVBUF on the data sockets.
+
+Usage: python3 tests/bench_buffers.py [--size-mb 512] [--sizes 4K,64K,1M] [--sndbuf 0] [--rcvbuf 0]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import start_engine
+
+from client import connection_handler, ftp_client
+from client.connection_handler import ControlConn
+from server import ftp_server
+from shared import buffers
+
+def parse_size(text):
+    units = {"K": 1 << 10, "M": 1 << 20}
+    return int(text[:-1]) * units[text[-1]] if text[-1] in units else int(text)
+
+def loop_recv(sock, out, n, stats):
+    while (chunk := sock.recv(n)):
+        stats["allocs"] += 1
+        stats["alloc_bytes"] += n
+        out.write(chunk)
+
+def loop_recv_into(sock, out, n, stats):
+    view = memoryview(bytearray(n))
+    while (k := sock.recv_into(view)):
+        out.write(view[:k])
+
+def loop_adaptive(sock, out, n, stats):
+    view = memoryview(bytearray(n))
+    chunk = buffers.AdaptiveChunk(n)
+    while (k := sock.recv_into(view[:chunk.size])):
+        out.write(view[:k])
+        chunk.record(k)
+
+LOOPS = {"recv": loop_recv, "recv_into": loop_recv_into, "adaptive": loop_adaptive}
+
+def run_loop(loop, n, total, blob):
+    lst = socket.create_server(("127.0.0.1", 0))
+    tx = socket.create_connection(lst.getsockname())
+    rx, _ = lst.accept()
+    lst.close()
+
+    def sender():
+        left = total
+        while left:
+            k = min(left, len(blob))
+            tx.sendall(blob[:k])
+            left -= k
+        tx.close()
+
+    stats = {"allocs": 0, "alloc_bytes": 0}
+    t = threading.Thread(target=sender)
+    with open(os.devnull, "wb") as out:
+        t0, cpu0 = time.perf_counter(), time.thread_time()
+        t.start()
+        loop(rx, out, n, stats)
+        wall, cpu = time.perf_counter() - t0, time.thread_time() - cpu0
+    t.join()
+    rx.close()
+    gb = total / 2**30
+    return total / wall / 2**20, cpu / gb, stats["allocs"] / gb, stats["alloc_bytes"] / gb / 2**20
+
+def end_to_end(addr, n, repeat):
+    ftp_server.BUFFER_SIZE = ftp_client.BUFFER_SIZE = n
+    best_get = best_put = float("inf")
+    with ControlConn(*addr) as ctrl, contextlib.redirect_stdout(io.StringIO()) as out:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            ftp_client.do_get(ctrl, "data.bin", "127.0.0.1")
+            best_get = min(best_get, time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            ftp_client.do_put(ctrl, "data.bin", "127.0.0.1")
+            best_put = min(best_put, time.perf_counter() - t0)
+    assert "[ERR]" not in out.getvalue(), out.getvalue()
+    return best_get, best_put
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-mb", type=int, default=512)
+    ap.add_argument("--e2e-mb", type=int, default=256)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--sizes", default="4K,64K,1M")
+    ap.add_argument("--sndbuf", type=int, default=0)
+    ap.add_argument("--rcvbuf", type=int, default=0)
+    args = ap.parse_args()
+    sizes = args.sizes.split(",")
+    blob = memoryview(os.urandom(8 << 20))
+
+    print(f"Copy loop, {args.size_mb} MB over loopback")
+    print(f"{'buffer':<8}{'loop':<11}{'MB/s':>8}{'CPU s/GB':>10}{'allocs/GB':>11}{'alloc MB/GB':>13}")
+    for text in sizes:
+        for name, loop in LOOPS.items():
+            mbps, cpu, allocs, alloc_mb = run_loop(loop, parse_size(text), args.size_mb << 20, blob)
+            print(f"{text:<8}{name:<11}{mbps:>8.0f}{cpu:>10.2f}{allocs:>11.0f}{alloc_mb:>13.0f}")
+
+    ftp_server._port_pool = ftp_server.PortPool(ftp_server.DATA_PORT_MIN, ftp_server.DATA_PORT_MAX,
+                                                ftp_server.PREBOUND_PORTS, args.sndbuf, args.rcvbuf)
+    connection_handler.SOCKET_SNDBUF, connection_handler.SOCKET_RCVBUF = args.sndbuf, args.rcvbuf
+    ftp_server.GET_MODE = "copy"
+    work = tempfile.mkdtemp(prefix="buffers_bench_")
+    os.chdir(work)
+    with open(os.path.join(ftp_server.BASE_DIR, "data.bin"), "wb") as f:
+        f.write(os.urandom(args.e2e_mb << 20))
+    addr = start_engine(ftp_server.serve)
+
+    print(f"\nEnd to end, {args.e2e_mb} MB file, GET_MODE=copy, best of {args.repeat}, "
+          f"SO_SNDBUF={args.sndbuf or 'auto'} SO_RCVBUF={args.rcvbuf or 'auto'}")
+    print(f"{'buffer':<8}{'GET MB/s':>10}{'PUT MB/s':>10}")
+    for text in sizes:
+        get, put = end_to_end(addr, parse_size(text), args.repeat)
+        print(f"{text:<8}{args.e2e_mb / get:>10.0f}{args.e2e_mb / put:>10.0f}")
+
+if __name__ == "__main__":
+    main()
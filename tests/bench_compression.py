@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark: MODE Z wire bytes and end-to-end GET time at several link speeds.
+
+Serves a CSV file (text, like tests/test_data/medium.csv) and a random file (stands in
+for media/archives) from an in-process server. The client's data socket is wrapped so
+every received byte is paced at the link rate; compression wins when the link, not the
+CPU, is the bottleneck. The random file shows the sampling heuristic sending it raw.
+
+Usage: python3 tests/bench_compression.py [--size-mb 8] [--links 10,100,1000,0]
+                                          [--codecs off,zlib:1,zlib:6,lzma:1]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import PacedSocket, start_engine
+
+from client import ftp_client
+from client.connection_handler import ControlConn, open_data_conn
+from server import ftp_server
+
+CITIES = ["San Francisco", "Los Angeles", "Fullerton", "Seattle", "New York", "Austin"]
+
+def write_csv(path, size):
+    rng = random.Random(7)
+    with open(path, "w") as f:
+        f.write("date,temperature,humidity,location\n")
+        while f.tell() < size:
+            f.write(f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},"
+                    f"{rng.uniform(40, 95):.1f},{rng.randint(20, 90)},{rng.choice(CITIES)}\n")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-mb", type=int, default=8)
+    ap.add_argument("--links", default="10,100,1000,0", help="link speeds in Mbit/s, 0 = unpaced loopback")
+    ap.add_argument("--codecs", default="off,zlib:1,zlib:6,lzma:1")
+    args = ap.parse_args()
+
+    size = args.size_mb << 20
+    write_csv(os.path.join(ftp_server.BASE_DIR, "data.csv"), size)
+    with open(os.path.join(ftp_server.BASE_DIR, "noise.bin"), "wb") as f:
+        f.write(os.urandom(size))
+    os.chdir(tempfile.mkdtemp(prefix="compression_bench_"))
+
+    addr = start_engine(ftp_server.serve)
+
+    print(f"{args.size_mb} MB per file")
+    print(f"{'file':<11}{'codec':<9}{'link Mb/s':>10}{'wire MB':>10}{'ratio':>8}{'seconds':>10}")
+    for name in ("data.csv", "noise.bin"):
+        raw = os.path.getsize(os.path.join(ftp_server.BASE_DIR, name))
+        for link in (float(x) for x in args.links.split(",")):
+            for codec in args.codecs.split(","):
+                stats = {"wire": 0}
+                ftp_client.open_data_conn = lambda host, port: PacedSocket(open_data_conn(host, port), link, stats)
+                with ControlConn(*addr) as ctrl, contextlib.redirect_stdout(io.StringIO()):
+                    if codec != "off":
+                        algo, level = codec.split(":")
+                        ctrl.enable_compression(algo, int(level))
+                    t0 = time.perf_counter()
+                    ftp_client.do_get(ctrl, name, "127.0.0.1")
+                    elapsed = time.perf_counter() - t0
+                assert os.path.getsize(name) == raw
+                os.remove(name)
+                print(f"{name:<11}{codec:<9}{link or 'max':>10}{stats['wire'] / 2**20:>10.2f}"
+                      f"{raw / stats['wire']:>8.2f}{elapsed:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: control-channel commands per second on one session, lock-step vs pipelined, and line assembly cost.
+
+Commands: one session sends --count NOOPs to an in-process server, either one at a time
+(send, wait for the reply) or pipelined in batches of --depth commands per write, reading
+the replies afterwards. Before the buffered LineReader the server dropped every command after
+the first in a segment, so only depth 1 worked.
+
+Line assembly: a single line of each --line-kb size arrives in --segment byte pieces over a
+socketpair. The old loop (buf += part until buf ends with \\n) copies the whole line on every
+piece; LineReader appends to a bytearray and resumes its newline search where it stopped.
+
+Usage: python3 tests/bench_control.py [--count 20000] [--depth 1,8,64] [--line-kb 4,64,256,1024] [--segment 64]
+"""
+
+import argparse
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import start_engine
+
+from client.connection_handler import ControlConn
+from server import ftp_server
+from shared.line_reader import LineReader
+
+def noops_per_second(addr, count, depth):
+    with ControlConn(*addr) as ctrl:
+        t0 = time.perf_counter()
+        for _ in range(count // depth):
+            if depth == 1:
+                ctrl.send_line("NOOP")
+            else:
+                ctrl.send_lines(["NOOP"] * depth)
+            for _ in range(depth):
+                if not ctrl.recv_line().startswith("200"):
+                    raise RuntimeError("NOOP failed")
+        return count // depth * depth / (time.perf_counter() - t0)
+
+def old_readline(sock, segment):
+    buf = b""
+    while not buf.endswith(b"\n"):
+        part = sock.recv(segment)
+        if not part:
+            return None
+        buf += part
+    return buf
+
+def assembly_seconds(read, size, segment, rounds=5):
+    line = b"x" * (size - 1) + b"\n"
+    best = float("inf")
+    for _ in range(rounds):
+        a, b = socket.socketpair()
+        a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size * 2)
+        threading.Thread(target=a.sendall, args=(line,)).start()
+        t0 = time.perf_counter()
+        assert len(read(b, segment).rstrip(b"\n")) == size - 1
+        best = min(best, time.perf_counter() - t0)
+        a.close()
+        b.close()
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--count", type=int, default=20000)
+    ap.add_argument("--depth", default="1,8,64")
+    ap.add_argument("--line-kb", default="4,64,256,1024")
+    ap.add_argument("--segment", type=int, default=64)
+    args = ap.parse_args()
+
+    addr = start_engine(ftp_server.serve)
+
+    print(f"NOOP round trips on one session, {args.count} commands")
+    print(f"{'depth':>6}{'cmds/s':>10}")
+    for depth in map(int, args.depth.split(",")):
+        print(f"{depth:>6}{noops_per_second(addr, args.count, depth):>10.0f}")
+
+    print(f"\nAssembling one line from {args.segment}-byte pieces (best of 5)")
+    print(f"{'line KB':>8}{'buf += part ms':>16}{'LineReader ms':>15}")
+    for kb in map(int, args.line_kb.split(",")):
+        size = kb * 1024
+        old = assembly_seconds(old_readline, size, args.segment)
+        new = assembly_seconds(lambda sock, seg: LineReader(sock, size, seg).readline() + b"\n", size, args.segment)
+        print(f"{kb:>8}{old * 1e3:>16.2f}{new * 1e3:>15.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark: disk usage and upload time for a heavily duplicated corpus, plain vs content-addressed storage.
+
+Uploads --unique distinct artifacts, each under --copies different names, through the
+client's do_put. With FTP_STORAGE=plain every name is its own file; with cas the client
+asks CHECK <sha256> first and only the first copy of each artifact crosses the wire,
+the rest become LINKs to the stored object. The client's data sockets are paced at
+--link-mbps so upload time reflects a real network rather than loopback.
+
+Usage: python3 tests/bench_dedup.py [--unique 20] [--copies 10] [--size-mb 4] [--link-mbps 1000]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import PacedSocket, start_engine
+
+from client import ftp_client
+from client.connection_handler import ControlConn, open_data_conn
+from server import ftp_server
+from server.object_store import ObjectStore
+
+def disk_usage(path):
+    """Bytes allocated under path, counting each hard-linked inode once."""
+    seen, total = set(), 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            if st.st_ino not in seen:
+                seen.add(st.st_ino)
+                total += st.st_blocks * 512
+    return total
+
+def reset_base_dir():
+    """Remove stored files and the object store; the server's .uploads and .locks directories stay."""
+    for name in os.listdir(ftp_server.BASE_DIR):
+        full = os.path.join(ftp_server.BASE_DIR, name)
+        if name == ".objects":
+            shutil.rmtree(full)
+        elif not os.path.isdir(full):
+            os.remove(full)
+
+def check_stored(paths):
+    """Fail the run unless every upload arrived whole (do_put's own messages are hidden)."""
+    for path in paths:
+        stored = os.path.join(ftp_server.BASE_DIR, os.path.basename(path))
+        if not os.path.isfile(stored) or os.path.getsize(stored) != os.path.getsize(path):
+            raise SystemExit(f"upload of {path} failed; nothing stored as {stored}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--unique", type=int, default=20)
+    ap.add_argument("--copies", type=int, default=10)
+    ap.add_argument("--size-mb", type=int, default=4)
+    ap.add_argument("--link-mbps", type=float, default=1000)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="dedup_bench_")
+    paths = []
+    for u in range(args.unique):
+        first = os.path.join(work, f"artifact_{u:03d}_00.bin")
+        with open(first, "wb") as f:
+            f.write(os.urandom(args.size_mb << 20))
+        paths.append(first)
+        for c in range(1, args.copies):
+            path = os.path.join(work, f"artifact_{u:03d}_{c:02d}.bin")
+            os.link(first, path)
+            paths.append(path)
+
+    addr = start_engine(ftp_server.serve)
+
+    logical = len(paths) * (args.size_mb << 20)
+    print(f"{len(paths)} uploads ({args.unique} unique x {args.copies} names, {args.size_mb} MB each), "
+          f"{logical / 2**20:.0f} MB logical, link {args.link_mbps or 'unpaced'} Mbit/s")
+    print(f"{'storage':<9}{'disk MB':>10}{'wire MB':>10}{'seconds':>10}")
+    for storage in ("plain", "cas"):
+        reset_base_dir()
+        ftp_server._store = (ObjectStore(os.path.join(ftp_server.BASE_DIR, ".objects"), ftp_server._dir_index)
+                             if storage == "cas" else None)
+        stats = {"wire": 0}
+        ftp_client.open_data_conn = lambda host, port: PacedSocket(open_data_conn(host, port), args.link_mbps, stats, "send")
+        with ControlConn(*addr) as ctrl, contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            for path in paths:
+                ftp_client.do_put(ctrl, path, "127.0.0.1")
+            elapsed = time.perf_counter() - t0
+        check_stored(paths)
+        print(f"{storage:<9}{disk_usage(ftp_server.BASE_DIR) / 2**20:>10.0f}"
+              f"{stats['wire'] / 2**20:>10.0f}{elapsed:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark: updating a large file on the server with SYNC (delta) vs re-uploading it with PUT.
+
+The server holds a random file of --size-mb; the client's version differs in about
+--change-pct percent of its bytes, spread over --edits places: mostly in-place overwrites
+plus --inserts insertions, which shift everything after them and make the client roll
+its checksum to find the blocks again. The client's data sockets are paced at each
+--links speed (0 = unpaced loopback) and count the bytes the client sends.
+
+Usage: python3 tests/bench_delta.py [--size-mb 1024] [--change-pct 1] [--edits 64]
+                                    [--inserts 2] [--links 1000,0]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import PacedSocket, start_engine
+
+from client import ftp_client
+from client.connection_handler import ControlConn, open_data_conn
+from server import ftp_server
+
+CHUNK = 8 << 20
+
+def write_random(path, size):
+    with open(path, "wb") as f:
+        for off in range(0, size, CHUNK):
+            f.write(os.urandom(min(CHUNK, size - off)))
+
+def write_edited(src, dst, size, change_pct, edits, inserts, rng):
+    """Copy src to dst with `edits` changed runs totalling change_pct of size; `inserts` of them are insertions."""
+    run = max(1, int(size * change_pct / 100 / max(edits, 1)))
+    places = sorted(rng.sample(range(0, size - run), edits))
+    kinds = set(rng.sample(range(edits), min(inserts, edits)))
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        pos = 0
+        for k, at in enumerate(places):
+            at = max(at, pos)
+            while pos < at:
+                chunk = fin.read(min(CHUNK, at - pos))
+                fout.write(chunk)
+                pos += len(chunk)
+            fout.write(os.urandom(run))
+            if k not in kinds:
+                fin.seek(run, os.SEEK_CUR)  # overwrite: skip the replaced bytes
+                pos += run
+        shutil.copyfileobj(fin, fout, CHUNK)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-mb", type=int, default=1024)
+    ap.add_argument("--change-pct", type=float, default=1.0)
+    ap.add_argument("--edits", type=int, default=64)
+    ap.add_argument("--inserts", type=int, default=2)
+    ap.add_argument("--links", default="1000,0", help="link speeds in Mbit/s, 0 = unpaced loopback")
+    args = ap.parse_args()
+
+    size = args.size_mb << 20
+    work = tempfile.mkdtemp(prefix="delta_bench_")
+    old = os.path.join(work, "old.bin")
+    new = os.path.join(work, "data.bin")
+    write_random(old, size)
+    write_edited(old, new, size, args.change_pct, args.edits, args.inserts, random.Random(3))
+    target = os.path.join(ftp_server.BASE_DIR, "data.bin")
+
+    addr = start_engine(ftp_server.serve)
+
+    print(f"{args.size_mb} MB file, {args.change_pct}% changed in {args.edits} places "
+          f"({args.inserts} insertions), block {ftp_server.delta.block_size_for(size) >> 10} KiB")
+    print(f"{'method':<8}{'link Mb/s':>10}{'wire MB':>10}{'seconds':>10}")
+    for link in (float(x) for x in args.links.split(",")):
+        for method in ("PUT", "SYNC"):
+            shutil.copyfile(old, target)
+            stats = {"wire": 0}
+            ftp_client.open_data_conn = lambda host, port: PacedSocket(open_data_conn(host, port), link, stats, "send")
+            with ControlConn(*addr) as ctrl, contextlib.redirect_stdout(io.StringIO()) as out:
+                t0 = time.perf_counter()
+                if method == "PUT":
+                    ftp_client.do_put(ctrl, new, "127.0.0.1")
+                else:
+                    ftp_client.do_sync(ctrl, new, "127.0.0.1")
+                elapsed = time.perf_counter() - t0
+            assert "[OK]" in out.getvalue(), out.getvalue()
+            assert os.path.getsize(target) == os.path.getsize(new)
+            print(f"{method:<8}{link or 'max':>10}{stats['wire'] / 2**20:>10.1f}{elapsed:>10.2f}")
+    shutil.rmtree(work)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET/PUT throughput with each DIGEST algorithm against no digest.
+
+Transfers one --size-mb random file over loopback with the client's do_get/do_put. Both
+sides hash in-stream, so the overhead shows up as lost throughput. GET is measured cold
+(server hashes while sending) and warm (digest served from the (name, size, mtime) cache,
+only the client hashes).
+
+Usage: python3 tests/bench_digest.py [--size-mb 256] [--repeat 3] [--algos none,crc32,adler32,md5,sha256]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import start_engine
+
+from client import ftp_client
+from client.connection_handler import ControlConn
+from server import ftp_server
+from server.digest_cache import DigestCache
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-mb", type=int, default=256)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--algos", default="none,crc32,adler32,md5,sha256")
+    args = ap.parse_args()
+
+    size = args.size_mb << 20
+    work = tempfile.mkdtemp(prefix="digest_bench_")
+    os.chdir(work)
+    with open(os.path.join(ftp_server.BASE_DIR, "data.bin"), "wb") as f:
+        f.write(os.urandom(size))
+    with open("upload.bin", "wb") as f:
+        f.write(os.urandom(size))
+
+    addr = start_engine(ftp_server.serve)
+
+    print(f"{args.size_mb} MB file, best of {args.repeat}, GET_MODE={ftp_server.GET_MODE}")
+    print(f"{'digest':<9}{'GET cold MB/s':>15}{'GET warm MB/s':>15}{'PUT MB/s':>10}{'GET cold overhead':>19}")
+    base = None
+    for algo in args.algos.split(","):
+        with ControlConn(*addr) as ctrl, contextlib.redirect_stdout(io.StringIO()) as out:
+            if algo != "none":
+                ctrl.enable_digest(algo)
+
+            def cold_get():
+                ftp_server._digest_cache = DigestCache(4096)
+                ftp_client.do_get(ctrl, "data.bin", "127.0.0.1")
+
+            cold = best_of(args.repeat, cold_get)
+            warm = best_of(args.repeat, lambda: ftp_client.do_get(ctrl, "data.bin", "127.0.0.1"))
+            put = best_of(args.repeat, lambda: ftp_client.do_put(ctrl, "upload.bin", "127.0.0.1"))
+        assert "[ERR]" not in out.getvalue(), out.getvalue()
+        base = base or cold
+        print(f"{algo:<9}{args.size_mb / cold:>15.0f}{args.size_mb / warm:>15.0f}"
+              f"{args.size_mb / put:>10.0f}{(cold / base - 1) * 100:>18.0f}%")
+
+if __name__ == "__main__":
+    main()
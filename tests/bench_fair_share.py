@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: small-request tail latency next to large downloads, with and without fair-share scheduling.
+
+--big clients download a --big-mb file over and over while --small clients time GETs of a
+16 KiB file (request to 226). FTP_GLOBAL_RATE is set to --nic-mbps, which stands in for the
+EC2 NIC that the large downloads saturate. Each scenario runs for --seconds:
+  fifo  global rate limit, waiters served in arrival order (FTP_FAIR_SHARE=0)
+  fair  global rate limit, least-served transfer first (FTP_FAIR_SHARE=1)
+
+Usage: python3 tests/bench_fair_share.py [--nic-mbps 200] [--big 4] [--small 4] [--big-mb 64] [--seconds 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import start_engine
+
+from client.connection_handler import ControlConn, open_data_conn
+from server import ftp_server
+from shared import protocol
+
+def fetch(ctrl, name, buf):
+    """GET name and discard the bytes; returns the byte count."""
+    ctrl.send_line(f"GET {name}")
+    first = ctrl.recv_line()
+    parts = first.split()
+    ds = open_data_conn("127.0.0.1", int(parts[parts.index("PORT") + 1]))
+    got = 0
+    with ds:
+        while (k := ds.recv_into(buf)):
+            got += k
+    if not ctrl.recv_line().startswith(protocol.DONE):
+        raise RuntimeError(f"GET {name} failed")
+    return got
+
+def run(addr, args, stop):
+    big_bytes = [0] * args.big
+    small_lat = []
+
+    def big(i):
+        buf = bytearray(1 << 20)
+        with ControlConn(*addr) as ctrl:
+            while not stop.is_set():
+                big_bytes[i] += fetch(ctrl, "big.bin", buf)
+
+    def small():
+        buf = bytearray(64 * 1024)
+        with ControlConn(*addr) as ctrl:
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                fetch(ctrl, "small.bin", buf)
+                small_lat.append(time.perf_counter() - t0)
+                time.sleep(0.02)
+
+    threads = [threading.Thread(target=big, args=(i,)) for i in range(args.big)]
+    threads += [threading.Thread(target=small) for _ in range(args.small)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(big_bytes) / (time.perf_counter() - t0), sorted(small_lat)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--nic-mbps", type=float, default=200)
+    ap.add_argument("--big", type=int, default=4)
+    ap.add_argument("--small", type=int, default=4)
+    ap.add_argument("--big-mb", type=int, default=64)
+    ap.add_argument("--seconds", type=float, default=5)
+    args = ap.parse_args()
+
+    with open(os.path.join(ftp_server.BASE_DIR, "big.bin"), "wb") as f:
+        f.write(os.urandom(args.big_mb << 20))
+    with open(os.path.join(ftp_server.BASE_DIR, "small.bin"), "wb") as f:
+        f.write(os.urandom(16 * 1024))
+
+    addr = start_engine(ftp_server.serve, backlog=64)
+
+    ftp_server.GLOBAL_RATE = int(args.nic_mbps * 1e6 / 8)
+    print(f"NIC {args.nic_mbps:.0f} Mbit/s, {args.big} x {args.big_mb} MB downloads, "
+          f"{args.small} clients GETting 16 KiB, {args.seconds:.0f} s each")
+    print(f"{'scheduler':<10}{'small n':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'big MB/s':>10}")
+    for name, fair in (("fifo", False), ("fair", True)):
+        ftp_server.FAIR_SHARE = fair
+        ftp_server._egress, ftp_server._ingress = ftp_server.make_schedulers()
+        rate, lat = run(addr, args, threading.Event())
+        p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+        print(f"{name:<10}{len(lat):>8}{statistics.median(lat) * 1e3:>9.1f}{p99 * 1e3:>9.1f}"
+              f"{lat[-1] * 1e3:>9.1f}{rate / 2**20:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Benchmark: reproducible load generator reporting latency percentiles, throughput and CPU per byte as JSON.
+
+Starts the server as a subprocess (python3 -m server.ftp_server) on a free port with a fresh
+temporary FTP_BASE_DIR, fills it with --files files drawn from --sizes, then runs one round per
+--clients value. Every client opens its own control session and runs --ops operations picked
+from --mix by an RNG seeded with (--seed, round, client), so the same arguments replay the same
+workload:
+  get   GET a stored file (uniform popularity, or Zipf with exponent --zipf)
+  put   PUT a --sizes sized file under the client's own name
+  ls    LS the whole directory
+  miss  GET a file that doesn't exist (expects 550)
+Latency runs from sending the command to its final reply; "connect" is the time to the 220
+banner. CPU is read from /proc/<pid>/stat for the server and /proc/self/stat for the load
+generator, and divided by the data bytes moved. On one machine the two compete for the CPUs,
+so compare reports taken on the same host.
+
+Sizes: fixed:64K | uniform:1K:1M | lognormal:<median>:<sigma> | choice:4K,64K,1M
+--scenario picks defaults: "sweep" (1 to 1000 clients), or one of the old test_multiclient.py
+cases (concurrent-put, mixed, large-files, errors, stress); explicit flags override them.
+--host/--port drive a running server instead (server CPU is then not reported). --baseline
+compares against an earlier report and exits 1 when a round regressed more than --tolerance.
+
+Usage: python3 tests/bench_load.py [--scenario sweep] [--clients 1,10,100,1000] [--ops 20]
+       [--sizes lognormal:64K:1.5] [--mix get=70,put=20,ls=10] [--zipf 0] [--engine threads]
+       [--server-env FTP_WORKERS=256] [--out report.json] [--baseline old.json] [--tolerance 0.15]
+"""
+
+import argparse
+import bisect
+import contextlib
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from client.connection_handler import ControlConn
+from shared import protocol
+
+SCENARIOS = {
+    "sweep": dict(clients="1,10,100,1000", ops=20, mix="get=70,put=20,ls=10", sizes="lognormal:64K:1.5"),
+    "concurrent-put": dict(clients="3", ops=1, mix="put=100", sizes="choice:1400,1M"),
+    "mixed": dict(clients="3", ops=4, mix="get=40,put=30,ls=30", sizes="choice:1400,1M"),
+    "large-files": dict(clients="3", ops=2, mix="get=50,put=50", sizes="fixed:10M"),
+    "errors": dict(clients="3", ops=1, mix="miss=67,put=33", sizes="fixed:1400"),
+    "stress": dict(clients="5", ops=4, mix="get=30,put=40,ls=30", sizes="choice:1400,1M,10M"),
+}
+OPS = ("get", "put", "ls", "miss")
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+BLOB_SIZE = 4 << 20  # PUT payloads are cut from one random buffer
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+class OpError(Exception):
+    """The server answered, but not with the expected reply (the session is still in sync)."""
+
+def parse_size(text):
+    text = text.strip().upper().removesuffix("B")
+    if text[-1:] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+def size_sampler(spec, max_size):
+    """A function rng -> size in bytes for a --sizes spec."""
+    kind, _, rest = spec.partition(":")
+    if kind == "fixed":
+        n = parse_size(rest)
+        return lambda rng: n
+    if kind == "uniform":
+        lo, hi = map(parse_size, rest.split(":"))
+        return lambda rng: rng.randint(lo, hi)
+    if kind == "lognormal":
+        median, sigma = rest.split(":")
+        mu = math.log(parse_size(median))
+        return lambda rng: min(max_size, int(rng.lognormvariate(mu, float(sigma))))
+    if kind == "choice":
+        sizes = [parse_size(s) for s in rest.split(",")]
+        return lambda rng: rng.choice(sizes)
+    raise ValueError(f"unknown size distribution {spec!r}")
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        op, _, weight = item.partition("=")
+        if op not in OPS:
+            raise ValueError(f"unknown operation {op!r} in --mix (use {', '.join(OPS)})")
+        mix[op] = float(weight or 1)
+    return mix
+
+class Workload:
+    """The seeded corpus and per-client operation plans."""
+
+    def __init__(self, mix, sizes, files, zipf, ops, seed, max_size):
+        self.names, self.weights = zip(*mix.items())
+        self.size = size_sampler(sizes, max_size)
+        self.files = files
+        self.ops = ops
+        self.seed = seed
+        self.cum = list(itertools.accumulate(1 / (j + 1) ** zipf for j in range(files)))
+
+    def corpus(self):
+        rng = random.Random(f"{self.seed}/corpus")
+        return [(f"f{j:05d}.bin", self.size(rng)) for j in range(self.files)]
+
+    def plan(self, round_clients, client):
+        """[(op, arg)] for one client: a file name for get, a size for put."""
+        rng = random.Random(f"{self.seed}/{round_clients}/{client}")
+        plan = []
+        for _ in range(self.ops):
+            op = rng.choices(self.names, self.weights)[0]
+            arg = None
+            if op == "get":
+                j = bisect.bisect(self.cum, rng.random() * self.cum[-1])
+                arg = f"f{min(j, self.files - 1):05d}.bin"
+            elif op == "put":
+                arg = self.size(rng)
+            plan.append((op, arg))
+        return plan
+
+def open_data(host, reply, timeout):
+    parts = reply.split()
+    return socket.create_connection((host, int(parts[parts.index("PORT") + 1])), timeout)
+
+def expect(ctrl, prefix):
+    reply = ctrl.recv_line()
+    if not reply.startswith(prefix):
+        raise OpError(reply)
+    return reply
+
+def op_get(ctrl, host, name, buf, timeout):
+    ctrl.send_line(f"GET {name}")
+    first = expect(ctrl, protocol.OK)
+    parts = first.split()
+    size = int(parts[parts.index("SIZE") + 1])
+    got = 0
+    with open_data(host, first, timeout) as ds:
+        while (k := ds.recv_into(buf)):
+            got += k
+    last = expect(ctrl, protocol.DONE)
+    if got != size:
+        raise OpError(f"{last} after {got} of {size} bytes")
+    return got
+
+def op_put(ctrl, host, name, size, blob, timeout):
+    ctrl.send_line(f"PUT {name} SIZE {size}")
+    first = expect(ctrl, protocol.OK)
+    with open_data(host, first, timeout) as ds:
+        left = size
+        while left:
+            n = min(left, len(blob))
+            ds.sendall(blob[:n])
+            left -= n
+    expect(ctrl, protocol.DONE)
+    return size
+
+def op_ls(ctrl, host, buf, timeout):
+    ctrl.send_line("LS")
+    first = expect(ctrl, protocol.OK)
+    got = 0
+    with open_data(host, first, timeout) as ds:
+        while (k := ds.recv_into(buf)):
+            got += k
+    expect(ctrl, protocol.DONE)
+    return got
+
+def op_miss(ctrl, client):
+    ctrl.send_line(f"GET missing_{client}.bin")
+    expect(ctrl, protocol.ERR)
+    return 0
+
+@contextlib.contextmanager
+def connect(addr, timeout):
+    """A control session, retrying while the server answers 421 (session limit)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        ctrl = ControlConn(*addr)
+        ctrl.sock.settimeout(timeout)
+        try:
+            ctrl.__enter__()
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+    try:
+        yield ctrl
+    finally:
+        ctrl.__exit__(None, None, None)
+
+def run_client(addr, client, plan, blob, args, start, records):
+    """Run one client's plan; appends (op, seconds, bytes, error or None) to records."""
+    host = addr[0]
+    buf = bytearray(256 * 1024)
+    start.wait()
+    t0 = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        try:
+            ctrl = stack.enter_context(connect(addr, args.timeout))
+        except OSError as e:
+            records.append(("connect", time.perf_counter() - t0, 0, f"{type(e).__name__}: {e}"))
+            return
+        records.append(("connect", time.perf_counter() - t0, 0, None))
+        for op, arg in plan:
+            t0 = time.perf_counter()
+            try:
+                if op == "get":
+                    n = op_get(ctrl, host, arg, buf, args.timeout)
+                elif op == "put":
+                    n = op_put(ctrl, host, f"up_{client}.bin", arg, blob, args.timeout)
+                elif op == "ls":
+                    n = op_ls(ctrl, host, buf, args.timeout)
+                else:
+                    n = op_miss(ctrl, client)
+            except OpError as e:
+                records.append((op, time.perf_counter() - t0, 0, str(e)))
+            except OSError as e:
+                # The control session may be out of step now; give up on this client's plan.
+                records.append((op, time.perf_counter() - t0, 0, f"{type(e).__name__}: {e}"))
+                return
+            else:
+                records.append((op, time.perf_counter() - t0, n, None))
+            if args.think_ms:
+                time.sleep(args.think_ms / 1000)
+        try:
+            ctrl.send_line("EXIT")
+        except OSError:
+            pass
+
+def cpu_seconds(pid="self"):
+    """utime + stime of a process from /proc/<pid>/stat."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+def peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+def latency_summary(seconds):
+    values = sorted(seconds)
+    return {
+        "n": len(values),
+        "p50": round(percentile(values, 0.50) * 1e3, 3),
+        "p99": round(percentile(values, 0.99) * 1e3, 3),
+        "max": round(values[-1] * 1e3, 3),
+        "mean": round(sum(values) / len(values) * 1e3, 3),
+    }
+
+def run_round(addr, workload, clients, blob, args, server_pid=None):
+    """Run `clients` concurrent clients once; returns the round's report dict."""
+    start = threading.Event()
+    per_client = [[] for _ in range(clients)]
+    threads = [
+        threading.Thread(target=run_client, args=(addr, i, workload.plan(clients, i), blob, args, start, per_client[i]))
+        for i in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    server_cpu0 = cpu_seconds(server_pid) if server_pid else None
+    client_cpu0 = cpu_seconds()
+    t0 = time.perf_counter()
+    start.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    server_cpu = cpu_seconds(server_pid) - server_cpu0 if server_pid else None
+    client_cpu = cpu_seconds() - client_cpu0
+
+    latencies = defaultdict(list)
+    moved = Counter()
+    errors = Counter()
+    samples = []
+    for op, seconds, n, err in itertools.chain.from_iterable(per_client):
+        if err is not None:
+            errors[op] += 1
+            if len(samples) < 5:
+                samples.append(f"{op}: {err}")
+            continue
+        latencies[op].append(seconds)
+        if op != "connect":
+            moved[op] += n
+    ops_done = sum(len(v) for op, v in latencies.items() if op != "connect")
+    total = sum(moved.values())
+    all_ops = [s for op, v in latencies.items() if op != "connect" for s in v]
+    return {
+        "clients": clients,
+        "ops": ops_done,
+        "errors": dict(errors),
+        "error_samples": samples,
+        "wall_seconds": round(wall, 3),
+        "ops_per_second": round(ops_done / wall, 1),
+        "bytes": dict(moved),
+        "throughput_mb_per_second": round(total / wall / 2**20, 2),
+        "latency_ms": {op: latency_summary(v) for op, v in sorted(latencies.items())}
+                      | ({"all": latency_summary(all_ops)} if all_ops else {}),
+        "server_cpu_seconds": None if server_cpu is None else round(server_cpu, 3),
+        "server_cpu_ns_per_byte": round(server_cpu * 1e9 / total, 3) if server_cpu is not None and total else None,
+        "client_cpu_seconds": round(client_cpu, 3),
+        "client_cpu_ns_per_byte": round(client_cpu * 1e9 / total, 3) if total else None,
+        "server_peak_rss_mb": round(peak_rss_mb(server_pid), 1) if server_pid else None,
+    }
+
+def start_server(work, args, max_clients):
+    """Launch the server on a free loopback port with FTP_BASE_DIR=<work>/files; returns (proc, addr)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(project_root),
+        FTP_HOST="127.0.0.1",
+        FTP_PORT=str(port),
+        FTP_BASE_DIR=os.path.join(work, "files"),
+        FTP_ENGINE=args.engine,
+        FTP_MAX_PENDING=str(max(256, max_clients)),
+        FTP_BACKLOG=str(max(128, max_clients)),
+        FTP_POOL_STATS_INTERVAL="0",
+    )
+    for item in args.server_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log_path = os.path.join(work, "server.log")
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen([sys.executable, "-m", "server.ftp_server"], cwd=project_root, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 15
+    while True:
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            raise RuntimeError("server did not start:\n" + Path(log_path).read_text())
+        try:
+            with socket.create_connection(("127.0.0.1", port), 1) as probe:
+                probe.recv(128)  # 220 banner: the server is accepting sessions
+            return proc, ("127.0.0.1", port)
+        except OSError:
+            time.sleep(0.05)
+
+def fill_corpus(workload, base_dir=None, addr=None, blob=None, timeout=60):
+    """Create the corpus directly in base_dir, or upload it to a running server."""
+    if base_dir is not None:
+        for name, size in workload.corpus():
+            with open(os.path.join(base_dir, name), "wb") as f:
+                f.write(os.urandom(size))
+        return
+    with connect(addr, timeout) as ctrl:
+        for name, size in workload.corpus():
+            op_put(ctrl, addr[0], name, size, blob, timeout)
+
+def regressions(report, baseline, tolerance):
+    """Round-by-round comparison with an earlier report: throughput, overall p99, server CPU per byte."""
+    checks = (
+        ("throughput MB/s", lambda r: r["throughput_mb_per_second"], -1),
+        ("p99 ms", lambda r: r["latency_ms"].get("all", {}).get("p99"), 1),
+        ("server CPU ns/byte", lambda r: r["server_cpu_ns_per_byte"], 1),
+    )
+    previous = {r["clients"]: r for r in baseline["runs"]}
+    found = []
+    for run in report["runs"]:
+        old = previous.get(run["clients"])
+        if old is None:
+            continue
+        for label, value, sign in checks:
+            before, after = value(old), value(run)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if sign * change > tolerance:
+                found.append(f"{run['clients']} clients: {label} {before} -> {after} ({change:+.0%})")
+    return found
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--scenario", choices=sorted(SCENARIOS), default="sweep")
+    ap.add_argument("--clients", help="comma-separated concurrency sweep, e.g. 1,10,100,1000")
+    ap.add_argument("--ops", type=int, help="operations per client per round")
+    ap.add_argument("--mix", help="operation weights, e.g. get=70,put=20,ls=10,miss=0")
+    ap.add_argument("--sizes", help="file size distribution for the corpus and PUTs")
+    ap.add_argument("--max-size", default="256M", help="cap on lognormal sizes")
+    ap.add_argument("--files", type=int, default=64, help="files in the GET corpus")
+    ap.add_argument("--zipf", type=float, default=0, help="GET popularity skew (0 = uniform)")
+    ap.add_argument("--think-ms", type=float, default=0, help="pause between a client's operations")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--timeout", type=float, default=60, help="socket timeout in seconds")
+    ap.add_argument("--engine", choices=("threads", "asyncio"), default="threads")
+    ap.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                    help="extra environment for the server process (repeatable)")
+    ap.add_argument("--host", help="drive a running server instead of starting one")
+    ap.add_argument("--port", type=int, default=2121)
+    ap.add_argument("--out", help="write the JSON report here instead of stdout")
+    ap.add_argument("--baseline", help="earlier JSON report to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = ap.parse_args()
+    for key, value in SCENARIOS[args.scenario].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+
+    sweep = [int(c) for c in args.clients.split(",")]
+    workload = Workload(parse_mix(args.mix), args.sizes, args.files, args.zipf, args.ops, args.seed,
+                        parse_size(args.max_size))
+    # Thousands of clients: a control and a data socket each, and a thread each.
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    threading.stack_size(512 * 1024)
+    blob = memoryview(os.urandom(BLOB_SIZE))
+
+    work = proc = None
+    try:
+        if args.host:
+            addr = (args.host, args.port)
+            fill_corpus(workload, addr=addr, blob=blob, timeout=args.timeout)
+        else:
+            work = tempfile.mkdtemp(prefix="ftp_load_")
+            os.mkdir(os.path.join(work, "files"))
+            fill_corpus(workload, base_dir=os.path.join(work, "files"))
+            proc, addr = start_server(work, args, max(sweep))
+
+        print(f"scenario {args.scenario}: {args.ops} ops/client, mix {args.mix}, sizes {args.sizes}, "
+              f"{args.files} files, engine {args.engine if proc else 'external'}", file=sys.stderr)
+        print(f"{'clients':>8}{'ops/s':>10}{'MB/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'srv ns/B':>10}{'errors':>8}",
+              file=sys.stderr)
+        runs = []
+        for clients in sweep:
+            run = run_round(addr, workload, clients, blob, args, proc.pid if proc else None)
+            runs.append(run)
+            lat = run["latency_ms"].get("all", {})
+            ns = run["server_cpu_ns_per_byte"]
+            print(f"{clients:>8}{run['ops_per_second']:>10.0f}{run['throughput_mb_per_second']:>9.1f}"
+                  f"{lat.get('p50', 0):>9.1f}{lat.get('p99', 0):>9.1f}{'-' if ns is None else f'{ns:.2f}':>10}"
+                  f"{sum(run['errors'].values()):>8}", file=sys.stderr)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if work is not None:
+            shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in ("scenario", "clients", "ops", "mix", "sizes", "max_size", "files", "zipf",
+                        "think_ms", "seed", "engine", "server_env", "host")
+        },
+        "host": {"python": platform.python_version(), "kernel": platform.release(), "cpus": os.cpu_count()},
+        "runs": runs,
+    }
+    found = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("warning: baseline was taken with a different workload configuration", file=sys.stderr)
+        found = regressions(report, baseline, args.tolerance)
+        report["regressions"] = found
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for line in found:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    sys.exit(1 if found else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: LS latency against directory size, per-request stat scan vs DirIndex.
+
+For each file count, fills a scratch directory and times building the LS payload:
+  scan      - the old handle_ls body (listdir + isfile/getsize/getmtime per entry)
+  cold      - first DirIndex.listing() (one scandir pass)
+  warm      - DirIndex.listing() with an unchanged directory (one stat)
+  commit    - listing() right after an upload was committed through the index
+
+Usage: python3 tests/bench_ls_index.py [--counts 100,1000,10000,50000] [--repeat 5]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from server.dir_index import DirIndex
+
+def legacy_listing(base_dir):
+    rows = []
+    for name in os.listdir(base_dir):
+        path = os.path.join(base_dir, name)
+        if os.path.isfile(path):
+            size = os.path.getsize(path)
+            mtime = int(os.path.getmtime(path))
+            rows.append(f"{name} {size} {mtime}")
+    text = ("\n".join(rows) + "\n") if rows else ""
+    return text.encode("utf-8")
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e3
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--counts", default="100,1000,10000,50000")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'files':>8}{'scan ms':>10}{'cold ms':>10}{'warm ms':>10}{'commit ms':>11}")
+    for count in map(int, args.counts.split(",")):
+        base = tempfile.mkdtemp(prefix="ls_bench_")
+        uploads = os.path.join(base, ".uploads")
+        os.mkdir(uploads)
+        try:
+            for i in range(count):
+                with open(os.path.join(base, f"file_{i:07d}.dat"), "wb") as f:
+                    f.write(b"x" * (i % 512))
+            scan = best_of(lambda: legacy_listing(base), args.repeat)
+            index = DirIndex(base)
+            t0 = time.perf_counter()
+            index.listing()
+            cold = (time.perf_counter() - t0) * 1e3
+            warm = best_of(index.listing, args.repeat)
+
+            def commit_then_list():
+                tmp = os.path.join(uploads, "new.upload")
+                with open(tmp, "wb") as f:
+                    f.write(b"new")
+                index.commit(tmp, os.path.join(base, "new.dat"))
+                index.listing()
+            commit = best_of(commit_then_list, args.repeat)
+            print(f"{count:>8}{scan:>10.2f}{cold:>10.2f}{warm:>10.3f}{commit:>11.2f}")
+        finally:
+            shutil.rmtree(base)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: --clients concurrent clients fetching the same hot file, per FTP_GET_MODE (sendfile, copy, mmap).
+
+For each mode a server subprocess is started on a fresh temporary FTP_BASE_DIR holding one
+--size-mb file (random bytes). One untimed GET warms the page cache (and, for mmap, the
+mapping cache); then --clients sessions GET the file at once, --rounds times each. Reported:
+aggregate MB/s, GET latency p50/p99, server CPU seconds per GB sent (/proc/<pid>/stat) and the
+server's peak RSS. Mapped pages are shared page-cache pages, so mmap's RSS counts the file once
+however many clients read it, while copy holds a BUFFER_SIZE buffer per transfer.
+
+Usage: python3 tests/bench_mmap.py [--clients 100] [--size-mb 100] [--rounds 1] [--modes sendfile,copy,mmap]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import bench_load
+
+def fetch_all(addr, clients, rounds, timeout):
+    """GET hot.bin from `clients` sessions at once; returns (wall seconds, sorted latencies, bytes)."""
+    latencies, errors, moved = [], [], [0]
+    lock = threading.Lock()
+    start = threading.Barrier(clients + 1)
+
+    def client():
+        buf = bytearray(256 * 1024)
+        try:
+            with bench_load.connect(addr, timeout) as ctrl:
+                start.wait()
+                for _ in range(rounds):
+                    t0 = time.perf_counter()
+                    n = bench_load.op_get(ctrl, addr[0], "hot.bin", buf, timeout)
+                    with lock:
+                        latencies.append(time.perf_counter() - t0)
+                        moved[0] += n
+                ctrl.send_line("EXIT")
+        except (OSError, bench_load.OpError, threading.BrokenBarrierError) as e:
+            errors.append(e)
+            start.abort()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    if errors:
+        raise RuntimeError(f"{len(errors)} clients failed, first: {errors[0]!r}")
+    return wall, sorted(latencies), moved[0]
+
+def run_mode(mode, args):
+    work = tempfile.mkdtemp(prefix="ftp_mmap_")
+    os.mkdir(os.path.join(work, "files"))
+    with open(os.path.join(work, "files", "hot.bin"), "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1 << 20))
+    server_args = argparse.Namespace(engine="threads", server_env=[
+        f"FTP_GET_MODE={mode}",
+        f"FTP_WORKERS={args.clients + 8}",
+        f"FTP_MMAP_CACHE_MB={max(1024, args.size_mb * 2)}",
+    ])
+    proc, addr = bench_load.start_server(work, server_args, args.clients)
+    try:
+        fetch_all(addr, 1, 1, args.timeout)
+        cpu0 = bench_load.cpu_seconds(proc.pid)
+        wall, lat, moved = fetch_all(addr, args.clients, args.rounds, args.timeout)
+        cpu = bench_load.cpu_seconds(proc.pid) - cpu0
+        return {
+            "mb_per_second": moved / wall / 2**20,
+            "p50_ms": bench_load.percentile(lat, 0.50) * 1e3,
+            "p99_ms": bench_load.percentile(lat, 0.99) * 1e3,
+            "cpu_s_per_gb": cpu / (moved / 2**30),
+            "peak_rss_mb": bench_load.peak_rss_mb(proc.pid),
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(work, ignore_errors=True)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--clients", type=int, default=100)
+    ap.add_argument("--size-mb", type=int, default=100)
+    ap.add_argument("--rounds", type=int, default=1)
+    ap.add_argument("--modes", default="sendfile,copy,mmap")
+    ap.add_argument("--timeout", type=float, default=600)
+    args = ap.parse_args()
+
+    print(f"{args.clients} clients x {args.rounds} GET of one {args.size_mb} MB file")
+    print(f"{'mode':<10}{'MB/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'CPU s/GB':>10}{'peak RSS MB':>13}")
+    for mode in args.modes.split(","):
+        r = run_mode(mode, args)
+        print(f"{mode:<10}{r['mb_per_second']:>8.0f}{r['p50_ms']:>9.0f}{r['p99_ms']:>9.0f}"
+              f"{r['cpu_s_per_gb']:>10.3f}{r['peak_rss_mb']:>13.1f}")
+
+if __name__ == "__main__":
+    main()
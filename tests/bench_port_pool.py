@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: passive data-port allocation latency at high port utilization.
+
+Holds --util of the 20000-21000 window with listening sockets (standing in for
+slow clients and ports that cannot be rebound), then times acquire+release
+cycles for:
+  legacy   - the old round-robin open_data_listener (bind() until one succeeds)
+  pool     - server.port_pool.PortPool with pre-bound listeners
+
+Usage: python3 tests/bench_port_pool.py [--util 0.9] [--cycles 2000]
+"""
+
+import argparse
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import server_harness  # project root on sys.path, scratch FTP_BASE_DIR
+
+from server.ftp_server import DATA_PORT_MAX, DATA_PORT_MIN
+from server.port_pool import PortPool
+
+class LegacyAllocator:
+    """The pre-pool allocator: walk _next_port round-robin and try bind() on each."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_port = DATA_PORT_MIN
+        self.binds = 0
+
+    def acquire(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        for _ in range(DATA_PORT_MAX - DATA_PORT_MIN + 1):
+            with self.lock:
+                port = self.next_port
+                self.next_port += 1
+                if self.next_port > DATA_PORT_MAX:
+                    self.next_port = DATA_PORT_MIN
+            self.binds += 1
+            try:
+                s.bind(("", port))
+                s.listen(1)
+                return s, port
+            except OSError:
+                continue
+        s.close()
+        raise OSError("No available data ports")
+
+    def release(self, s, port):
+        s.close()
+
+def occupy(ports):
+    held = []
+    for port in ports:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.bind(("", port))
+            s.listen(1)
+            held.append(s)
+        except OSError:
+            s.close()
+    return held
+
+def measure(alloc, cycles):
+    lat = []
+    for _ in range(cycles):
+        t0 = time.perf_counter()
+        s, port = alloc.acquire()
+        lat.append(time.perf_counter() - t0)
+        alloc.release(s, port)
+    lat.sort()
+    return lat
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--util", type=float, default=0.9)
+    ap.add_argument("--cycles", type=int, default=2000)
+    args = ap.parse_args()
+
+    window = list(range(DATA_PORT_MIN, DATA_PORT_MAX + 1))
+    n_held = int(len(window) * args.util)
+    print(f"Window {DATA_PORT_MIN}-{DATA_PORT_MAX}, {n_held} ports held ({args.util:.0%}), {args.cycles} cycles")
+    print(f"{'allocator':<10}{'avg us':>10}{'p50 us':>10}{'p99 us':>10}{'acq binds':>13}")
+
+    # Legacy: held ports are scattered through the window, as in-use ports are in practice.
+    stride = max(2, round(1 / max(1e-6, 1 - args.util)))
+    held = occupy(p for i, p in enumerate(window) if i % stride != 0)
+    legacy = LegacyAllocator()
+    lat = measure(legacy, args.cycles)
+    report("legacy", lat, legacy.binds / args.cycles)
+    for s in held:
+        s.close()
+
+    # Pool: the same load expressed as leases it is tracking.
+    pool = PortPool(DATA_PORT_MIN, DATA_PORT_MAX, prebound=8)
+    leases = [pool.acquire() for _ in range(n_held)]
+    pool.refill()
+    before = pool.bind_failures
+    lat = measure(pool, args.cycles)
+    report("pool", lat, None, pool.bind_failures - before)
+    for s, port in leases:
+        pool.release(s, port)
+
+def report(name, lat, binds_per_alloc, failures=None):
+    avg = sum(lat) / len(lat)
+    extra = f"{binds_per_alloc:>13.1f}" if binds_per_alloc is not None else f"{'0 (prebound)':>13}"
+    print(f"{name:<10}{avg * 1e6:>10.1f}{lat[len(lat) // 2] * 1e6:>10.1f}{lat[int(len(lat) * 0.99)] * 1e6:>10.1f}{extra}")
+    if failures:
+        print(f"  pool bind failures during run: {failures}")
+
+if __name__ == "__main__":
+    main()
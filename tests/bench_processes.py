@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET throughput against FTP_PROCESSES (pre-forked SO_REUSEPORT workers), 1 to 8.
+
+For each --processes value a server subprocess is started with FTP_PROCESSES=<n> and
+FTP_GET_MODE=--get-mode (default copy: the Python read/sendall loop is what the GIL caps;
+with sendfile the kernel does the copying and one process already goes far). The load runs
+in --client-procs processes of --threads sessions each, so the generator is not held to one
+core either; every session GETs one of --files files of --size bytes in a loop for --seconds.
+Server CPU is summed over the parent and its workers from /proc/<pid>/stat. Scaling needs
+free cores: on a machine with fewer cores than processes + load, extra workers only add
+context switches. os.cpu_count() is printed with the results.
+
+Usage: python3 tests/bench_processes.py [--processes 1,2,4,8] [--size 1M] [--seconds 10]
+       [--client-procs 4] [--threads 8] [--get-mode copy]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import bench_load
+
+def tree_cpu_seconds(pid):
+    """CPU seconds of pid and its direct children (the pre-forked workers)."""
+    total = bench_load.cpu_seconds(pid)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rpartition(")")[2].split()[1])
+            if ppid == pid:
+                total += bench_load.cpu_seconds(entry)
+        except (OSError, ValueError):
+            continue  # exited while we looked
+    return total
+
+def load_process(addr, names, threads, seconds, start_at, out):
+    """One load-generator process: `threads` sessions GETting names until the deadline."""
+    import threading
+
+    counts = [0] * threads
+    moved = [0] * threads
+    errors = []
+
+    def client(i):
+        buf = bytearray(256 * 1024)
+        try:
+            with bench_load.connect(addr, 30) as ctrl:
+                while time.time() < start_at:
+                    time.sleep(0.001)
+                k = i
+                while time.time() < start_at + seconds:
+                    moved[i] += bench_load.op_get(ctrl, addr[0], names[k % len(names)], buf, 30)
+                    counts[i] += 1
+                    k += threads
+                ctrl.send_line("EXIT")
+        except (OSError, bench_load.OpError) as e:
+            errors.append(repr(e))
+
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    out.put((sum(counts), sum(moved), errors))
+
+def run(n, args, names):
+    work = tempfile.mkdtemp(prefix="ftp_procs_")
+    os.mkdir(os.path.join(work, "files"))
+    size = bench_load.parse_size(args.size)
+    for name in names:
+        with open(os.path.join(work, "files", name), "wb") as f:
+            f.write(os.urandom(size))
+    clients = args.client_procs * args.threads
+    server_args = argparse.Namespace(engine="threads", server_env=[
+        f"FTP_PROCESSES={n}", f"FTP_GET_MODE={args.get_mode}", f"FTP_WORKERS={clients + 8}",
+    ])
+    proc, addr = bench_load.start_server(work, server_args, clients)
+    try:
+        out = multiprocessing.Queue()
+        start_at = time.time() + 1 + 0.1 * clients  # every session connected before the clock starts
+        gens = [multiprocessing.Process(target=load_process,
+                                        args=(addr, names, args.threads, args.seconds, start_at, out))
+                for _ in range(args.client_procs)]
+        for g in gens:
+            g.start()
+        while time.time() < start_at:
+            time.sleep(0.01)
+        cpu0 = tree_cpu_seconds(proc.pid)
+        results = [out.get() for _ in gens]
+        cpu = tree_cpu_seconds(proc.pid) - cpu0
+        for g in gens:
+            g.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(work, ignore_errors=True)
+    ops = sum(r[0] for r in results)
+    moved = sum(r[1] for r in results)
+    errors = [e for r in results for e in r[2]]
+    return ops / args.seconds, moved / args.seconds / 2**20, cpu / args.seconds, errors
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--processes", default="1,2,4,8")
+    ap.add_argument("--size", default="1M")
+    ap.add_argument("--files", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--client-procs", type=int, default=4)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--get-mode", default="copy")
+    args = ap.parse_args()
+    names = [f"f{i}.bin" for i in range(args.files)]
+
+    print(f"{os.cpu_count()} CPUs, GET_MODE={args.get_mode}, {args.size} files, "
+          f"{args.client_procs}x{args.threads} sessions, {args.seconds:g} s per run")
+    print(f"{'procs':>6}{'GET/s':>9}{'MB/s':>9}{'speedup':>9}{'server cores':>14}{'errors':>8}")
+    base = None
+    for n in map(int, args.processes.split(",")):
+        ops, mbps, cores, errors = run(n, args, names)
+        base = base or mbps
+        print(f"{n:>6}{ops:>9.0f}{mbps:>9.0f}{mbps / base:>8.2f}x{cores:>14.2f}{len(errors):>8}")
+        if errors:
+            print(f"       first error: {errors[0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bytes re-sent when a large GET/PUT is interrupted, full restart vs REST resume.
+
+Runs an in-process server on a scratch BASE_DIR and injects --drops data-connection
+failures spread evenly across the file. "restart" retries from byte 0 every time
+(the behaviour before REST); "resume" is the client's do_get/do_put, which continue
+from the last byte that made it across.
+
+Usage: python3 tests/bench_resume.py [--size-mb 1024] [--drops 3]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import start_engine
+
+from client import ftp_client
+from client.connection_handler import ControlConn, open_data_conn
+from server import ftp_server
+from shared import protocol
+
+class CountingSocket:
+    """Counts bytes moved over a data socket and drops it once `budget` bytes have passed."""
+
+    def __init__(self, sock, budget, stats):
+        self.sock, self.budget, self.stats = sock, budget, stats
+
+    def recv(self, n):
+        chunk = self.sock.recv(self._allowance(n))
+        self._count(len(chunk))
+        return chunk
+
+    def recv_into(self, buf, nbytes=0):
+        k = self.sock.recv_into(buf, self._allowance(nbytes or len(buf)))
+        self._count(k)
+        return k
+
+    def _allowance(self, n):
+        """Bytes the next recv may take; drops the connection once the budget is used up."""
+        if self.budget is None:
+            return n
+        if self.budget <= 0:
+            self.sock.close()
+            raise ConnectionResetError("injected drop")
+        return min(n, self.budget)
+
+    def sendall(self, data):
+        if self.budget is not None and len(data) > self.budget:
+            self.sock.sendall(data[:self.budget])
+            self._count(self.budget)
+            self.sock.close()
+            raise ConnectionResetError("injected drop")
+        self.sock.sendall(data)
+        self._count(len(data))
+
+    def _count(self, n):
+        self.stats["wire"] += n
+        if self.budget is not None:
+            self.budget -= n
+
+    def close(self):
+        self.sock.close()
+
+def install(budgets, stats):
+    budgets = list(budgets)
+
+    def opener(host, port):
+        return CountingSocket(open_data_conn(host, port), budgets.pop(0) if budgets else None, stats)
+    ftp_client.open_data_conn = opener
+
+def restart_get(ctrl, name):
+    while True:
+        got, n, last = ftp_client.get_once(ctrl, name, "127.0.0.1", name, 0)
+        if got == n and last.startswith(protocol.DONE):
+            return
+        if not last:
+            ctrl.reconnect()
+
+def restart_put(ctrl, path):
+    while True:
+        sent, last = ftp_client.put_once(ctrl, path, "127.0.0.1", 0)
+        if last.startswith(protocol.DONE):
+            return
+        if not last:
+            ctrl.reconnect()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-mb", type=int, default=1024)
+    ap.add_argument("--drops", type=int, default=3)
+    args = ap.parse_args()
+
+    size = args.size_mb << 20
+    work = tempfile.mkdtemp(prefix="resume_bench_")
+    os.mkdir(os.path.join(work, "src"))
+    os.mkdir(os.path.join(work, "downloads"))
+    os.chdir(os.path.join(work, "downloads"))
+    src = os.path.join(work, "src", "payload.bin")
+    with open(src, "wb") as f:
+        block = os.urandom(1 << 20)
+        for _ in range(args.size_mb):
+            f.write(block)
+    os.link(src, os.path.join(ftp_server.BASE_DIR, "payload.bin"))
+
+    addr = start_engine(ftp_server.serve)
+
+    # Failures land at 1/(drops+1), 2/(drops+1), ... of the way through the file.
+    step = size // (args.drops + 1)
+    ftp_client.RESUME_ATTEMPTS = args.drops + 1
+    print(f"File: {args.size_mb} MB, {args.drops} injected drops")
+    print(f"{'op':<5}{'strategy':<10}{'wire MB':>10}{'re-sent MB':>12}{'seconds':>10}")
+    for op in ("GET", "PUT"):
+        for strategy in ("restart", "resume"):
+            stats = {"wire": 0}
+            # "restart" re-reads from byte 0, so its cut points are absolute offsets;
+            # "resume" continues, so each attempt only needs to move one more step.
+            if strategy == "restart":
+                budgets = [step * (i + 1) for i in range(args.drops)]
+            else:
+                budgets = [step] * args.drops
+            install(budgets, stats)
+            t0 = time.perf_counter()
+            with ControlConn(*addr) as ctrl, contextlib.redirect_stdout(io.StringIO()):
+                if op == "GET" and strategy == "restart":
+                    restart_get(ctrl, "payload.bin")
+                elif op == "GET":
+                    ftp_client.do_get(ctrl, "payload.bin", "127.0.0.1")
+                elif strategy == "restart":
+                    restart_put(ctrl, src)
+                else:
+                    ftp_client.do_put(ctrl, src, "127.0.0.1")
+            elapsed = time.perf_counter() - t0
+            print(f"{op:<5}{strategy:<10}{stats['wire'] / 2**20:>10.1f}{(stats['wire'] - size) / 2**20:>12.1f}{elapsed:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: zero-copy GET (socket.sendfile) vs the Python read/sendall loop.
+
+Streams a scratch file over a loopback TCP connection with ftp_server.send_file
+in each GET_MODE and reports MB/s plus sender CPU seconds per GB served.
+CPU is measured with time.thread_time() on the sending thread only, so the
+receiver draining the socket does not pollute the figure.
+
+Usage: python3 tests/bench_sendfile.py [--size-mb 256] [--rounds 3]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import server_harness  # project root on sys.path, scratch FTP_BASE_DIR
+
+from server import ftp_server
+
+def drain(sock):
+    buf = bytearray(1 << 20)
+    view = memoryview(buf)
+    while sock.recv_into(view):
+        pass
+    sock.close()
+
+def run_once(path, mode):
+    ftp_server.GET_MODE = mode
+    lst = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    lst.bind(("127.0.0.1", 0))
+    lst.listen(1)
+    rx = socket.create_connection(lst.getsockname())
+    tx, _ = lst.accept()
+    lst.close()
+    reader = threading.Thread(target=drain, args=(rx,))
+    reader.start()
+
+    result = {}
+    def sender():
+        cpu0, t0 = time.thread_time(), time.perf_counter()
+        with open(path, "rb") as f:
+            result["bytes"] = ftp_server.send_file(tx, f)
+        result["cpu"] = time.thread_time() - cpu0
+        result["wall"] = time.perf_counter() - t0
+        tx.close()
+    t = threading.Thread(target=sender)
+    t.start()
+    t.join()
+    reader.join()
+    return result
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-mb", type=int, default=256)
+    ap.add_argument("--rounds", type=int, default=3)
+    args = ap.parse_args()
+
+    fd, path = tempfile.mkstemp(prefix="sendfile_bench_")
+    with os.fdopen(fd, "wb") as f:
+        block = os.urandom(1 << 20)
+        for _ in range(args.size_mb):
+            f.write(block)
+
+    print(f"File: {args.size_mb} MB, rounds: {args.rounds}, BUFFER_SIZE: {ftp_server.BUFFER_SIZE}")
+    print(f"{'mode':<10}{'MB/s':>10}{'CPU s/GB':>12}")
+    try:
+        for mode in ("copy", "sendfile"):
+            best = None
+            for _ in range(args.rounds):
+                r = run_once(path, mode)
+                if best is None or r["wall"] < best["wall"]:
+                    best = r
+            gb = best["bytes"] / 1e9
+            print(f"{mode:<10}{best['bytes'] / 1e6 / best['wall']:>10.1f}{best['cpu'] / gb:>12.3f}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: small-file GET rate with the in-memory content cache on and off.
+
+An in-process server holds --files files of each --sizes size. --clients sessions GET them
+round-robin (lock-step: command, data connection, 226) for --seconds each run. "off" swaps in
+a ContentCache with no budget, so every GET stats, opens and reads the file as before; "on"
+uses FTP_CONTENT_CACHE_MB / FTP_CONTENT_CACHE_MAX_KB defaults and serves hits with one sendall.
+The hit ratio comes from the cache's own counters.
+
+Usage: python3 tests/bench_small_get.py [--sizes 1K,4K,16K,64K] [--files 100] [--clients 4] [--seconds 5]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import start_engine
+
+import bench_load
+from server import ftp_server
+from server.content_cache import ContentCache
+
+def gets_per_second(addr, names, clients, seconds):
+    counts = [0] * clients
+    stop = time.perf_counter() + seconds
+
+    def client(i):
+        buf = bytearray(256 * 1024)
+        with bench_load.connect(addr, 30) as ctrl:
+            k = i
+            while time.perf_counter() < stop:
+                bench_load.op_get(ctrl, addr[0], names[k % len(names)], buf, 30)
+                counts[i] += 1
+                k += clients
+            ctrl.send_line("EXIT")
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts) / (time.perf_counter() - t0)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--sizes", default="1K,4K,16K,64K")
+    ap.add_argument("--files", type=int, default=100)
+    ap.add_argument("--clients", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=5)
+    args = ap.parse_args()
+
+    addr = start_engine(ftp_server.serve, backlog=64)
+    default_cache = ftp_server._content_cache
+
+    print(f"{args.clients} sessions GETting {args.files} files round-robin, {args.seconds:g} s per run")
+    print(f"{'size':<6}{'off GET/s':>11}{'on GET/s':>10}{'speedup':>9}{'hit ratio':>11}")
+    for text in args.sizes.split(","):
+        size = bench_load.parse_size(text)
+        names = [f"small_{text}_{i}.txt" for i in range(args.files)]
+        for name in names:
+            with open(os.path.join(ftp_server.BASE_DIR, name), "wb") as f:
+                f.write(os.urandom(size))
+        ftp_server._content_cache = ContentCache(0, 0)
+        off = gets_per_second(addr, names, args.clients, args.seconds)
+        cache = ftp_server._content_cache = ContentCache(default_cache.capacity, default_cache.max_file)
+        on = gets_per_second(addr, names, args.clients, args.seconds)
+        print(f"{text:<6}{off:>11.0f}{on:>10.0f}{on / off:>8.2f}x{cache.stats()['hit_ratio'] or 0:>11.3f}")
+
+if __name__ == "__main__":
+    main()
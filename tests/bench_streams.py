@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parallel ranged GET (GET <name> STREAMS <n>) against stream count.
+
+A single TCP stream on a long link is capped at window / RTT. Rather than shaping
+real traffic, the client's data sockets are wrapped in a stand-in that enforces
+exactly that cap: each stream may receive at most --window bytes per --rtt-ms.
+An optional --link-mbps shared budget models the NIC every stream competes for.
+The in-process server is unmodified.
+
+Usage: python3 tests/bench_streams.py [--size-mb 64] [--rtt-ms 40] [--window-kb 256]
+                                     [--link-mbps 400] [--streams 1,2,4,8,16]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server_harness import start_engine
+
+from client import ftp_client
+from client.connection_handler import ControlConn, open_data_conn
+from server import ftp_server
+
+class Link:
+    """Shared bandwidth budget (bytes/second) that every stream draws from."""
+
+    def __init__(self, mbps):
+        self.rate = mbps * 1e6 / 8 if mbps else None
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def take(self, n):
+        if self.rate is None:
+            return
+        with self.lock:
+            start = max(self.next_free, time.monotonic())
+            self.next_free = start + n / self.rate
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+class LongFatSocket:
+    """Receives at most `window` bytes per RTT, like one TCP flow on a high-latency path."""
+
+    def __init__(self, sock, window, rtt, link):
+        self.sock, self.window, self.rtt, self.link = sock, window, rtt, link
+        self.slot_end = time.monotonic() + rtt
+        self.budget = window
+
+    def recv_into(self, view):
+        now = time.monotonic()
+        if now >= self.slot_end:
+            self.slot_end, self.budget = now + self.rtt, self.window
+        elif self.budget <= 0:
+            time.sleep(self.slot_end - now)
+            self.slot_end, self.budget = time.monotonic() + self.rtt, self.window
+        k = self.sock.recv_into(view[:min(len(view), self.budget)])
+        self.budget -= k
+        self.link.take(k)
+        return k
+
+    def close(self):
+        self.sock.close()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-mb", type=int, default=64)
+    ap.add_argument("--rtt-ms", type=float, default=40)
+    ap.add_argument("--window-kb", type=int, default=256)
+    ap.add_argument("--link-mbps", type=float, default=400)
+    ap.add_argument("--streams", default="1,2,4,8,16")
+    args = ap.parse_args()
+
+    with open(os.path.join(ftp_server.BASE_DIR, "payload.bin"), "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1 << 20))
+    addr = start_engine(ftp_server.serve)
+    os.chdir(tempfile.mkdtemp(prefix="streams_bench_"))
+
+    link = Link(args.link_mbps)
+    ftp_client.open_data_conn = lambda host, port: LongFatSocket(
+        open_data_conn(host, port), args.window_kb << 10, args.rtt_ms / 1000, link)
+
+    cap = (args.window_kb << 10) / (args.rtt_ms / 1000) / 1e6
+    print(f"File {args.size_mb} MB, RTT {args.rtt_ms} ms, window {args.window_kb} KiB "
+          f"(= {cap:.1f} MB/s per stream), link {args.link_mbps or 'unlimited'} Mbit/s")
+    print(f"{'streams':>8}{'seconds':>10}{'MB/s':>10}")
+    for n in map(int, args.streams.split(",")):
+        with ControlConn(*addr) as ctrl, contextlib.redirect_stdout(io.StringIO()) as out:
+            t0 = time.perf_counter()
+            ftp_client.do_get_parallel(ctrl, "payload.bin", "127.0.0.1", n)
+            elapsed = time.perf_counter() - t0
+        ok = "[OK]" in out.getvalue()
+        print(f"{n:>8}{elapsed:>10.2f}{args.size_mb * 1.048576 / elapsed:>10.1f}{'' if ok else '  FAILED'}")
+
+if __name__ == "__main__":
+    main()
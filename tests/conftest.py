@@ -0,0 +1,48 @@
+"""
+Shared fixtures for the local (in-process) server tests.
+The server module reads FTP_BASE_DIR at import, so point it at a scratch
+directory before anything imports server.ftp_server.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("FTP_BASE_DIR", tempfile.mkdtemp(prefix="ftp_test_files_"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from server_harness import start_engine
+from server import async_server, ftp_server
+
+@pytest.fixture(scope="session")
+def server_addr():
+    """Threaded engine on an ephemeral control port for the whole session."""
+    return start_engine(ftp_server.serve)
+
+@pytest.fixture(scope="session")
+def async_server_addr():
+    """asyncio engine on an ephemeral control port for the whole session."""
+    return start_engine(async_server.serve)
+
+@pytest.fixture
+def base_dir():
+    """Empty server_files directory for one test (the server's hidden work dirs are kept, emptied)."""
+    path = ftp_server.BASE_DIR
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if name.startswith(".") and os.path.isdir(full):
+            for inner in os.listdir(full):
+                remove(os.path.join(full, inner))
+        else:
+            remove(full)
+    return path
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
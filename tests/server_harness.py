@@ -0,0 +1,73 @@
+"""
+In-process server setup shared by the tests/bench_*.py scripts and conftest.py (no pytest needed).
+
+Importing this module puts the project root on sys.path and, unless FTP_BASE_DIR is already
+set, points the server at a scratch directory. server.ftp_server reads FTP_BASE_DIR when it is
+first imported, so import this module before it.
+"""
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.environ.setdefault("FTP_BASE_DIR", tempfile.mkdtemp(prefix="ftp_bench_"))
+
+def start_engine(serve, backlog=16):
+    """Run an engine's serve() in a daemon thread on an ephemeral loopback control port; returns its address."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    s.listen(backlog)
+    threading.Thread(target=serve, args=(s,), daemon=True).start()
+    return s.getsockname()
+
+class PacedSocket:
+    """
+    Data socket wrapper standing in for a link of `mbps` (0 = unpaced): bytes moving in
+    `direction` ("send" or "recv") are counted in stats["wire"] and held back to the link
+    rate; the other direction passes through untouched.
+    """
+
+    def __init__(self, sock, mbps, stats, direction="recv"):
+        self.sock, self.stats, self.direction = sock, stats, direction
+        self.rate = mbps * 1e6 / 8 if mbps else None
+        self.next_free = time.monotonic()
+
+    def sendall(self, data):
+        self.sock.sendall(data)
+        if self.direction == "send":
+            self._pace(len(data))
+
+    def recv(self, n):
+        chunk = self.sock.recv(n)
+        if self.direction == "recv":
+            self._pace(len(chunk))
+        return chunk
+
+    def recv_into(self, buf, nbytes=0):
+        k = self.sock.recv_into(buf, nbytes)
+        if self.direction == "recv":
+            self._pace(k)
+        return k
+
+    def _pace(self, n):
+        self.stats["wire"] += n
+        if self.rate:
+            self.next_free = max(self.next_free, time.monotonic()) + n / self.rate
+            delay = self.next_free - time.monotonic()
+            if delay > 0.002:  # sleeping per 4 KiB write would cost more than the pacing itself
+                time.sleep(delay)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
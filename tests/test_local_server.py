@@ -0,0 +1,1130 @@
+#!/usr/bin/env python3
+"""
+Protocol tests against an in-process server on 127.0.0.1.
+These need no running or AWS-hosted server.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import lzma
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import zlib
+
+import pytest
+
+import bench_load
+from client import api, ftp_client
+from client.connection_handler import ControlConn, open_data_conn
+from client.config import BUFFER_SIZE
+from server_harness import start_engine
+from server import async_server, ftp_server
+from server.content_cache import ContentCache
+from server.digest_cache import DigestCache
+from server.dir_index import DirIndex
+from server.file_locks import FileLocks
+from server.map_cache import MapCache
+from server.metrics import Metrics, serve_http
+from server.object_store import ObjectStore
+from server.port_pool import PortPool, port_slice
+from server.throttle import FairScheduler, Flow
+from server.upload_writer import UploadWriter
+from shared import buffers, compression, integrity, protocol
+from shared.block_channel import BlockChannel
+from shared.line_reader import LineReader, LineTooLong
+
+def recv_all(ds, n=None):
+    """Read n bytes (or until close) from a data socket."""
+    buf = bytearray()
+    while n is None or len(buf) < n:
+        chunk = ds.recv(BUFFER_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+    ds.close()
+    return bytes(buf)
+
+def reply_field(line, key):
+    parts = line.split()
+    return int(parts[parts.index(key) + 1])
+
+def get_file(ctrl, name):
+    ctrl.send_line(f"GET {name}")
+    first = ctrl.recv_line()
+    assert first.startswith(protocol.OK), first
+    data = recv_all(open_data_conn("127.0.0.1", reply_field(first, "PORT")), reply_field(first, "SIZE"))
+    assert ctrl.recv_line().startswith(protocol.DONE)
+    return data
+
+def put_file(ctrl, name, data):
+    ctrl.send_line(f"PUT {name} SIZE {len(data)}")
+    first = ctrl.recv_line()
+    assert first.startswith(protocol.OK), first
+    ds = open_data_conn("127.0.0.1", reply_field(first, "PORT"))
+    ds.sendall(data)
+    ds.close()
+    return ctrl.recv_line()
+
+@pytest.mark.parametrize("mode", ["sendfile", "copy", "mmap"])
+def test_get_modes_return_identical_bytes(server_addr, base_dir, monkeypatch, mode):
+    monkeypatch.setattr(ftp_server, "GET_MODE", mode)
+    payload = os.urandom(3 * BUFFER_SIZE + 17)
+    with open(os.path.join(base_dir, "blob.bin"), "wb") as f:
+        f.write(payload)
+    with ControlConn(*server_addr) as ctrl:
+        assert get_file(ctrl, "blob.bin") == payload
+
+def test_send_file_falls_back_for_pipes(monkeypatch):
+    monkeypatch.setattr(ftp_server, "GET_MODE", "sendfile")
+    r, w = os.pipe()
+    os.write(w, b"piped bytes")
+    os.close(w)
+    a, b = socket.socketpair()
+    with os.fdopen(r, "rb") as f:
+        assert ftp_server.send_file(a, f) == len(b"piped bytes")
+    a.close()
+    assert recv_all(b) == b"piped bytes"
+
+def test_mmap_gets_share_one_mapping_until_the_file_is_replaced(server_addr, base_dir, monkeypatch):
+    monkeypatch.setattr(ftp_server, "GET_MODE", "mmap")
+    cache = MapCache(1 << 20)
+    monkeypatch.setattr(ftp_server, "_map_cache", cache)
+    payload = os.urandom(300_000)
+    with open(os.path.join(base_dir, "hot.bin"), "wb") as f:
+        f.write(payload)
+    results = []
+
+    def fetch():
+        with ControlConn(*server_addr) as ctrl:
+            results.append(get_file(ctrl, "hot.bin"))
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [payload] * 4
+    stats = cache.stats()
+    assert (stats["entries"], stats["misses"], stats["hits"]) == (1, 1, 3)
+    with ControlConn(*server_addr) as ctrl:
+        assert put_file(ctrl, "hot.bin", b"replaced").startswith(protocol.DONE)
+        assert cache.stats()["invalidations"] == 1
+        assert get_file(ctrl, "hot.bin") == b"replaced"
+
+def test_map_cache_evicts_lru_and_keeps_leased_mappings_open(tmp_path):
+    for name in ("a", "b", "c", "big"):
+        (tmp_path / name).write_bytes(name[0].encode() * (300 if name == "big" else 100))
+    cache = MapCache(250)
+    a = cache.acquire("a", str(tmp_path / "a"))
+    cache.release(cache.acquire("b", str(tmp_path / "b")))
+    cache.acquire("c", str(tmp_path / "c"))  # 300 mapped bytes: the least recent, a, goes
+    stats = cache.stats()
+    assert (stats["entries"], stats["mapped_bytes"], stats["evictions"]) == (2, 200, 1)
+    assert bytes(a.view[:3]) == b"aaa"  # still leased, still readable
+    cache.release(a)
+    with pytest.raises(ValueError):
+        a.view[0]
+    assert cache.acquire("big", str(tmp_path / "big")) is None
+
+def test_small_file_gets_are_served_from_content_cache(server_addr, base_dir, monkeypatch):
+    cache = ContentCache(1 << 20, 64 * 1024)
+    monkeypatch.setattr(ftp_server, "_content_cache", cache)
+    metrics = Metrics()
+    metrics.register("content_cache", cache.stats)
+    monkeypatch.setattr(ftp_server, "_metrics", metrics)
+    path = os.path.join(base_dir, "small.txt")
+    with open(path, "wb") as f:
+        f.write(b"small v1")
+    with ControlConn(*server_addr) as ctrl:
+        assert get_file(ctrl, "small.txt") == b"small v1"
+        ctrl.send_line("REST 6")
+        assert ctrl.recv_line().startswith(protocol.PENDING)
+        assert get_file(ctrl, "small.txt") == b"v1"
+        assert (cache.hits, cache.misses) == (1, 1)
+        with open(path, "wb") as f:
+            f.write(b"edited outside, longer")  # new size: the entry no longer validates
+        assert get_file(ctrl, "small.txt") == b"edited outside, longer"
+        assert put_file(ctrl, "small.txt", b"uploaded").startswith(protocol.DONE)
+        assert get_file(ctrl, "small.txt") == b"uploaded"
+        text = ftp_client.fetch_stats(ctrl, "127.0.0.1")
+    assert "ftp_content_cache_hit_ratio 0.25\n" in text  # 1 hit, then 3 misses: first, edited, uploaded
+
+def test_content_cache_evicts_by_bytes_and_skips_big_files(tmp_path):
+    for name, size in (("a", 40), ("b", 40), ("c", 40), ("big", 200)):
+        (tmp_path / name).write_bytes(name[0].encode() * size)
+    cache = ContentCache(100, 64)
+    for name in ("a", "b", "a", "c"):  # a is used again, so b is the least recent when c arrives
+        path = str(tmp_path / name)
+        assert cache.get(name, path, os.stat(path)) == name.encode() * 40
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"], stats["hits"]) == (2, 80, 1, 1)
+    assert cache.get("big", str(tmp_path / "big"), os.stat(tmp_path / "big")) is None
+    assert ContentCache(0, 64).get("a", str(tmp_path / "a"), os.stat(tmp_path / "a")) is None
+
+def test_put_then_get_roundtrip(server_addr, base_dir):
+    payload = os.urandom(10000)
+    with ControlConn(*server_addr) as ctrl:
+        assert put_file(ctrl, "up.bin", payload).startswith(protocol.DONE)
+        assert get_file(ctrl, "up.bin") == payload
+
+def test_asyncio_engine_serves_ls_get_put(async_server_addr, base_dir):
+    payload = os.urandom(3 * BUFFER_SIZE + 5)
+    with ControlConn(*async_server_addr) as ctrl:
+        assert put_file(ctrl, "async.bin", payload).startswith(protocol.DONE)
+        assert get_file(ctrl, "async.bin") == payload
+        ctrl.send_line("LS")
+        first = ctrl.recv_line()
+        listing = recv_all(open_data_conn("127.0.0.1", reply_field(first, "PORT")))
+        assert listing.decode().split()[:2] == ["async.bin", str(len(payload))]
+        assert ctrl.recv_line().startswith(protocol.DONE)
+        ctrl.send_line("NOPE")
+        assert ctrl.recv_line().startswith("500")
+
+def test_asyncio_engine_resumes_uploads_and_refuses_unsupported_commands(async_server_addr, base_dir):
+    payload = os.urandom(40000)
+    with ControlConn(*async_server_addr) as ctrl:
+        ctrl.send_line(f"PUT part.bin SIZE {len(payload)}")
+        ds = open_data_conn("127.0.0.1", reply_field(ctrl.recv_line(), "PORT"))
+        ds.sendall(payload[:15000])
+        ds.close()
+        assert ctrl.recv_line().startswith("550 Incomplete upload (15000 of")
+        ctrl.send_line("SIZE part.bin PARTIAL")
+        assert ctrl.recv_line() == "213 15000"
+        ctrl.send_line("REST 15000")
+        assert ctrl.recv_line().startswith(protocol.PENDING)
+        ctrl.send_line(f"PUT part.bin SIZE {len(payload)}")
+        ds = open_data_conn("127.0.0.1", reply_field(ctrl.recv_line(), "PORT"))
+        ds.sendall(payload[15000:])
+        ds.close()
+        assert ctrl.recv_line().startswith(protocol.DONE)
+        ctrl.send_line("REST 100")
+        ctrl.recv_line()
+        ctrl.send_line("GET part.bin")
+        first = ctrl.recv_line()
+        assert recv_all(open_data_conn("127.0.0.1", reply_field(first, "PORT"))) == payload[100:]
+        assert ctrl.recv_line().startswith(protocol.DONE)
+        for line in ("MODE B", "MGET *", "STAT", "GET part.bin STREAMS 2"):
+            ctrl.send_line(line)
+            assert ctrl.recv_line().startswith("502")
+
+def test_asyncio_engine_refuses_settings_it_would_ignore(monkeypatch):
+    async_server.check_config()
+    monkeypatch.setattr(ftp_server, "GET_MODE", "mmap")
+    with pytest.raises(SystemExit, match="FTP_GET_MODE=mmap"):
+        async_server.check_config()
+
+def test_asyncio_engine_times_out_data_connections_that_never_come(async_server_addr, base_dir, monkeypatch):
+    monkeypatch.setattr(ftp_server, "DATA_TIMEOUT", 0.2)
+    leased = ftp_server._port_pool.stats()["leased"]
+    with ControlConn(*async_server_addr) as ctrl:
+        ctrl.send_line("PUT stuck.bin SIZE 3")
+        assert ctrl.recv_line().startswith(protocol.OK)  # ... and never connect
+        assert ctrl.recv_line().startswith(protocol.ERR)
+        assert ftp_server._port_pool.stats()["leased"] == leased
+        assert put_file(ctrl, "stuck.bin", b"abc").startswith(protocol.DONE)  # lock was released
+
+def test_full_session_pool_answers_421(monkeypatch):
+    monkeypatch.setattr(ftp_server, "WORKERS", 1)
+    monkeypatch.setattr(ftp_server, "MAX_PENDING", 0)
+    addr = start_engine(ftp_server.serve)
+    with ControlConn(*addr) as first:
+        with pytest.raises(ConnectionRefusedError, match="421"):
+            with ControlConn(*addr):
+                pass
+        first.send_line("EXIT")
+        assert first.recv_line().startswith("221")
+
+def test_session_queued_past_max_wait_gets_421(monkeypatch):
+    monkeypatch.setattr(ftp_server, "WORKERS", 1)
+    monkeypatch.setattr(ftp_server, "MAX_QUEUE_WAIT", 0.3)
+    addr = start_engine(ftp_server.serve)
+    with ControlConn(*addr) as first:
+        t0 = time.monotonic()
+        with pytest.raises(ConnectionRefusedError, match="421"):
+            with ControlConn(*addr):
+                pass
+        assert time.monotonic() - t0 < 2
+        first.send_line("NOOP")
+        assert first.recv_line().startswith("200")
+
+def test_port_pool_leases_prebound_listeners_and_drops_strays():
+    pool = PortPool(ftp_server.DATA_PORT_MAX - 9, ftp_server.DATA_PORT_MAX, prebound=2)
+    pool.refill()
+    assert pool.stats()["ready"] == 2
+    s, port = pool.acquire()
+    stray = socket.create_connection(("127.0.0.1", port))
+    pool.release(s, port)
+    assert pool.stats()["leased"] == 0
+    # A connection parked on a pre-bound listener must not be handed to the next lessee.
+    ready_port = pool._ready[0][1]
+    parked = socket.create_connection(("127.0.0.1", ready_port))
+    s, port = pool.acquire()
+    assert port == ready_port
+    s.settimeout(0.2)
+    with pytest.raises(socket.timeout):
+        s.accept()
+    pool.release(s, port)
+    stray.close()
+    parked.close()
+
+def test_port_pool_applies_socket_buffer_sizes_to_listeners():
+    pool = PortPool(ftp_server.DATA_PORT_MAX - 19, ftp_server.DATA_PORT_MAX - 10, prebound=0,
+                    sndbuf=256 * 1024, rcvbuf=512 * 1024)
+    s, port = pool.acquire()
+    try:
+        # Linux reports twice the requested size (half is bookkeeping overhead).
+        assert s.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 256 * 1024
+        assert s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 512 * 1024
+    finally:
+        pool.release(s, port)
+
+def test_port_slices_split_the_range_without_overlap():
+    slices = [port_slice(20000, 21000, i, 8) for i in range(8)]
+    assert slices[0][0] == 20000 and slices[-1][1] == 21000
+    assert all(hi + 1 == next_lo for (_, hi), (next_lo, _) in zip(slices, slices[1:]))
+    assert {hi - lo + 1 for lo, hi in slices} == {125, 126}
+
+def test_file_locks_exclude_other_sessions_and_processes(tmp_path):
+    locks = FileLocks(str(tmp_path / ".locks"))
+    probe = [sys.executable, "-c", "import sys; from server.file_locks import FileLocks; "
+             "print('got' if FileLocks(sys.argv[1]).try_acquire('a.bin') else 'busy')", locks.lock_dir]
+    held = locks.try_acquire("a.bin")
+    assert locks.try_acquire("a.bin") is None
+    assert locks.try_acquire("b.bin") is not None
+    assert subprocess.run(probe, capture_output=True, text=True, cwd=bench_load.project_root).stdout.strip() == "busy"
+    held.release()
+    assert subprocess.run(probe, capture_output=True, text=True, cwd=bench_load.project_root).stdout.strip() == "got"
+    assert locks.held == 1  # b.bin was never released
+
+def test_multi_process_server_shares_port_and_upload_locks(tmp_path):
+    args = argparse.Namespace(engine="threads", server_env=["FTP_PROCESSES=2", "FTP_PREBOUND_PORTS=0"])
+    proc, addr = bench_load.start_server(str(tmp_path), args, 16)
+    try:
+        with ControlConn(*addr) as holder:
+            holder.send_line("PUT shared.bin SIZE 5")
+            first = holder.recv_line()
+            assert first.startswith(protocol.OK), first
+            for _ in range(6):  # sessions land on either worker; the flock holds across both
+                with ControlConn(*addr) as other:
+                    other.send_line("PUT shared.bin SIZE 1")
+                    assert other.recv_line().startswith("550")
+            ds = open_data_conn("127.0.0.1", reply_field(first, "PORT"))
+            ds.sendall(b"hello")
+            ds.close()
+            assert holder.recv_line().startswith(protocol.DONE)
+        for _ in range(4):
+            with ControlConn(*addr) as ctrl:
+                assert get_file(ctrl, "shared.bin") == b"hello"
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+def test_asyncio_workers_launched_with_dash_m_share_the_module_state(tmp_path):
+    while True:  # worker i serves its metrics on FTP_METRICS_PORT + i
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            metrics_port = s.getsockname()[1]
+        try:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", metrics_port + 1))
+            break
+        except OSError:
+            continue
+    args = argparse.Namespace(engine="asyncio", server_env=[
+        "FTP_PROCESSES=2", "FTP_PREBOUND_PORTS=0", f"FTP_METRICS_PORT={metrics_port}"])
+    proc, addr = bench_load.start_server(str(tmp_path), args, 16)
+
+    def sessions(index):
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{metrics_port + index}/metrics") as resp:
+                    text = resp.read().decode()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        values = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+        return int(values["ftp_sessions_total"])
+
+    try:
+        slices = [port_slice(ftp_server.DATA_PORT_MIN, ftp_server.DATA_PORT_MAX, i, 2) for i in range(2)]
+        for _ in range(8):
+            before = [sessions(0), sessions(1)]
+            with ControlConn(*addr) as ctrl:
+                after = [sessions(0), sessions(1)]
+                assert sum(after) - sum(before) == 1  # each worker's metrics see its own sessions
+                worker = 0 if after[0] > before[0] else 1
+                ctrl.send_line("LS")
+                first = ctrl.recv_line()
+                port = int(reply_field(first, "PORT"))
+                lo, hi = slices[worker]
+                assert lo <= port <= hi, (worker, port)  # leased from that worker's slice
+                with open_data_conn("127.0.0.1", port) as ds:
+                    recv_all(ds)
+                assert ctrl.recv_line().startswith(protocol.DONE)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+def test_adaptive_chunk_follows_measured_throughput(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(buffers.time, "perf_counter", lambda: clock[0])
+
+    def feed(chunk, rate, calls):
+        for _ in range(calls):
+            clock[0] += chunk.size / rate
+            chunk.record(chunk.size)
+
+    fast = buffers.AdaptiveChunk(1 << 20)
+    assert fast.size == buffers.MIN_CHUNK
+    feed(fast, 2e9, 20)  # 2 GB/s: a 2 ms call moves far more than the buffer
+    assert fast.size == 1 << 20
+    slow = buffers.AdaptiveChunk(1 << 20)
+    feed(slow, 10e6, 20)  # 10 MB/s: 2 ms worth is ~20 KB
+    assert 16 * 1024 <= slow.size <= 32 * 1024
+    feed(fast, 1e6, 400)  # throughput collapses: chunks shrink back to the minimum
+    assert fast.size == buffers.MIN_CHUNK
+    assert buffers.AdaptiveChunk(1000).size == 1000  # never more than the buffer
+
+def test_ls_index_tracks_uploads_and_external_changes(server_addr, base_dir):
+    def ls(ctrl):
+        ctrl.send_line("LS")
+        first = ctrl.recv_line()
+        rows = recv_all(open_data_conn("127.0.0.1", reply_field(first, "PORT"))).decode().splitlines()
+        assert ctrl.recv_line().startswith(protocol.DONE)
+        return {r.split()[0]: int(r.split()[1]) for r in rows}
+
+    with ControlConn(*server_addr) as ctrl:
+        assert ls(ctrl) == {}
+        rescans = ftp_server._dir_index.rescans
+        assert put_file(ctrl, "a.txt", b"12345").startswith(protocol.DONE)
+        assert ls(ctrl) == {"a.txt": 5}
+        assert ftp_server._dir_index.rescans == rescans  # served from the committed entry
+        time.sleep(0.05)  # let the directory mtime tick past the commit
+        with open(os.path.join(base_dir, "b.txt"), "wb") as f:
+            f.write(b"xy")
+        assert ls(ctrl) == {"a.txt": 5, "b.txt": 2}
+
+def test_shared_ls_index_rescans_after_commits_another_process_may_have_raced(tmp_path, monkeypatch):
+    (tmp_path / "up").mkdir()
+    (tmp_path / "files").mkdir()
+    index = DirIndex(str(tmp_path / "files"), shared=True)
+    assert index.listing() == b""
+    (tmp_path / "up" / "a.txt").write_bytes(b"12345")
+    real_replace = os.replace
+
+    def replace_while_another_worker_writes(src, dst):
+        real_replace(src, dst)
+        (tmp_path / "files" / "other.txt").write_bytes(b"from worker 2")
+
+    monkeypatch.setattr(os, "replace", replace_while_another_worker_writes)
+    index.commit(str(tmp_path / "up" / "a.txt"), str(tmp_path / "files" / "a.txt"))
+    monkeypatch.undo()
+    assert sorted(row[0] for row in index.snapshot()) == ["a.txt", "other.txt"]
+
+def ls_rows(ctrl, options=""):
+    ctrl.send_line(f"LS {options}".strip())
+    first = ctrl.recv_line()
+    if not first.startswith(protocol.OK):
+        return first
+    rows = recv_all(open_data_conn("127.0.0.1", reply_field(first, "PORT"))).decode().splitlines()
+    assert ctrl.recv_line().startswith(protocol.DONE)
+    return [r.split()[0] for r in rows]
+
+def test_ls_filter_sort_and_pages(server_addr, base_dir):
+    for i in range(7):
+        with open(os.path.join(base_dir, f"f{i}.{'csv' if i % 2 else 'txt'}"), "wb") as f:
+            f.write(b"x" * (10 - i))
+    with ControlConn(*server_addr) as ctrl:
+        assert sorted(ls_rows(ctrl, "*.csv")) == ["f1.csv", "f3.csv", "f5.csv"]
+        assert ls_rows(ctrl, "SORT name") == [f"f{i}.{'csv' if i % 2 else 'txt'}" for i in range(7)]
+        assert ls_rows(ctrl, "SORT size LIMIT 2") == ["f6.txt", "f5.csv"]
+        assert ls_rows(ctrl, "SORT size DESC LIMIT 3 PAGE 2") == ["f3.csv", "f4.txt", "f5.csv"]
+        assert ls_rows(ctrl, "*.txt SORT name LIMIT 2 PAGE 2") == ["f4.txt", "f6.txt"]
+        assert ls_rows(ctrl, "SORT color").startswith("501")
+
+class FlakySocket:
+    """Data socket wrapper that drops the connection after `budget` bytes."""
+
+    def __init__(self, sock, budget):
+        self.sock = sock
+        self.budget = budget
+
+    def recv(self, n):
+        if self.budget <= 0:
+            self.sock.close()
+            raise ConnectionResetError("injected drop")
+        chunk = self.sock.recv(min(n, self.budget))
+        self.budget -= len(chunk)
+        return chunk
+
+    def recv_into(self, buf, nbytes=0):
+        chunk = self.recv(nbytes or len(buf))
+        buf[:len(chunk)] = chunk
+        return len(chunk)
+
+    def sendall(self, data):
+        if len(data) > self.budget:
+            self.sock.sendall(data[:self.budget])
+            self.budget = 0
+            self.sock.close()
+            raise ConnectionResetError("injected drop")
+        self.budget -= len(data)
+        self.sock.sendall(data)
+
+    def close(self):
+        self.sock.close()
+
+def flaky_data_conns(monkeypatch, budgets):
+    """Make ftp_client's first data connections drop after the given byte budgets."""
+    budgets = list(budgets)
+
+    def opener(host, port):
+        ds = open_data_conn(host, port)
+        return FlakySocket(ds, budgets.pop(0)) if budgets else ds
+    monkeypatch.setattr(ftp_client, "open_data_conn", opener)
+
+def test_get_resumes_with_rest_after_drop(server_addr, base_dir, tmp_path, monkeypatch):
+    payload = os.urandom(50000)
+    with open(os.path.join(base_dir, "big.bin"), "wb") as f:
+        f.write(payload)
+    monkeypatch.chdir(tmp_path)
+    flaky_data_conns(monkeypatch, [12000, 20000])
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_get(ctrl, "big.bin", "127.0.0.1")
+    assert (tmp_path / "big.bin").read_bytes() == payload
+
+def test_upload_writer_preallocates_pipelines_and_truncates_short_uploads(tmp_path):
+    payload = os.urandom(1 << 20)
+    with open(tmp_path / "up.partial", "wb") as f:
+        writer = UploadWriter(f.fileno(), 0, len(payload), 64 * 1024, fsync="periodic", interval=256 * 1024)
+        assert os.fstat(f.fileno()).st_blocks * 512 >= len(payload)  # reserved before any write
+        for start in range(0, len(payload), 50000):
+            writer.write(payload[start:start + 50000])
+        assert writer.close() == len(payload)
+        writer.sync()
+    assert (tmp_path / "up.partial").read_bytes() == payload
+    assert writer.fsyncs == 3 + 1  # fdatasync once 256 KiB is unsynced (every 6 writes), then the commit fsync
+    with open(tmp_path / "short.partial", "wb") as f:
+        writer = UploadWriter(f.fileno(), 0, len(payload), 64 * 1024)
+        view = writer.buffer()
+        view[:1000] = payload[:1000]
+        writer.submit(1000)
+        writer.buffer()  # taken, never submitted
+        assert writer.close() == 1000
+    assert (tmp_path / "short.partial").read_bytes() == payload[:1000]  # REST resumes at 1000
+
+@pytest.mark.parametrize("fsync", ["none", "commit", "periodic"])
+def test_put_through_upload_writer_per_fsync_mode(server_addr, base_dir, monkeypatch, fsync):
+    monkeypatch.setattr(ftp_server, "FSYNC_MODE", fsync)
+    monkeypatch.setattr(ftp_server, "FSYNC_INTERVAL", 128 * 1024)
+    monkeypatch.setattr(ftp_server, "BUFFER_SIZE", 64 * 1024)  # several buffers: the writer thread runs
+    before = dict(ftp_server._upload_stats)
+    payload = os.urandom(600_000)
+    with ControlConn(*server_addr) as ctrl:
+        assert put_file(ctrl, "durable.bin", payload).startswith(protocol.DONE)
+        assert get_file(ctrl, "durable.bin") == payload
+    fsyncs = ftp_server._upload_stats["fsyncs"] - before["fsyncs"]
+    # periodic: fdatasyncs along the way (their count depends on the chunk sizes), then the commit fsync
+    assert fsyncs >= 2 if fsync == "periodic" else fsyncs == {"none": 0, "commit": 1}[fsync]
+    assert ftp_server._upload_stats["dir_fsyncs"] - before["dir_fsyncs"] == (fsync != "none")
+
+def test_every_commit_path_applies_the_fsync_policy(server_addr, base_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(ftp_server, "FSYNC_MODE", "commit")
+    src = tmp_path / "multi.bin"
+    src.write_bytes(os.urandom(2 * protocol.MIN_RANGE))
+    before = dict(ftp_server._upload_stats)
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_put_parallel(ctrl, str(src), "127.0.0.1", 2)
+        ftp_client.do_mput(ctrl, [str(src)], "127.0.0.1")
+    assert ftp_server._upload_stats["fsyncs"] - before["fsyncs"] == 2
+    assert ftp_server._upload_stats["dir_fsyncs"] - before["dir_fsyncs"] == 2
+
+def test_put_resumes_from_kept_partial(server_addr, base_dir, tmp_path, monkeypatch):
+    payload = os.urandom(50000)
+    src = tmp_path / "up.bin"
+    src.write_bytes(payload)
+    flaky_data_conns(monkeypatch, [16384])
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_put(ctrl, str(src), "127.0.0.1")
+        ctrl.send_line("SIZE up.bin PARTIAL")
+        assert ctrl.recv_line().startswith(protocol.ERR)  # committed, no partial left
+    with open(os.path.join(base_dir, "up.bin"), "rb") as f:
+        assert f.read() == payload
+
+def test_rest_beyond_end_is_rejected(server_addr, base_dir):
+    with open(os.path.join(base_dir, "s.txt"), "wb") as f:
+        f.write(b"abc")
+    with ControlConn(*server_addr) as ctrl:
+        ctrl.send_line("REST 10")
+        assert ctrl.recv_line().startswith(protocol.PENDING)
+        ctrl.send_line("GET s.txt")
+        assert ctrl.recv_line().startswith(protocol.ERR)
+        ctrl.send_line("SIZE s.txt")
+        assert ctrl.recv_line() == "213 3"
+
+def test_parallel_get_assembles_ranges_in_place(server_addr, base_dir, tmp_path, monkeypatch):
+    payload = os.urandom(3 * protocol.MIN_RANGE + 12345)
+    with open(os.path.join(base_dir, "wide.bin"), "wb") as f:
+        f.write(payload)
+    open(os.path.join(base_dir, "empty.bin"), "wb").close()
+    monkeypatch.chdir(tmp_path)
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_get_parallel(ctrl, "wide.bin", "127.0.0.1", 4)
+        ftp_client.do_get_parallel(ctrl, "empty.bin", "127.0.0.1", 4)
+    assert (tmp_path / "wide.bin").read_bytes() == payload
+    assert (tmp_path / "empty.bin").read_bytes() == b""
+
+def test_split_ranges_covers_file():
+    size = 10 * protocol.MIN_RANGE + 3
+    ranges = protocol.split_ranges(size, 4)
+    assert len(ranges) == 4
+    assert sum(length for _, length in ranges) == size
+    assert all(a[0] + a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert protocol.split_ranges(100, 8) == [(0, 100)]
+
+def test_parallel_put_commits_once_all_parts_arrive(server_addr, base_dir, tmp_path):
+    payload = os.urandom(3 * protocol.MIN_RANGE + 777)
+    src = tmp_path / "multi.bin"
+    src.write_bytes(payload)
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_put_parallel(ctrl, str(src), "127.0.0.1", 3)
+        assert get_file(ctrl, "multi.bin") == payload
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_names_of_work_directories_are_refused(server_addr, async_server_addr, base_dir, engine):
+    with ControlConn(*(server_addr if engine == "threads" else async_server_addr)) as ctrl:
+        for name in (".uploads", ".locks", ".objects", ".hidden"):
+            ctrl.send_line(f"PUT {name} SIZE 3")
+            assert ctrl.recv_line().startswith("550 Invalid file name")
+            ctrl.send_line(f"GET {name}")
+            assert ctrl.recv_line().startswith("550")
+        ctrl.send_line("NOOP")
+        assert ctrl.recv_line().startswith("200")
+    assert os.path.isdir(ftp_server.UPLOAD_DIR)
+
+def test_bad_put_sizes_are_refused_without_leaking_ports(server_addr, base_dir):
+    leased = ftp_server._port_pool.stats()["leased"]
+    with ControlConn(*server_addr) as ctrl:
+        for size in ("abc", "-1", str(1 << 63)):
+            ctrl.send_line(f"PUT z SIZE {size}")
+            assert ctrl.recv_line().startswith("501")
+        ctrl.send_line(f"PUT y SIZE {(1 << 63) - 1} STREAMS 2")
+        assert ctrl.recv_line()[:3] in ("550", "552")
+        ctrl.send_line("NOOP")
+        assert ctrl.recv_line().startswith("200")
+    assert ftp_server._port_pool.stats()["leased"] == leased
+    assert not os.path.exists(ftp_server.partial_upload_path("y"))
+
+def test_parallel_put_respects_upload_lock(server_addr, base_dir):
+    size = 2 * protocol.MIN_RANGE
+    with ControlConn(*server_addr) as a, ControlConn(*server_addr) as b:
+        a.send_line(f"PUT held.bin SIZE {size} STREAMS 2")
+        assert a.recv_line().startswith(protocol.OK)
+        b.send_line(f"PUT held.bin SIZE {size} STREAMS 2")
+        assert b.recv_line() == "550 File is currently being uploaded"
+
+def test_mput_then_mget_glob_over_one_data_connection(server_addr, base_dir, tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    src.mkdir()
+    payloads = {f"f{i}.dat": os.urandom(i * 1000) for i in range(5)}
+    payloads["large.dat"] = os.urandom(3 * protocol.BATCH_COALESCE + 5)
+    for name, data in payloads.items():
+        (src / name).write_bytes(data)
+    (src / "skip.txt").write_bytes(b"not matched")
+    monkeypatch.chdir(tmp_path)
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_mput(ctrl, sorted(str(p) for p in src.glob("*.dat")), "127.0.0.1")
+        ftp_client.do_mget(ctrl, ["*.dat", "missing.bin"], "127.0.0.1")
+    for name, data in payloads.items():
+        assert (tmp_path / name).read_bytes() == data
+    assert not os.path.exists(os.path.join(base_dir, "skip.txt"))
+
+def test_block_mode_reuses_one_data_connection(server_addr, base_dir, tmp_path, monkeypatch, capsys):
+    payload = os.urandom(3 * BUFFER_SIZE + 5)
+    src = tmp_path / "b.bin"
+    src.write_bytes(payload)
+    out = tmp_path / "out"
+    out.mkdir()
+    monkeypatch.chdir(out)
+    with ControlConn(*server_addr) as ctrl:
+        assert ctrl.enable_block_mode("127.0.0.1")
+        opened = []
+        monkeypatch.setattr(ftp_client, "open_data_conn", lambda *a: opened.append(a))
+        ftp_client.do_put(ctrl, str(src), "127.0.0.1")
+        ftp_client.do_ls(ctrl, "127.0.0.1")
+        ftp_client.do_get(ctrl, "b.bin", "127.0.0.1")
+        ftp_client.do_mget(ctrl, ["b.*"], "127.0.0.1")
+        assert opened == []
+        assert ctrl.disable_block_mode().startswith(protocol.OK)
+        assert ctrl.data is None
+    assert (out / "b.bin").read_bytes() == payload
+    assert "b.bin" in capsys.readouterr().out
+
+def test_block_channel_frames_and_end_marker():
+    a, b = socket.socketpair()
+    with a, b:
+        for payloads in ([b"hello ", b"world"], [b"skipped"], [b"third"]):
+            writer = BlockChannel(a)
+            for p in payloads:
+                writer.sendall(p)
+            writer.close()
+        assert BlockChannel(b).makefile("rb").read() == b"hello world"
+        BlockChannel(b).close()  # unread transfer is skipped up to its end marker
+        assert BlockChannel(b).recv(100) == b"third"
+
+def test_large_sends_go_out_in_slices_bounded_by_the_socket_timeout():
+    class Recorder:
+        def __init__(self):
+            self.sizes, self.data = [], bytearray()
+
+        def sendall(self, data, flags=0):
+            self.sizes.append(len(data))
+            self.data += data
+
+    payload = os.urandom(3 * integrity.READ_CHUNK + 5)
+    sock = Recorder()
+    assert ftp_server.send_mapped(sock, memoryview(payload), 5, len(payload) - 5) == len(payload) - 5
+    assert bytes(sock.data) == payload[5:] and max(sock.sizes) == integrity.READ_CHUNK
+    sock = Recorder()
+    BlockChannel(sock).sendall(payload)
+    assert bytes(sock.data[4:]) == payload and max(sock.sizes) <= integrity.READ_CHUNK
+
+def test_block_mode_falls_back_when_client_drops_channel(server_addr, base_dir):
+    with open(os.path.join(base_dir, "f.txt"), "wb") as f:
+        f.write(b"payload")
+    with ControlConn(*server_addr) as ctrl:
+        assert ctrl.enable_block_mode("127.0.0.1")
+        ctrl.close_data()
+        time.sleep(0.05)
+        assert get_file(ctrl, "f.txt") == b"payload"  # reply carries a PORT again
+
+@pytest.mark.parametrize("algo", ["zlib", "lzma"])
+def test_mode_z_compresses_text_and_skips_random(server_addr, base_dir, tmp_path, monkeypatch, algo):
+    text = b"".join(b"2024-11-%02d,%d.5,65,San Francisco\n" % (i % 30 + 1, i % 90) for i in range(20000))
+    noise = os.urandom(300000)
+    (tmp_path / "t.csv").write_bytes(text)
+    (tmp_path / "n.bin").write_bytes(noise)
+    out = tmp_path / "out"
+    out.mkdir()
+    with ControlConn(*server_addr) as ctrl:
+        assert ctrl.enable_compression(algo, 1).startswith(protocol.OK)
+        replies = []
+        recv_line = ctrl.recv_line
+        monkeypatch.setattr(ctrl, "recv_line", lambda: replies.append(recv_line()) or replies[-1])
+        ftp_client.do_put(ctrl, str(tmp_path / "t.csv"), "127.0.0.1")
+        ftp_client.do_put(ctrl, str(tmp_path / "n.bin"), "127.0.0.1")
+        monkeypatch.chdir(out)
+        ftp_client.do_get(ctrl, "t.csv", "127.0.0.1")
+        ftp_client.do_get(ctrl, "n.bin", "127.0.0.1")
+    assert (out / "t.csv").read_bytes() == text
+    assert (out / "n.bin").read_bytes() == noise
+    gets = [r for r in replies if " SIZE " in r]
+    assert gets[0].endswith(f"COMPRESS {algo}") and "COMPRESS" not in gets[1]
+
+def test_compressed_put_larger_than_size_is_refused_early(server_addr, base_dir):
+    bomb = lzma.compress(bytes(64 << 20))
+    with ControlConn(*server_addr) as ctrl:
+        ctrl.send_line("PUT x SIZE 10 COMPRESS lzma")
+        first = ctrl.recv_line()
+        ds = open_data_conn("127.0.0.1", reply_field(first, "PORT"))
+        ds.sendall(bomb)
+        ds.close()
+        assert ctrl.recv_line().startswith("552")
+    assert not os.path.exists(os.path.join(base_dir, "x"))
+    assert not os.path.exists(ftp_server.partial_upload_path("x"))
+
+def test_iter_decompressed_bounds_each_piece_and_the_total():
+    class Source:
+        def __init__(self, data):
+            self.data = data
+        def recv(self, n):
+            chunk, self.data = self.data[:n], self.data[n:]
+            return chunk
+    raw = bytes(5 << 20)
+    pieces = list(compression.iter_decompressed(Source(zlib.compress(raw)), "zlib", len(raw), 4096))
+    assert b"".join(pieces) == raw and max(map(len, pieces)) <= 4096
+    pieces = list(compression.iter_decompressed(Source(zlib.compress(raw)), "zlib", 1000, 4096))
+    assert sum(map(len, pieces)) == 1001
+
+def test_cas_stores_duplicate_content_once(server_addr, base_dir, tmp_path, monkeypatch):
+    store = ObjectStore(os.path.join(base_dir, ".objects"), ftp_server._dir_index)
+    monkeypatch.setattr(ftp_server, "_store", store)
+    payload = os.urandom(20000)
+    for name in ("a.bin", "b.bin"):
+        (tmp_path / name).write_bytes(payload)
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_put(ctrl, str(tmp_path / "a.bin"), "127.0.0.1")
+        sent = []
+        monkeypatch.setattr(ftp_client, "put_once", lambda *a: sent.append(a))
+        ftp_client.do_put(ctrl, str(tmp_path / "b.bin"), "127.0.0.1")  # CHECK hit -> LINK
+        assert sent == []
+        assert get_file(ctrl, "b.bin") == payload
+        assert put_file(ctrl, "a.bin", b"new content").startswith(protocol.DONE)
+    digest = store.digest_of(os.path.join(base_dir, "b.bin"))
+    assert sorted(os.listdir(store.path)) == sorted([digest, store.digest_of(os.path.join(base_dir, "a.bin"))])
+    assert os.stat(store.object_path(digest)).st_nlink == 2  # object + b.bin; a.bin moved on
+
+def test_cas_uploads_are_hashed_while_received(server_addr, async_server_addr, base_dir, tmp_path, monkeypatch):
+    store = ObjectStore(os.path.join(base_dir, ".objects"), ftp_server._dir_index)
+    monkeypatch.setattr(ftp_server, "_store", store)
+    hashed = []
+    real_sha256_file = integrity.sha256_file
+    monkeypatch.setattr(integrity, "sha256_file", lambda f: hashed.append(f) or real_sha256_file(f))
+    payloads = {name: os.urandom(30000) for name in ("t.bin", "a.bin", "m.dat", "p.bin")}
+    with ControlConn(*server_addr) as ctrl:
+        assert put_file(ctrl, "t.bin", payloads["t.bin"]).startswith(protocol.DONE)
+        (tmp_path / "m.dat").write_bytes(payloads["m.dat"])
+        ftp_client.do_mput(ctrl, [str(tmp_path / "m.dat")], "127.0.0.1")
+    with ControlConn(*async_server_addr) as ctrl:
+        assert put_file(ctrl, "a.bin", payloads["a.bin"]).startswith(protocol.DONE)
+    assert hashed == []  # every commit got its sha256 from the receive loop
+    for name in ("t.bin", "m.dat", "a.bin"):
+        assert store.digest_of(os.path.join(base_dir, name)) == hashlib.sha256(payloads[name]).hexdigest()
+
+    # STREAMS ranges arrive out of order: the name is stored plain and hashed into the store afterwards.
+    payloads["p.bin"] = payloads["t.bin"] + os.urandom(3 * protocol.MIN_RANGE)
+    (tmp_path / "p.bin").write_bytes(payloads["p.bin"])
+    (tmp_path / "t2.bin").write_bytes(payloads["t.bin"])
+    with ControlConn(*server_addr) as ctrl:
+        ctrl.cas = False  # upload even known content, instead of the client's CHECK + LINK
+        ftp_client.do_put_parallel(ctrl, str(tmp_path / "p.bin"), "127.0.0.1", 3)
+        ftp_client.do_put_parallel(ctrl, str(tmp_path / "t2.bin"), "127.0.0.1", 2)  # same content as t.bin
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not all(
+                store.digest_of(os.path.join(base_dir, name)) for name in ("p.bin", "t2.bin")):
+            time.sleep(0.01)
+        assert get_file(ctrl, "p.bin") == payloads["p.bin"]
+    assert len(hashed) == 2
+    assert store.digest_of(os.path.join(base_dir, "p.bin")) == hashlib.sha256(payloads["p.bin"]).hexdigest()
+    t_digest = store.digest_of(os.path.join(base_dir, "t.bin"))
+    assert store.digest_of(os.path.join(base_dir, "t2.bin")) == t_digest
+    assert store.dedup_hits == 1 and os.stat(store.object_path(t_digest)).st_nlink == 3
+
+def test_check_without_cas_is_not_implemented(server_addr):
+    with ControlConn(*server_addr) as ctrl:
+        ctrl.send_line("CHECK " + "0" * 64)
+        assert ctrl.recv_line().startswith("502")
+
+def test_put_to_plain_server_never_hashes_the_file(server_addr, base_dir, tmp_path, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(integrity, "sha256_file", lambda f: hashed.append(f))
+    (tmp_path / "a.bin").write_bytes(b"abc" * 1000)
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_put(ctrl, str(tmp_path / "a.bin"), "127.0.0.1")
+        ftp_client.do_put(ctrl, str(tmp_path / "a.bin"), "127.0.0.1")
+        assert ctrl.cas is False
+    assert hashed == []
+    assert os.path.getsize(os.path.join(base_dir, "a.bin")) == 3000
+
+def test_sha256_file_matches_hashlib(tmp_path):
+    data = os.urandom(integrity.READ_CHUNK + 123)
+    (tmp_path / "f").write_bytes(data)
+    with open(tmp_path / "f", "rb") as f:
+        assert integrity.sha256_file(f).hexdigest() == hashlib.sha256(data).hexdigest()
+
+@pytest.mark.parametrize("block_mode", [False, True])
+def test_sync_sends_only_changed_blocks(server_addr, base_dir, tmp_path, capsys, block_mode):
+    old = os.urandom(300000)
+    with open(os.path.join(base_dir, "big.bin"), "wb") as f:
+        f.write(old)
+    new = old[:1000] + b"inserted" + old[1000:150000] + os.urandom(500) + old[150500:]
+    (tmp_path / "big.bin").write_bytes(new)
+    with ControlConn(*server_addr) as ctrl:
+        if block_mode:
+            assert ctrl.enable_block_mode("127.0.0.1")
+        ftp_client.do_sync(ctrl, str(tmp_path / "big.bin"), "127.0.0.1")
+        ftp_client.do_sync(ctrl, str(tmp_path / "big.bin"), "127.0.0.1")  # unchanged: nothing literal
+    out = capsys.readouterr().out
+    literal = [int(part.split()[0]) for part in out.split("File synced (")[1:]]
+    assert len(literal) == 2, out
+    assert 0 < literal[0] < 4 * ftp_server.delta.block_size_for(len(old))
+    assert literal[1] == 0
+    with open(os.path.join(base_dir, "big.bin"), "rb") as f:
+        assert f.read() == new
+
+def test_sync_verifies_without_rereading_and_client_survives_a_late_reply(server_addr, base_dir, tmp_path,
+                                                                          monkeypatch, capsys):
+    old = os.urandom(200000)
+    with open(os.path.join(base_dir, "s.bin"), "wb") as f:
+        f.write(old)
+    new = old[:5000] + os.urandom(100) + old[5000:]
+    (tmp_path / "s.bin").write_bytes(new)
+    read_back = []
+    real_sha256_file = integrity.sha256_file
+    monkeypatch.setattr(integrity, "sha256_file",
+                        lambda f: read_back.append(f.name) or real_sha256_file(f))
+    real_commit = ftp_server.commit_upload
+
+    def slow_commit(*args, **kwargs):
+        time.sleep(0.5)
+        return real_commit(*args, **kwargs)
+
+    monkeypatch.setattr(ftp_server, "commit_upload", slow_commit)
+    with ControlConn(*server_addr) as ctrl:
+        ctrl.sock.settimeout(0.2)  # shorter than the commit: the 226 comes late
+        ftp_client.do_sync(ctrl, str(tmp_path / "s.bin"), "127.0.0.1")
+        assert "[ERR] SYNC control error" in capsys.readouterr().out
+        ctrl.send_line("NOOP")  # a fresh session, not out of step by the late 226
+        assert ctrl.recv_line().startswith("200")
+    assert read_back == [str(tmp_path / "s.bin")]  # only the client hashed a whole file
+    deadline = time.monotonic() + 5
+    while os.path.getsize(os.path.join(base_dir, "s.bin")) != len(new) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with open(os.path.join(base_dir, "s.bin"), "rb") as f:
+        assert f.read() == new
+
+def test_sync_of_new_file_falls_back_to_put(server_addr, base_dir, tmp_path):
+    (tmp_path / "fresh.bin").write_bytes(b"hello")
+    with ControlConn(*server_addr) as ctrl:
+        ftp_client.do_sync(ctrl, str(tmp_path / "fresh.bin"), "127.0.0.1")
+    with open(os.path.join(base_dir, "fresh.bin"), "rb") as f:
+        assert f.read() == b"hello"
+
+@pytest.mark.parametrize("mode", ["sendfile", "copy", "mmap"])
+def test_digest_reported_on_226_and_cached(server_addr, base_dir, tmp_path, monkeypatch, capsys, mode):
+    monkeypatch.setattr(ftp_server, "GET_MODE", mode)
+    cache = DigestCache(16)
+    monkeypatch.setattr(ftp_server, "_digest_cache", cache)
+    monkeypatch.chdir(tmp_path)
+    payload = os.urandom(3 * 1024 * 1024 + 5)
+    with open(os.path.join(base_dir, "sum.bin"), "wb") as f:
+        f.write(payload)
+    with ControlConn(*server_addr) as ctrl:
+        assert ctrl.enable_digest("sha256").startswith(protocol.OK)
+        ctrl.send_line("REST 1000")
+        assert ctrl.recv_line().startswith(protocol.PENDING)
+        get_file(ctrl, "sum.bin")  # resumed GET still reports the whole-file digest
+        ftp_client.do_get(ctrl, "sum.bin", "127.0.0.1")
+        assert (cache.hits, cache.misses) == (1, 1)
+        ctrl.send_line("GET sum.bin")
+        first = ctrl.recv_line()
+        recv_all(open_data_conn("127.0.0.1", reply_field(first, "PORT")), len(payload))
+        assert ctrl.recv_line().split()[-2:] == ["sha256", hashlib.sha256(payload).hexdigest()]
+        assert ctrl.enable_digest("crc32").startswith(protocol.OK)
+        ftp_client.do_put(ctrl, "sum.bin", "127.0.0.1")
+        assert ctrl.enable_digest("md4").startswith("501")
+    assert "sha256 verified" in capsys.readouterr().out
+    assert cache.get("sum.bin", os.stat(os.path.join(base_dir, "sum.bin")), "crc32") == f"{zlib.crc32(payload):08x}"
+
+def test_digest_mismatch_refetches_from_scratch(server_addr, base_dir, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with open(os.path.join(base_dir, "bad.bin"), "wb") as f:
+        f.write(b"x" * 5000)
+    cache = DigestCache(16)
+    monkeypatch.setattr(ftp_server, "_digest_cache", cache)
+    st = os.stat(os.path.join(base_dir, "bad.bin"))
+    cache.put("bad.bin", st, "md5", "0" * 32)  # stale digest: every attempt looks corrupted
+    with ControlConn(*server_addr) as ctrl:
+        ctrl.enable_digest("md5")
+        ftp_client.do_get(ctrl, "bad.bin", "127.0.0.1")
+    out = capsys.readouterr().out
+    assert "Resuming 'bad.bin' at byte 0" in out and "Digest mismatch" in out
+
+@pytest.mark.parametrize("fair", [True, False])
+def test_fair_scheduler_lets_least_served_transfer_go_first(fair):
+    sched = FairScheduler(1024 * 1024, 64 * 1024, fair)
+    sched.bucket.tokens = 0
+    big, small = Flow(), Flow()
+    big.served = 100 * 1024 * 1024  # a long-running download
+    order = []
+
+    def take(flow, label):
+        sched.grant(flow, 64 * 1024)
+        order.append(label)
+
+    first = threading.Thread(target=take, args=(big, "big"))
+    first.start()
+    time.sleep(0.01)
+    take(small, "small")  # queued later, but has moved nothing yet
+    first.join()
+    assert order == (["small", "big"] if fair else ["big", "small"])
+
+def test_session_rate_limit_paces_transfers(server_addr, base_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(ftp_server, "SESSION_RATE", 1024 * 1024)
+    monkeypatch.setattr(ftp_server, "GLOBAL_RATE", 4 * 1024 * 1024)
+    monkeypatch.setattr(ftp_server, "_egress", ftp_server.make_schedulers()[0])
+    monkeypatch.chdir(tmp_path)
+    payload = os.urandom(400 * 1024)
+    (tmp_path / "a.bin").write_bytes(payload)
+    with ControlConn(*server_addr) as ctrl:
+        t0 = time.perf_counter()
+        assert put_file(ctrl, "paced.bin", payload).startswith(protocol.DONE)
+        assert get_file(ctrl, "paced.bin") == payload
+        elapsed = time.perf_counter() - t0
+        assert ctrl.enable_block_mode("127.0.0.1")
+        ftp_client.do_mput(ctrl, ["a.bin"], "127.0.0.1")
+        os.remove("a.bin")
+        ftp_client.do_mget(ctrl, ["a.bin"], "127.0.0.1")
+    # 2 x 400 KiB at 1 MiB/s, minus the two initial bursts of one chunk each.
+    assert elapsed > 0.5
+    assert (tmp_path / "a.bin").read_bytes() == payload
+    assert ftp_server._egress.granted >= 2 * len(payload)
+
+def test_stat_and_http_endpoint_report_metrics(server_addr, base_dir, monkeypatch):
+    metrics = Metrics()
+    metrics.register("port_pool", ftp_server._port_pool.stats)
+    metrics.register("file_locks", lambda: dict(ftp_server._lock_stats))
+    monkeypatch.setattr(ftp_server, "_metrics", metrics)
+    payload = os.urandom(50000)
+    with ControlConn(*server_addr) as ctrl:
+        assert put_file(ctrl, "m.bin", payload).startswith(protocol.DONE)
+        assert get_file(ctrl, "m.bin") == payload
+        with ftp_server._file_locks.try_acquire("m.bin"):
+            ctrl.send_line("PUT m.bin SIZE 1")
+            assert ctrl.recv_line().startswith("550")
+        text = ftp_client.fetch_stats(ctrl, "127.0.0.1")
+    values = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+    assert values['ftp_command_duration_seconds_count{command="PUT"}'] == "2"
+    assert values['ftp_command_duration_seconds_count{command="GET"}'] == "1"
+    assert values['ftp_data_bytes_total{command="GET",direction="sent"}'] == str(len(payload))
+    assert values['ftp_data_bytes_total{command="PUT",direction="received"}'] == str(len(payload))
+    assert int(values["ftp_file_locks_contended"]) >= 1
+    assert int(values["ftp_port_pool_leased"]) >= 1  # at least the STAT transfer itself
+    httpd = serve_http(metrics, "127.0.0.1", 0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{httpd.server_address[1]}/metrics") as resp:
+            assert b'ftp_command_duration_seconds_bucket{command="GET",le="+Inf"} 1' in resp.read()
+    finally:
+        httpd.shutdown()
+
+def test_load_harness_mixed_clients_without_errors(server_addr, base_dir):
+    # The bench_load.py "stress" mix at test scale: concurrent GET/PUT/LS plus expected 550s.
+    def make():
+        return bench_load.Workload({"get": 3, "put": 3, "ls": 2, "miss": 1}, "choice:1400,300K", 8, 1.0, 6, 7, 1 << 20)
+
+    workload = make()
+    bench_load.fill_corpus(workload, base_dir=base_dir)
+    args = argparse.Namespace(timeout=10, think_ms=0)
+    blob = memoryview(os.urandom(1 << 20))
+    run = bench_load.run_round(server_addr, workload, 5, blob, args)
+    assert run["errors"] == {}, run["error_samples"]
+    assert run["ops"] == 5 * 6
+    assert run["latency_ms"]["connect"]["n"] == 5
+    assert run["bytes"]["get"] == sum(
+        os.path.getsize(os.path.join(base_dir, name))
+        for i in range(5) for op, name in workload.plan(5, i) if op == "get"
+    )
+    assert make().plan(5, 3) == workload.plan(5, 3)  # same seed, same operations
+
+def test_line_reader_keeps_leftovers_and_skips_overlong_lines():
+    a, b = socket.socketpair()
+    with a, b:
+        reader = LineReader(b, max_line=16, recv_size=7)
+        a.sendall(b"NOOP\nSIZE x\r\n" + b"y" * 40 + b"\nREST 5\nEXI")
+        assert reader.readline() == b"NOOP"
+        assert reader.readline() == b"SIZE x"
+        with pytest.raises(LineTooLong):
+            reader.readline()
+        assert reader.readline() == b"REST 5"  # the rest of the long line was dropped
+        a.sendall(b"T")
+        a.shutdown(socket.SHUT_WR)
+        assert reader.readline() == b"EXIT"
+        assert reader.readline() is None
+
+def test_pipelined_commands_all_get_replies_in_order(server_addr, base_dir):
+    with open(os.path.join(base_dir, "p.txt"), "wb") as f:
+        f.write(b"12345")
+    with ControlConn(*server_addr) as ctrl:
+        ctrl.send_lines(["NOOP", "SIZE p.txt", "REST 2", "SIZE missing.txt", "X" * (ftp_server.MAX_LINE + 10), "NOOP"])
+        assert ctrl.recv_line().startswith("200 NOOP")
+        assert ctrl.recv_line() == "213 5"
+        assert ctrl.recv_line().startswith("350")
+        assert ctrl.recv_line().startswith("550")
+        assert ctrl.recv_line().startswith("500 Command line too long")
+        assert ctrl.recv_line().startswith("200 NOOP")
+        assert get_file(ctrl, "p.txt") == b"12345"  # the session is still in step
+
+def test_api_session_returns_structured_results_and_streams_file_objects(server_addr, base_dir, tmp_path):
+    payload = os.urandom(3 * BUFFER_SIZE + 11)
+    (tmp_path / "src.bin").write_bytes(payload)
+    with api.Session(*server_addr, digest="sha256") as s:
+        up = s.put("api.bin", str(tmp_path / "src.bin"))
+        assert (up.name, up.size, up.digest) == ("api.bin", len(payload), hashlib.sha256(payload).hexdigest())
+        assert s.put("small.txt", io.BytesIO(b"hello world")).size == 11
+        out = io.BytesIO()
+        assert s.get("api.bin", out).digest == up.digest
+        assert out.getvalue() == payload
+        s.get("small.txt", str(tmp_path / "small.txt"))
+        assert (tmp_path / "small.txt").read_bytes() == b"hello world"
+        assert [(e.name, e.size) for e in s.ls(sort="size")] == [("small.txt", 11), ("api.bin", len(payload))]
+        assert [e.name for e in s.ls("*.txt")] == ["small.txt"]
+        with pytest.raises(api.FTPError) as err:
+            s.get("missing.bin", io.BytesIO())
+        assert err.value.code == 550 and not s.broken  # the session is still in step
+        assert s.noop().startswith("200")
+
+def test_api_pool_reuses_warm_sessions_and_drops_broken_ones(server_addr, base_dir):
+    with open(os.path.join(base_dir, "p.txt"), "wb") as f:
+        f.write(b"pooled")
+    with api.SessionPool(*server_addr, size=4) as pool:
+        pool.warm(2)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.get("p.txt", io.BytesIO()).size))
+                   for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [6] * 20
+        assert pool.stats()["created"] <= 4
+        with pool.session() as s:
+            s.ctrl.sock.close()  # the control connection dies under the session
+            with pytest.raises(OSError):
+                s.noop()
+        stats = pool.stats()
+        assert stats["discarded"] == 1 and stats["reused"] >= 20 - 4
+
+def test_api_async_pool_fans_out_many_operations(server_addr, base_dir):
+    for i in range(20):
+        with open(os.path.join(base_dir, f"a{i}.txt"), "wb") as f:
+            f.write(f"file {i}".encode())
+
+    async def fan_out():
+        async with api.AsyncSessionPool(*server_addr, size=8, digest="crc32") as pool:
+            outs = [io.BytesIO() for _ in range(200)]
+            done = await asyncio.gather(*(pool.get(f"a{i % 20}.txt", out) for i, out in enumerate(outs)))
+            up = await pool.put("async_up.bin", io.BytesIO(b"x" * 100000))
+            names = [e.name for e in await pool.ls("a1*.txt")]
+            with pytest.raises(api.FTPError):
+                await pool.get("missing.bin", io.BytesIO())
+            return outs, done, up, names, pool.stats()
+
+    outs, done, up, names, stats = asyncio.run(fan_out())
+    assert [o.getvalue() for o in outs] == [f"file {i % 20}".encode() for i in range(200)]
+    assert all(t.digest for t in done) and up.size == 100000
+    assert sorted(names) == ["a1.txt"] + [f"a1{i}.txt" for i in range(10)]
+    assert stats["created"] <= 8
+
+def test_api_failed_get_keeps_existing_local_file_and_async_waits_are_bounded(server_addr, base_dir, tmp_path,
+                                                                               monkeypatch):
+    keep = tmp_path / "keep.bin"
+    keep.write_bytes(b"local copy")
+    with api.Session(*server_addr) as s:
+        with pytest.raises(api.FTPError):
+            s.get("missing.bin", str(keep))
+
+    async def async_get():
+        async with api.AsyncSession(*server_addr) as s:
+            with pytest.raises(api.FTPError):
+                await s.get("missing.bin", str(keep))
+
+    asyncio.run(async_get())
+    assert keep.read_bytes() == b"local copy"
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(1)  # accepts the handshake but never sends the 220 banner
+    monkeypatch.setattr(api, "TIMEOUT", 0.2)
+    t0 = time.monotonic()
+    with silent, pytest.raises(asyncio.TimeoutError):
+        asyncio.run(api.AsyncSession(*silent.getsockname()).connect())
+    assert time.monotonic() - t0 < 2